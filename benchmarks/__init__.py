@@ -0,0 +1,2 @@
+"""Benchmark suite for Lotus bot: data generator, runner and result comparison"""
+from __future__ import annotations
@@ -0,0 +1,75 @@
+"""
+Module for comparing two benchmark result files
+
+    python -m benchmarks.compare BASE.json NEW.json [--threshold 1.2]
+
+Prints median times of measurements present in both files and their ratio,
+exits with 1 when some measurement got slower than threshold times.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from benchmarks.run import RESULTS_FORMAT
+
+THRESHOLD = 1.2
+
+# Заміри швидші за мілісекунду порівнюються з допуском на шум таймера
+NOISE = 0.001
+
+Key = Tuple[str, str, str]
+
+
+def load(path: str) -> Dict[Key, dict]:
+    """Читає файл результатів: (розмір, група, назва) -> результат"""
+    with open(path, encoding="utf-8") as f:
+        results = json.load(f)
+    if results.get("format") != RESULTS_FORMAT:
+        raise ValueError(f"{path}: unsupported results format {results.get('format')}")
+    return {(r["size"], r["group"], r["name"]): r for r in results["results"]}
+
+
+def compare(base: Dict[Key, dict], new: Dict[Key, dict], threshold: float = THRESHOLD) -> List[Tuple[Key, float, float, bool]]:
+    """Повертає (ключ, медіана до, медіана після, чи це регресія) для спільних замірів"""
+    rows = []
+    for key, result in new.items():
+        if key not in base:
+            continue
+        before, after = base[key]["median"], result["median"]
+        regression = after > max(before * threshold, before + NOISE)
+        rows.append((key, before, after, regression))
+    return rows
+
+
+def main(argv: List[str] | None = None):
+    """Entry point for comparing benchmark results"""
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare", description="Compare two Lotus benchmark result files")
+    parser.add_argument("base", help="results of the baseline version")
+    parser.add_argument("new", help="results of the version under test")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help=f"slowdown ratio reported as regression (default: {THRESHOLD})")
+    options = parser.parse_args(argv)
+
+    base, new = load(options.base), load(options.new)
+    rows = compare(base, new, options.threshold)
+    for (size, group, name), before, after, regression in rows:
+        ratio = after / before if before else float("inf")
+        mark = "  REGRESSION" if regression else ""
+        print(f"{size:>5} {group:<20} {name:<50} {before * 1000:>10.3f} {after * 1000:>10.3f} ms {ratio:>6.2f}x{mark}")
+    for size, group, name in sorted(new.keys() - base.keys()):
+        print(f"{size:>5} {group:<20} {name:<50} new")
+    for size, group, name in sorted(base.keys() - new.keys()):
+        print(f"{size:>5} {group:<20} {name:<50} removed")
+
+    regressions = sum(regression for *_, regression in rows)
+    if regressions:
+        print(f"{regressions} regression(s) slower than {options.threshold}x", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
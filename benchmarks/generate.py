@@ -0,0 +1,202 @@
+"""Module for deterministic generation of benchmark contacts and notes"""
+from __future__ import annotations
+
+import random
+from collections.abc import Iterator
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from typing import List
+
+from lotus_bot.contacts import Address
+from lotus_bot.contacts import Birthday
+from lotus_bot.contacts import Email
+from lotus_bot.contacts import Phone
+from lotus_bot.contacts import Record
+from lotus_bot.notes import NoteRecord
+
+SEED = 20250601
+
+# Імена та прізвища: (кирилицею, транслітом для email)
+FIRST_NAMES = [
+    ("Олександр", "oleksandr"),
+    ("Олена", "olena"),
+    ("Андрій", "andrii"),
+    ("Анна", "anna"),
+    ("Іван", "ivan"),
+    ("Ірина", "iryna"),
+    ("Дмитро", "dmytro"),
+    ("Наталія", "nataliia"),
+    ("Сергій", "serhii"),
+    ("Оксана", "oksana"),
+    ("Михайло", "mykhailo"),
+    ("Юлія", "yuliia"),
+    ("Юрій", "yurii"),
+    ("Тетяна", "tetiana"),
+    ("Василь", "vasyl"),
+    ("Марія", "mariia"),
+    ("Богдан", "bohdan"),
+    ("Катерина", "kateryna"),
+    ("Тарас", "taras"),
+    ("Валерія", "valeriia"),
+    ("Максим", "maksym"),
+    ("Софія", "sofiia"),
+    ("Петро", "petro"),
+    ("Людмила", "liudmyla"),
+    ("Ілля", "illia"),
+    ("Галина", "halyna"),
+    ("Віктор", "viktor"),
+    ("Світлана", "svitlana"),
+    ("Роман", "roman"),
+    ("Дарина", "daryna"),
+]
+
+LAST_NAMES = [
+    ("Шевченко", "shevchenko"),
+    ("Коваленко", "kovalenko"),
+    ("Бондаренко", "bondarenko"),
+    ("Ткаченко", "tkachenko"),
+    ("Кравченко", "kravchenko"),
+    ("Олійник", "oliinyk"),
+    ("Шевчук", "shevchuk"),
+    ("Коваль", "koval"),
+    ("Поліщук", "polishchuk"),
+    ("Бойко", "boiko"),
+    ("Мельник", "melnyk"),
+    ("Лисенко", "lysenko"),
+    ("Савченко", "savchenko"),
+    ("Руденко", "rudenko"),
+    ("Мороз", "moroz"),
+    ("Марченко", "marchenko"),
+    ("Павленко", "pavlenko"),
+    ("Харченко", "kharchenko"),
+    ("Гончаренко", "honcharenko"),
+    ("Левченко", "levchenko"),
+    ("Карпенко", "karpenko"),
+    ("Кузьменко", "kuzmenko"),
+    ("Климченко", "klymchenko"),
+    ("Приходько", "prykhodko"),
+    ("Волошина", "voloshyna"),
+    ("Павлов", "pavlov"),
+    ("Гаврилюк", "havryliuk"),
+    ("Романенко", "romanenko"),
+    ("Савчук", "savchuk"),
+    ("Ярошенко", "yaroshenko"),
+]
+
+# Коди мобільних операторів України
+OPERATOR_CODES = ["50", "66", "95", "99", "67", "68", "96", "97", "98", "63", "73", "93"]
+
+EMAIL_DOMAINS = ["gmail.com", "ukr.net", "i.ua", "meta.ua", "outlook.com", "proton.me"]
+
+CITIES = ["Київ", "Львів", "Харків", "Одеса", "Дніпро", "Запоріжжя", "Вінниця", "Полтава", "Чернігів", "Ужгород"]
+
+STREETS = ["Шевченка", "Франка", "Лесі Українки", "Грушевського", "Хрещатик", "Соборна", "Незалежності", "Садова"]
+
+# Теги нотаток, частота спадає за законом Ципфа
+TAGS = [
+    "робота",
+    "дім",
+    "покупки",
+    "ідеї",
+    "навчання",
+    "python",
+    "зустріч",
+    "книги",
+    "подорожі",
+    "здоров'я",
+    "фінанси",
+    "рецепти",
+    "спорт",
+    "фільми",
+    "діти",
+    "авто",
+    "ремонт",
+    "музика",
+    "проєкт",
+    "терміново",
+]
+
+WORDS = (
+    "зустріч проєкт завдання купити молоко хліб подзвонити лікар звіт квартал "
+    "бюджет ідея стаття книга прочитати розділ тест код python функція помилка "
+    "виправити реліз команда відпустка квиток потяг Львів Київ море гори рецепт "
+    "борщ вареники сир кава чай тренування біг басейн ранок вечір неділя понеділок "
+    "платіж рахунок банк картка нагадування подарунок день народження мама тато "
+    "друзі кіно концерт музика гітара урок англійська слово граматика документ "
+    "договір підписати паспорт ремонт кухня фарба плитка майстер машина сервіс "
+    "шини бензин дача город помідори полити квіти собака кіт ветеринар школа "
+    "батьківські збори домашнє завдання математика олімпіада"
+).split()
+
+# Кількість слів у нотатці: логнормальний розподіл (медіана ~ e^3 ≈ 20 слів)
+NOTE_WORDS_MU = 3.0
+NOTE_WORDS_SIGMA = 0.9
+NOTE_WORDS_MAX = 600
+
+FIRST_DAY = datetime(2020, 1, 1)
+
+
+def phone(rng: random.Random) -> str:
+    """Номер мобільного телефону України у форматі +380XXXXXXXXX"""
+    return f"+380{rng.choice(OPERATOR_CODES)}{rng.randrange(10_000_000):07d}"
+
+
+def tags(rng: random.Random) -> str:
+    """0-4 теги нотатки, популярні теги частіші"""
+    count = rng.choices(range(5), weights=(15, 35, 30, 15, 5))[0]
+    weights = [1 / rank for rank in range(1, len(TAGS) + 1)]
+    return ", ".join(dict.fromkeys(rng.choices(TAGS, weights=weights, k=count)))
+
+
+def text(rng: random.Random) -> str:
+    """Текст нотатки з логнормальною кількістю слів"""
+    count = min(NOTE_WORDS_MAX, max(1, int(rng.lognormvariate(NOTE_WORDS_MU, NOTE_WORDS_SIGMA))))
+    return " ".join(rng.choices(WORDS, k=count))
+
+
+def contacts(count: int, seed: int = SEED, start: int = 0) -> Iterator[Record]:
+    """
+    Генерує count контактів з унікальними іменами.
+    Однакові seed та start дають однакові контакти.
+    - 1-3 телефони (10% контактів ділять номер з іншими)
+    - 70% з email, 85% з днем народження, 50% з адресою
+    """
+    rng = random.Random(f"{seed}:contacts:{start}")
+    shared: List[str] = []
+    for number in range(start, start + count):
+        first, first_latin = rng.choice(FIRST_NAMES)
+        last, last_latin = rng.choice(LAST_NAMES)
+        record = Record(f"{first} {last} {number}")
+        for _ in range(rng.choices((1, 2, 3), weights=(60, 30, 10))[0]):
+            if shared and rng.random() < 0.1:
+                value = rng.choice(shared)
+            else:
+                value = phone(rng)
+                if len(shared) < 1000:
+                    shared.append(value)
+            record.phones.data[value] = Phone.from_value((value, rng.choice(("", "", "mobile", "work", "home"))))
+        if rng.random() < 0.7:
+            domain = rng.choice(EMAIL_DOMAINS)
+            record.email = Email.from_value(f"{first_latin}.{last_latin}{number}@{domain}")
+        if rng.random() < 0.85:
+            birthday = date(1950, 1, 1) + timedelta(days=rng.randrange(365 * 60))
+            record.birthday = Birthday.from_value(birthday)
+        if rng.random() < 0.5:
+            street = rng.choice(STREETS)
+            record.address = Address(f"м. {rng.choice(CITIES)}, вул. {street}, {rng.randrange(1, 200)}")
+        yield record
+
+
+def notes(count: int, seed: int = SEED, start: int = 0) -> Iterator[NoteRecord]:
+    """
+    Генерує count нотаток з тегами, текстом логнормальної довжини
+    та датами створення і зміни з 2020 року (id призначає книга)
+    """
+    rng = random.Random(f"{seed}:notes:{start}")
+    for _ in range(count):
+        title = " ".join(rng.choices(WORDS, k=rng.randint(1, 4))).capitalize()
+        record = NoteRecord(title, text(rng), tags(rng))
+        record.date_created = FIRST_DAY + timedelta(seconds=rng.randrange(5 * 365 * 86400))
+        record.date_modified = record.date_created + timedelta(seconds=rng.randrange(90 * 86400))
+        yield record
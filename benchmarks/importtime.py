@@ -0,0 +1,104 @@
+"""
+Module for checking the startup import budget
+
+    python -m benchmarks.importtime [--runs N] [--budget MS]
+
+Imports lotus_bot.main in fresh interpreters with -X importtime and fails
+when the best cumulative time exceeds the budget or when a module that
+must stay lazy (prompt_toolkit, import/export, profiling, SQLite) is
+imported at startup.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import pathlib
+import re
+import subprocess
+import sys
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+MODULE = "lotus_bot.main"
+
+# Бюджет імпорту lotus_bot.main у мілісекундах (найкращий з кількох запусків).
+# Виміряно ~150-190 мс, з яких ~70-120 мс займає rich.console.
+BUDGET_MS = 250
+
+RUNS = 5
+
+# Модулі, які не можна імпортувати під час запуску
+LAZY_MODULES = [
+    "prompt_toolkit",
+    "lotus_bot.completion",
+    "lotus_bot.transfer",
+    "lotus_bot.sqlite_storage",
+    "lotus_bot.columnar",
+    "lotus_bot.server",
+    "lotus_bot.backup",
+    "lotus_bot.dedupe",
+    "lotus_bot.query",
+    "asyncio",
+    "sqlite3",
+    "csv",
+    "cProfile",
+]
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def measure() -> Dict[str, Tuple[int, int, int]]:
+    """
+    Імпортує MODULE у новому інтерпретаторі.
+    Повертає модуль -> (власний час у мкс, сумарний час у мкс, відступ у дереві імпортів)
+    """
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            modules[name] = (int(own), int(cumulative), len(indent))
+    return modules
+
+
+def main(argv: List[str] | None = None):
+    """Entry point for the import budget check"""
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.importtime", description=f"Check the import time budget of {MODULE}")
+    parser.add_argument("--runs", type=int, default=RUNS, help=f"interpreters to start, the best one counts (default: {RUNS})")
+    parser.add_argument("--budget", type=float, default=BUDGET_MS, help=f"budget in milliseconds (default: {BUDGET_MS})")
+    options = parser.parse_args(argv)
+
+    runs = [measure() for _ in range(max(1, options.runs))]
+    best = min(runs, key=lambda modules: modules[MODULE][1])
+    total = best[MODULE][1] / 1000
+
+    print(f"{MODULE}: {total:.1f} ms (budget {options.budget:.0f} ms, best of {len(runs)})")
+    direct = [(cumulative, name) for name, (_, cumulative, indent) in best.items() if indent == 3]
+    for cumulative, name in sorted(direct, reverse=True)[:10]:
+        print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+    failures = []
+    if total > options.budget:
+        failures.append(f"{MODULE} takes {total:.1f} ms, over the {options.budget:.0f} ms budget")
+    eager = [name for name in LAZY_MODULES if name in best]
+    if eager:
+        failures.append(f"imported at startup, must stay lazy: {', '.join(eager)}")
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
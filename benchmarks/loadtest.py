@@ -0,0 +1,241 @@
+"""
+Module for load testing the JSON API server
+
+    python -m benchmarks.loadtest [--size 1k] [--connections 16] [--duration 10] [--writes 0.05] [--output FILE]
+
+Generates a book of the given size (benchmarks.generate) into a temporary
+data directory and starts `lotus-cli --serve` on a unix socket in it,
+or uses a running server with --address. Then every connection sends
+requests over one keep-alive connection for --duration seconds:
+lookups by phone, email and name, phones of a contact, notes by tags,
+ranked search and birthdays, with --writes of them adding notes.
+Prints requests per second and p50/p95/p99 latency per command.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from benchmarks import generate
+from benchmarks.run import Bench
+from benchmarks.run import prepare
+from benchmarks.run import SIZES
+from lotus_bot.metrics import Histogram
+from lotus_bot.server import parse_address
+
+CONNECTIONS = 16
+DURATION = 10.0
+WRITES = 0.05
+
+# Скільки записів вибірки використовується для аргументів запитів
+SAMPLE = 1_000
+
+# Скільки чекати, поки сервер завантажить книги і почне приймати з'єднання
+STARTUP_TIMEOUT = 120.0
+
+Request = Tuple[str, List[str]]
+
+
+def read_requests(bench: Bench) -> List[Request]:
+    """Запити читання з аргументами з вибірки згенерованих записів"""
+    requests: List[Request] = []
+    for i, record in enumerate(bench.contacts):
+        requests.append(("find-by-phone", [next(iter(record.phones.data))]))
+        requests.append(("phone", [record.name.value]))
+        requests.append(("find-by-name", [record.name.value[:4], "20"]))
+        if record.email:
+            requests.append(("find-by-email", [record.email.value]))
+        requests.append(("notes-by-tags", [generate.TAGS[i % len(generate.TAGS)], "20"]))
+        requests.append(("search", [f"{generate.WORDS[i % len(generate.WORDS)]} {generate.WORDS[(i * 7 + 1) % len(generate.WORDS)]}", "10"]))
+    requests += [("birthdays", ["7"])] * (len(bench.contacts) // 10 or 1)
+    return requests
+
+
+class Client:
+    """З'єднання keep-alive, запит за запитом"""
+
+    def __init__(self, address: str):
+        self.address = address
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+
+    async def connect(self):
+        kind, host, port = parse_address(self.address)
+        if kind == "unix":
+            self.reader, self.writer = await asyncio.open_unix_connection(host)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+
+    async def request(self, command: str, args: List[str]) -> Tuple[int, dict]:
+        """Надсилає команду і повертає статус та тіло відповіді"""
+        body = json.dumps({"command": command, "args": args}, ensure_ascii=False).encode("utf-8")
+        # Сервер з LOTUS_API_TOKEN приймає лише запити з цим токеном
+        token = os.environ.get("LOTUS_API_TOKEN")
+        authorization = f"Authorization: Bearer {token}\r\n" if token else ""
+        self.writer.write(
+            b"POST /command HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+            + f"{authorization}Content-Length: {len(body)}\r\n\r\n".encode("latin-1")
+            + body
+        )
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def connection(
+    address: str,
+    requests: List[Request],
+    writes: float,
+    deadline: float,
+    rng: random.Random,
+    histograms: Dict[str, Histogram],
+    errors: Dict[str, int],
+):
+    """Надсилає запити одним з'єднанням до deadline"""
+    client = Client(address)
+    await client.connect()
+    try:
+        while time.perf_counter() < deadline:
+            if rng.random() < writes:
+                command, args = "add-note", [f"Навантаження {rng.randrange(10**6)}", generate.text(rng), generate.tags(rng)]
+            else:
+                command, args = rng.choice(requests)
+            start = time.perf_counter()
+            status, _ = await client.request(command, args)
+            elapsed = time.perf_counter() - start
+            histogram = histograms.get(command)
+            if histogram is None:
+                histogram = histograms[command] = Histogram()
+            histogram.record(elapsed)
+            if status != 200:
+                errors[command] = errors.get(command, 0) + 1
+    finally:
+        client.close()
+
+
+async def load(address: str, requests: List[Request], options: argparse.Namespace) -> Tuple[Dict[str, Histogram], Dict[str, int], float]:
+    """Запускає connections з'єднань на duration секунд"""
+    histograms: Dict[str, Histogram] = {}
+    errors: Dict[str, int] = {}
+    start = time.perf_counter()
+    deadline = start + options.duration
+    await asyncio.gather(
+        *(
+            connection(address, requests, options.writes, deadline, random.Random(f"{options.seed}:{number}"), histograms, errors)
+            for number in range(options.connections)
+        )
+    )
+    return histograms, errors, time.perf_counter() - start
+
+
+def start_server(data_path: pathlib.Path, address: str) -> subprocess.Popen:
+    """Запускає lotus-cli --serve і чекає, поки він почне приймати з'єднання"""
+    root = pathlib.Path(__file__).resolve().parent.parent
+    env = dict(os.environ, LOTUS_DATA_DIR=str(data_path), PYTHONPATH=str(root))
+    server = subprocess.Popen([sys.executable, "-m", "lotus_bot.main", "--serve", address], env=env, stdout=subprocess.DEVNULL)
+    kind, host, port = parse_address(address)
+    deadline = time.perf_counter() + STARTUP_TIMEOUT
+    while time.perf_counter() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            if kind == "unix":
+                probe = socket.socket(socket.AF_UNIX)
+                probe.connect(host)
+            else:
+                probe = socket.create_connection((host, port))
+            probe.close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError(f"Server did not start in {STARTUP_TIMEOUT:.0f}s")
+
+
+def report(histograms: Dict[str, Histogram], errors: Dict[str, int], elapsed: float) -> dict:
+    """Підсумок навантаження: запити за секунду та перцентилі в мілісекундах"""
+    total = sum(histogram.count for histogram in histograms.values())
+    return {
+        "requests": total,
+        "seconds": elapsed,
+        "rps": total / elapsed,
+        "errors": sum(errors.values()),
+        "commands": {
+            command: {
+                "count": histogram.count,
+                "errors": errors.get(command, 0),
+                **{f"p{percent}": histogram.percentile(percent) * 1000 for percent in (50, 95, 99)},
+                "max": histogram.max * 1000,
+            }
+            for command, histogram in sorted(histograms.items())
+        },
+    }
+
+
+def main(argv: List[str] | None = None):
+    """Entry point for the API load test"""
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest", description="Load test of the Lotus JSON API server")
+    parser.add_argument("--size", default="1k", choices=SIZES, help="generated book size (default: 1k)")
+    parser.add_argument("--address", help="address of a running server with the same generated book instead of starting one")
+    parser.add_argument("--connections", type=int, default=CONNECTIONS, help=f"concurrent connections (default: {CONNECTIONS})")
+    parser.add_argument("--duration", type=float, default=DURATION, help=f"seconds to send requests (default: {DURATION:.0f})")
+    parser.add_argument("--writes", type=float, default=WRITES, help=f"fraction of add-note requests (default: {WRITES})")
+    parser.add_argument("--seed", type=int, default=generate.SEED, help="generator seed")
+    parser.add_argument("--output", help="JSON file for results")
+    options = parser.parse_args(argv)
+    if options.connections < 1:
+        parser.error("--connections must be positive")
+
+    with tempfile.TemporaryDirectory(prefix="lotus-load-") as directory:
+        bench = Bench(options.size, SIZES[options.size], pathlib.Path(directory), options.seed, SAMPLE // 20)
+        requests = read_requests(bench)
+        server = None
+        address = options.address
+        if address is None:
+            start = time.perf_counter()
+            prepare(bench)
+            print(f"{options.size}: generated {bench.size} contacts and notes in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+            address = f"unix:{bench.data_path / 'lotus.sock'}"
+            server = start_server(bench.data_path, address)
+        try:
+            histograms, errors, elapsed = asyncio.run(load(address, requests, options))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    results = report(histograms, errors, elapsed)
+    print(f"{results['requests']} requests in {elapsed:.1f}s: {results['rps']:.0f} rps, {results['errors']} error(s)")
+    print(f"{'command':<16} {'count':>8} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for command, row in results["commands"].items():
+        print(f"{command:<16} {row['count']:>8} {row['errors']:>7} {row['p50']:>9.3f} {row['p95']:>9.3f} {row['p99']:>9.3f}")
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
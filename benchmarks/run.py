@@ -0,0 +1,685 @@
+"""
+Module for running the Lotus benchmark suite
+
+    python -m benchmarks.run [--sizes 1k,100k,1m] [--repeat N] [--output FILE]
+
+For every size a book of that many contacts and notes is generated
+(benchmarks.generate) into a temporary data directory, then
+- every command of main() is run in batch mode, one line per sample,
+- every public method of AddressBook, NotesBook and TagIndex is timed,
+- reading changes committed by another process from the journal is timed,
+- the pickle snapshot is written and read plain and with every compression codec,
+- print_as_rich_table renders contacts and notes into a null console.
+Results go to a JSON file, compare two of them with benchmarks.compare.
+The storage engine is chosen by LOTUS_STORAGE, as for the bot.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import inspect
+import io
+import json
+import os
+import pathlib
+import platform
+import random
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from collections.abc import Iterator
+from datetime import date
+from datetime import datetime
+from itertools import islice
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from benchmarks import generate
+from lotus_bot import storage as lotus_storage
+from lotus_bot.compression import CODECS
+from lotus_bot.compression import get_codec
+from lotus_bot.contacts import AddressBook
+from lotus_bot.contacts import Record
+from lotus_bot.main import commands
+from lotus_bot.main import main as lotus_main
+from lotus_bot.notes import NoteRecord
+from lotus_bot.notes import NotesBook
+from lotus_bot.notes import TagIndex
+from lotus_bot.rich_table_printer import print_as_rich_table
+from lotus_bot.rich_table_printer import RowCache
+from lotus_bot.transfer import export_contacts
+from lotus_bot.transfer import export_notes
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+DEFAULT_SIZES = "1k,100k"
+REPEAT = 5
+
+# Повний вивід таблиці (all, all-notes без limit) лише для невеликих книг
+FULL_RENDER_LIMIT = 1_000
+
+# Скільки записів імпортується за один виклик import-*
+IMPORT_SIZE = 1_000
+
+# Ширина null-консолі, щоб таблиці верстались однаково на будь-якому терміналі
+CONSOLE_WIDTH = "120"
+
+# Знімок великої книги пишеться секундами, тож його заміри обмежено
+SNAPSHOT_REPEAT = 3
+
+# Нові записи методів нумеруються від NEW_RECORDS * розмір, після імпортованих
+NEW_RECORDS = 100
+
+RESULTS_FORMAT = 1
+
+Thunk = Callable[[], object]
+
+
+class NullWriter(io.TextIOBase):
+    """Текстовий потік, що відкидає вивід, пам'ятаючи останні рядки для повідомлень про помилки"""
+
+    def __init__(self, tail: int = 20):
+        self.tail: deque = deque(maxlen=tail)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        self.tail.append(text)
+        return len(text)
+
+
+class Bench:
+    """Набір даних одного розміру та вибірки записів з нього для аргументів"""
+
+    def __init__(self, label: str, size: int, data_path: pathlib.Path, seed: int, repeat: int):
+        self.label = label
+        self.size = size
+        self.data_path = data_path
+        self.seed = seed
+        self.repeat = repeat
+        self.rng = random.Random(f"{seed}:arguments")
+        # Генератор детермінований, тож перші записи збігаються з записаними у книгу
+        sample = min(size, 20 * repeat)
+        self.contacts: List[Record] = list(generate.contacts(sample, seed))
+        self.notes: List[NoteRecord] = list(generate.notes(sample, seed))
+        # id нотаток призначаються книгою по порядку, починаючи з 1
+        for id, note in enumerate(self.notes, 1):
+            note.id = id
+        self.book: AddressBook | None = None
+        self.notes_book: NotesBook | None = None
+        self.results: List[dict] = []
+
+    def group(self, number: int, records: List) -> List:
+        """number-а група з repeat різних записів, щоб команди не заважали одна одній"""
+        start = number * self.repeat % max(1, len(records) - self.repeat + 1)
+        end = start + self.repeat
+        return records[start:end]
+
+    def with_birthday(self, number: int) -> List[Record]:
+        return self.group(number, [r for r in self.contacts if r.birthday])
+
+    def with_email(self, number: int) -> List[Record]:
+        return self.group(number, [r for r in self.contacts if r.email])
+
+    def with_tags(self, number: int) -> List[NoteRecord]:
+        return self.group(number, [n for n in self.notes if n.tags])
+
+    def record(self, group: str, name: str, samples: List[float], **extra):
+        self.results.append(
+            {
+                "size": self.label,
+                "records": self.size,
+                "group": group,
+                "name": name,
+                "samples": samples,
+                **summary(samples),
+                **extra,
+            }
+        )
+
+
+def summary(samples: List[float]) -> Dict[str, float]:
+    """Статистика вибірки часу в секундах; first -- перший (холодний) запуск"""
+    return {
+        "first": samples[0],
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+    }
+
+
+def prepare(bench: Bench):
+    """Записує згенеровані контакти та нотатки у сховище каталогу даних"""
+    store = lotus_storage.open_storage(bench.data_path)
+    dictionary = store.load()
+    AddressBook(dictionary["contacts"]).import_records(generate.contacts(bench.size, bench.seed))
+    NotesBook(dictionary["notes"]).import_notes(generate.notes(bench.size, bench.seed))
+    store.persist()
+    store.close()
+
+    # Файли для import-contacts та import-notes з новими записами
+    book = AddressBook({})
+    book.import_records(generate.contacts(IMPORT_SIZE, bench.seed, start=bench.size))
+    with open(bench.data_path / "import.csv", "w", encoding="utf-8", newline="") as f:
+        export_contacts(book, f, "csv")
+    notes_book = NotesBook({})
+    notes_book.import_notes(generate.notes(IMPORT_SIZE, bench.seed, start=bench.size))
+    with open(bench.data_path / "import.jsonl", "w", encoding="utf-8", newline="") as f:
+        export_notes(notes_book, f, "jsonl")
+
+
+# Команди main()
+
+
+def tag(i: int) -> str:
+    return generate.TAGS[i % len(generate.TAGS)]
+
+
+def word(i: int) -> str:
+    return generate.WORDS[i % len(generate.WORDS)]
+
+
+def command_lines(bench: Bench) -> List[Tuple[str, str]]:
+    """
+    Рядки пакетного режиму: (назва замірів, команда).
+    Кожна команда повторюється repeat разів з різними аргументами
+    """
+    q = shlex.quote
+    path = bench.data_path
+    full = [("all", lambda i: "all"), ("all-notes", lambda i: "all-notes")] if bench.size <= FULL_RENDER_LIMIT else []
+    cases: List[Tuple[str, Callable[[int], str]]] = [
+        ("hello", lambda i: "hello"),
+        ("help", lambda i: "help"),
+        ("add-phone", lambda i: f"add-phone {q(bench.group(0, bench.contacts)[i].name.value)} {generate.phone(bench.rng)}"),
+        ("add-phone new", lambda i: f"add-phone {q(f'Бенчмарк Новий {i}')} {generate.phone(bench.rng)}"),
+        ("add-birthday", lambda i: f"add-birthday {q(bench.group(1, bench.contacts)[i].name.value)} {i % 28 + 1:02d}.02.1990"),
+        ("add-email", lambda i: f"add-email {q(bench.group(2, bench.contacts)[i].name.value)} bench{i}@example.com"),
+        ("add-address", lambda i: f"add-address {q(bench.group(3, bench.contacts)[i].name.value)} {q(f'м. Київ, вул. Садова, {i}')}"),
+        ("change", lambda i: change_line(bench, i)),
+        ("remove", lambda i: f"remove {q(bench.group(5, bench.contacts)[i].name.value)}"),
+        ("phone", lambda i: f"phone {q(bench.group(6, bench.contacts)[i].name.value)}"),
+        ("show-birthday", lambda i: f"show-birthday {q(bench.with_birthday(7)[i].name.value)}"),
+        ("birthdays 7", lambda i: "birthdays 7"),
+        ("birthdays-between week", lambda i: f"birthdays-between {i % 21 + 1:02d}.06.2025 {i % 21 + 8:02d}.06.2025"),
+        ("find-by-phone", lambda i: f"find-by-phone {next(iter(bench.group(8, bench.contacts)[i].phones.data))}"),
+        ("find-by-email", lambda i: f"find-by-email {bench.with_email(9)[i].email.value}"),
+        ("find-by-name prefix 20", lambda i: f"find-by-name {q(bench.group(10, bench.contacts)[i].name.value[:10])} 20"),
+        ("find indexed 20", lambda i: f"find {q(find_query(bench, i))} 20"),
+        ("find scan 20", lambda i: f"find {q(f'address~{generate.CITIES[i % len(generate.CITIES)]} has:email')} 20"),
+        ("explain", lambda i: f"explain {q(find_query(bench, i))}"),
+        ("all 20", lambda i: f"all 20 {i * 20}"),
+        ("all name 20", lambda i: "all name 20"),
+        ("all birthday desc 20", lambda i: "all birthday desc 20"),
+        ("all address 20", lambda i: "all address 20"),
+        ("add-note", lambda i: f"add-note {q(f'Нотатка {i}')} {q(generate.text(bench.rng))} {q(generate.tags(bench.rng))}"),
+        ("add-tags", lambda i: f"add-tags {bench.group(0, bench.notes)[i].id} {q('бенчмарк, тест')}"),
+        ("remove-tag", lambda i: f"remove-tag {bench.with_tags(1)[i].id} {q(bench.with_tags(1)[i].tags[0])}"),
+        ("edit-note", lambda i: f"edit-note {bench.group(2, bench.notes)[i].id} {q(f'Заголовок {i}')} {q(generate.text(bench.rng))}"),
+        ("edit-note-text", lambda i: f"edit-note-text {bench.group(3, bench.notes)[i].id} {q(generate.text(bench.rng))}"),
+        ("remove-note", lambda i: f"remove-note {bench.group(4, bench.notes)[i].id}"),
+        ("all-notes 20", lambda i: f"all-notes 20 {i * 20}"),
+        ("all-notes created desc 20", lambda i: "all-notes created desc 20"),
+        ("all-notes title 20", lambda i: "all-notes title 20"),
+        ("notes-by-tags 20", lambda i: f"notes-by-tags {q(tag(i))} 20"),
+        ("notes-by-tags expression 20", lambda i: f"notes-by-tags {q(f'{tag(0)},{tag(i + 1)}|!{tag(2)}')} 20"),
+        ("notes-by-text 20", lambda i: f"notes-by-text {word(i)} 20"),
+        ("search 10", lambda i: f"search {q(word(i) + ' ' + word(i + 1))} 10"),
+        *full,
+        ("stats", lambda i: "stats"),
+        # Імпорт додає записи, тож іде після виводу таблиць
+        ("import-contacts", lambda i: f"import-contacts {q(str(path / 'import.csv'))}"),
+        ("import-notes", lambda i: f"import-notes {q(str(path / 'import.jsonl'))}"),
+        ("export-contacts", lambda i: f"export-contacts {q(str(path / f'export{i}.csv'))}"),
+        ("export-notes", lambda i: f"export-notes {q(str(path / f'export{i}.jsonl'))}"),
+        # Перша копія (first) пише всі частини, наступні -- лише маніфест
+        ("backup", lambda i: "backup"),
+        ("backups", lambda i: "backups"),
+        ("restore", lambda i: "restore"),
+        ("dedupe 20", lambda i: "dedupe 20"),
+        # Перший запуск зливає всі групи, наступні лише шукають дублікати
+        ("dedupe merge", lambda i: "dedupe merge"),
+    ]
+    lines = []
+    for name, line in cases:
+        lines += [(name, line(i)) for i in range(bench.repeat)]
+    return lines
+
+
+def find_query(bench: Bench, i: int) -> str:
+    """Запит find з індексованими умовами: місяць народження та префікс імені"""
+    first_name = bench.group(11, bench.contacts)[i].name.value.split()[0]
+    return f"birthday:{i % 12 + 1} name^{first_name} has:email"
+
+
+def change_line(bench: Bench, i: int) -> str:
+    record = bench.group(4, bench.contacts)[i]
+    old_phone = next(iter(record.phones.data))
+    return f"change {shlex.quote(record.name.value)} {old_phone} {generate.phone(bench.rng)}"
+
+
+def run_commands(bench: Bench):
+    """
+    Проганяє всі команди через main() у пакетному режимі з записом після кожної команди.
+    Час рядка -- від його читання до читання наступного, тобто розбір, обробник,
+    вивід у null-консоль та запис у сховище
+    """
+    lines = command_lines(bench)
+    covered = {line.split()[0] for _, line in lines}
+    missing = set(commands) - covered - {"exit", "quit", "close"}
+    if missing:
+        raise ValueError(f"No benchmark for command(s): {', '.join(sorted(missing))}")
+    lines.append(("exit", "exit"))
+
+    marks: List[float] = []
+
+    def timed() -> Iterator[str]:
+        for _, line in lines:
+            marks.append(time.perf_counter())
+            yield line + "\n"
+
+    output = NullWriter()
+    stdin, stdout = sys.stdin, sys.stdout
+    sys.stdin, sys.stdout = timed(), output
+    os.environ["LOTUS_DATA_DIR"] = str(bench.data_path)
+    start = time.perf_counter()
+    try:
+        lotus_main(["--batch", "-", "--commit-every", "1"])
+        code = 0
+    except SystemExit as ex:
+        code = ex.code
+    finally:
+        end = time.perf_counter()
+        sys.stdin, sys.stdout = stdin, stdout
+    if code:
+        raise RuntimeError(f"Batch failed on {lines[len(marks) - 1][1]!r}: {''.join(output.tail)}")
+
+    # Останній рядок -- exit, його час включає закриття сховища
+    marks.append(end)
+    bench.record("startup", "load", [marks[0] - start])
+    samples: Dict[str, List[float]] = {}
+    for number, (name, _) in enumerate(lines):
+        samples.setdefault(name, []).append(marks[number + 1] - marks[number])
+    for name, values in samples.items():
+        bench.record("command", name, values)
+
+
+# Публічні методи
+
+
+def public_methods(cls) -> List[str]:
+    """Публічні методи та властивості, оголошені у класі"""
+    return [
+        f"{cls.__name__}.{name}"
+        for name, attr in vars(cls).items()
+        if not name.startswith("_") and (inspect.isfunction(attr) or isinstance(attr, property))
+    ]
+
+
+def imported_contacts(bench: Bench, i: int) -> List[Record]:
+    return list(generate.contacts(IMPORT_SIZE, bench.seed, start=2 * bench.size + i * IMPORT_SIZE))
+
+
+def imported_notes(bench: Bench, i: int) -> List[NoteRecord]:
+    return list(generate.notes(IMPORT_SIZE, bench.seed, start=2 * bench.size + i * IMPORT_SIZE))
+
+
+def reset(obj, attribute: str, value=None):
+    """Скидає лінивий індекс, щоб заміряти його побудову"""
+    setattr(obj, attribute, value)
+
+
+def address_book_cases(bench: Bench) -> Dict[str, Callable[[int], Thunk]]:
+    """Заміри методів AddressBook: функція номера повтору, що готує аргументи і повертає виклик"""
+    book = bench.book
+    june = (date(2025, 6, 1), date(2025, 6, 7))
+
+    def new_record(i: int) -> Record:
+        return next(generate.contacts(1, bench.seed, start=NEW_RECORDS * bench.size + i))
+
+    def name_index(i: int) -> Thunk:
+        reset(book, "_name_index")
+        return lambda: book.name_index
+
+    def add_record(i: int) -> Thunk:
+        record = new_record(i)
+        return lambda: book.add_record(record.name.value, record)
+
+    def remove_record(i: int) -> Thunk:
+        name = bench.group(11, bench.contacts)[i].name.value
+        return lambda: book.remove_record(name)
+
+    def import_records(i: int) -> Thunk:
+        records = imported_contacts(bench, i)
+        return lambda: book.import_records(records)
+
+    return {
+        "AddressBook.name_index": name_index,
+        "AddressBook.add_record": add_record,
+        "AddressBook.find_record": lambda i: lambda: book.find_record(bench.group(12, bench.contacts)[i].name.value),
+        "AddressBook.find_records_starting_with": lambda i: lambda: book.find_records_starting_with(
+            bench.group(13, bench.contacts)[i].name.value[:6], 20
+        ),
+        "AddressBook.sorted_keys": lambda i: lambda: list(islice(book.sorted_keys("birthday", i % 2 == 1) or (), 20)),
+        "AddressBook.find_record_by_phone": lambda i: lambda: book.find_record_by_phone(next(iter(bench.group(14, bench.contacts)[i].phones.data))),
+        "AddressBook.find_record_by_email": lambda i: lambda: book.find_record_by_email(bench.with_email(15)[i].email.value),
+        "AddressBook.find_phone_owners": lambda i: lambda: book.find_phone_owners(next(iter(bench.group(16, bench.contacts)[i].phones.data))),
+        "AddressBook.find_email_owners": lambda i: lambda: book.find_email_owners(bench.with_email(17)[i].email.value),
+        "AddressBook.import_records": import_records,
+        "AddressBook.remove_record": remove_record,
+        "AddressBook.get_birthdays_between": lambda i: lambda: book.get_birthdays_between(*june),
+        "AddressBook.get_congratulations": lambda i: lambda: book.get_congratulations(*june),
+        "AddressBook.get_upcoming_birthdays": lambda i: lambda: book.get_upcoming_birthdays(7),
+        "AddressBook.index_sizes": lambda i: book.index_sizes,
+        # Генеровані записи -- як щойно розпаковані з кадру журналу іншого процесу
+        "AddressBook.apply_change": lambda i: lambda: book.apply_change(
+            bench.group(18, bench.contacts)[i].name.value.lower(), bench.group(18, bench.contacts)[i]
+        ),
+    }
+
+
+def notes_book_cases(bench: Bench) -> Dict[str, Callable[[int], Thunk]]:
+    """Заміри методів NotesBook"""
+    notes_book = bench.notes_book
+
+    def text_index(i: int) -> Thunk:
+        reset(notes_book, "_text_index")
+        return lambda: notes_book.text_index
+
+    def trigram_index(i: int) -> Thunk:
+        reset(notes_book, "_trigram_index")
+        return lambda: notes_book.trigram_index
+
+    def add_note(i: int) -> Thunk:
+        record = next(generate.notes(1, bench.seed, start=NEW_RECORDS * bench.size + i))
+        return lambda: notes_book.add_note(record)
+
+    def import_notes(i: int) -> Thunk:
+        records = imported_notes(bench, i)
+        return lambda: notes_book.import_notes(records)
+
+    def edit_note(i: int) -> Thunk:
+        id = bench.group(5, bench.notes)[i].id
+        text = generate.text(bench.rng)
+        return lambda: notes_book.edit_note(id, f"Заголовок {i}", text, "бенчмарк")
+
+    def remove_tag(i: int) -> Thunk:
+        note = bench.with_tags(6)[i]
+        return lambda: notes_book.remove_tag(note.id, note.tags[0])
+
+    return {
+        "NotesBook.text_index": text_index,
+        "NotesBook.trigram_index": trigram_index,
+        "NotesBook.sorted_ids": lambda i: lambda: list(islice(notes_book.sorted_ids("created", i % 2 == 1) or (), 20)),
+        "NotesBook.add_note": add_note,
+        "NotesBook.import_notes": import_notes,
+        "NotesBook.search_by_tags": lambda i: lambda: notes_book.search_by_tags(f"{tag(0)},{tag(i + 1)}"),
+        "NotesBook.search_ranked": lambda i: lambda: notes_book.search_ranked(f"{word(i)} {word(i + 1)}"),
+        "NotesBook.search_by_notes_text": lambda i: lambda: notes_book.search_by_notes_text(word(i)),
+        "NotesBook.delete_note": lambda i: lambda: notes_book.delete_note(bench.group(7, bench.notes)[i].id),
+        "NotesBook.edit_note": edit_note,
+        "NotesBook.remove_tag": remove_tag,
+        "NotesBook.index_sizes": lambda i: notes_book.index_sizes,
+        "NotesBook.apply_change": lambda i: lambda: notes_book.apply_change(bench.group(19, bench.notes)[i].id, bench.group(19, bench.notes)[i]),
+    }
+
+
+def tag_index_cases(bench: Bench) -> Dict[str, Callable[[int], Thunk]]:
+    """Заміри методів TagIndex"""
+    index = bench.notes_book.tag_index
+    notes = bench.notes_book
+
+    def add_record_to_index(i: int) -> Thunk:
+        record = notes[bench.group(8, bench.notes)[i].id]
+        return lambda: index.add_record_to_index(record)
+
+    return {
+        "TagIndex.add_record_to_index": add_record_to_index,
+        "TagIndex.remove_record_from_index": lambda i: lambda: index.remove_record_from_index(bench.group(9, bench.notes)[i].id),
+        "TagIndex.add_tag": lambda i: lambda: index.add_tag(bench.group(10, bench.notes)[i].id, "бенчмарк"),
+        "TagIndex.remove_tag": lambda i: lambda: index.remove_tag(bench.group(10, bench.notes)[i].id, "бенчмарк"),
+        "TagIndex.postings": lambda i: lambda: index.postings(tag(i)),
+        "TagIndex.search": lambda i: lambda: index.search(tag(i)),
+        "TagIndex.all": lambda i: lambda: index.all(),
+    }
+
+
+def storage_cases(bench: Bench, store) -> Dict[str, Callable[[int], Thunk]]:
+    """
+    Заміри читання змін іншого процесу: кадр дописується в журнал під замком,
+    як це робить інший процес, а заміряється changes().
+    Для SQLite, де журналу нема, замірів нема.
+    """
+    if not hasattr(store, "journal"):
+        return {}
+
+    def changes(i: int) -> Thunk:
+        record = bench.group(18, bench.contacts)[i]
+        with store.lock:
+            store.journal.append("contacts", record.name.value.lower(), record)
+        return store.changes
+
+    return {f"{type(store).__name__}.changes": changes}
+
+
+def measure_snapshots(bench: Bench, store):
+    """
+    Заміряє запис і читання знімка без стиснення та з кожним кодеком,
+    а також запис, коли змінено лише контакти (стиснені нотатки беруться з попереднього запису).
+    Розмір файла записується в результат (bytes), пропускна здатність -- bytes / час.
+    Лише для рушія pickle, де секції -- звичайні словники
+    """
+    if not isinstance(store.dictionary.get("contacts"), dict):
+        return
+    dictionary = {**store.dictionary, lotus_storage.GENERATION: store.generation}
+    path = bench.data_path / "snapshot.bench"
+    for spec in ("none", *CODECS):
+        codec = get_codec(spec)
+        cases: Dict[str, Callable[[Dict], object]] = {
+            f"write_dict {spec}": lambda frames: lotus_storage.write_dict(path, dictionary, codec),
+            f"read_dict {spec}": lambda frames: lotus_storage.read_dict(path),
+        }
+        if codec is not None:
+            cases[f"write_dict {spec} contacts changed"] = lambda frames: lotus_storage.write_dict(path, dictionary, codec, frames, {"contacts"})
+        for name, case in cases.items():
+            samples = []
+            for _ in range(min(bench.repeat, SNAPSHOT_REPEAT)):
+                frames = {}
+                if name.endswith("changed"):
+                    # Попередній запис, секції якого використовуються повторно
+                    lotus_storage.write_dict(path, dictionary, codec, frames)
+                start = time.perf_counter()
+                case(frames)
+                samples.append(time.perf_counter() - start)
+            bench.record("snapshot", name, samples, bytes=path.stat().st_size)
+    path.unlink()
+
+
+CONTACT_COLUMNS = [
+    {"name": "Name", "min_width": 20, "max_width": 30, "no_wrap": False},
+    {"name": "Birthday", "min_width": 10},
+    {"name": "Address", "justify": "right", "no_wrap": False, "max_width": 30},
+    {"name": "Phones", "justify": "right", "no_wrap": False, "max_width": 16},
+    {"name": "Email", "justify": "right", "no_wrap": False, "max_width": 30},
+]
+
+NOTE_COLUMNS = [
+    {"name": "Id", "min_width": 2, "max_width": 6},
+    {"name": "Title", "min_width": 10, "max_width": 20},
+    {"name": "Text", "justify": "left", "no_wrap": False, "min_width": 30},
+    {"name": "Tags", "justify": "center", "no_wrap": False, "min_width": 10},
+    {"name": "Created", "justify": "right", "no_wrap": False, "max_width": 12},
+    {"name": "Modified", "justify": "right", "no_wrap": False, "max_width": 12},
+]
+
+
+def table_cases(bench: Bench) -> Dict[str, Callable[[int], Thunk]]:
+    """Заміри print_as_rich_table з рядками як у main(), вивід -- у null-консоль"""
+    book, notes_book = bench.book, bench.notes_book
+
+    def contact_rows():
+        return ([r.name, r.birthday.value if r.birthday else "", r.address, r.phones, r.email] for r in book.values())
+
+    def note_rows():
+        return ([r.id, r.title, r.text, r.tags, r.date_created, r.date_modified] for r in notes_book.values())
+
+    # Рядки з кешем текстів, як у main(): перший вивід форматує, наступні беруть з кешу
+    contact_cache = RowCache(lambda r: [r.name, r.birthday.value if r.birthday else "", r.address, r.phones, r.email])
+    note_cache = RowCache(lambda r: [r.id, r.title, r.text, r.tags, r.date_created, r.date_modified])
+
+    def cached_contact_rows():
+        return (contact_cache(r) for r in book.values())
+
+    def cached_note_rows():
+        return (note_cache(r) for r in notes_book.values())
+
+    def table(columns, rows, **params) -> Callable[[int], Thunk]:
+        return lambda i: lambda: print_as_rich_table(columns, rows(), **params)
+
+    cases = {
+        "print_as_rich_table contacts 20": table(CONTACT_COLUMNS, contact_rows, limit=20),
+        "print_as_rich_table contacts birthday desc 20": table(CONTACT_COLUMNS, contact_rows, sort_by="Birthday", reverse_sort=True, limit=20),
+        "print_as_rich_table notes 20 offset 100": table(NOTE_COLUMNS, note_rows, limit=20, offset=100),
+        "print_as_rich_table notes created 20": table(NOTE_COLUMNS, note_rows, sort_by="Created", limit=20),
+    }
+    if bench.size <= FULL_RENDER_LIMIT:
+        cases["print_as_rich_table contacts"] = table(CONTACT_COLUMNS, contact_rows)
+        cases["print_as_rich_table notes"] = table(NOTE_COLUMNS, note_rows)
+        cases["print_as_rich_table contacts cached"] = table(CONTACT_COLUMNS, cached_contact_rows)
+        cases["print_as_rich_table notes cached"] = table(NOTE_COLUMNS, cached_note_rows)
+    return cases
+
+
+def measure(bench: Bench, group: str, cases: Dict[str, Callable[[int], Thunk]]):
+    """Заміряє кожен випадок repeat разів; підготовка аргументів у час не входить"""
+    for name, case in cases.items():
+        samples = []
+        for i in range(bench.repeat):
+            thunk = case(i)
+            start = time.perf_counter()
+            thunk()
+            samples.append(time.perf_counter() - start)
+        bench.record(group, name, samples)
+
+
+def run_methods(bench: Bench):
+    """Заміряє завантаження сховища, публічні методи книг і вивід таблиць"""
+    start = time.perf_counter()
+    store = lotus_storage.open_storage(bench.data_path)
+    dictionary = store.load()
+    loaded = time.perf_counter()
+    bench.book = AddressBook(dictionary["contacts"])
+    built = time.perf_counter()
+    bench.notes_book = NotesBook(dictionary["notes"])
+    bench.record("startup", "storage.load", [loaded - start])
+    bench.record("startup", "AddressBook.__init__", [built - loaded])
+    bench.record("startup", "NotesBook.__init__", [time.perf_counter() - built])
+
+    groups = {
+        "AddressBook": address_book_cases(bench),
+        "NotesBook": notes_book_cases(bench),
+        "TagIndex": tag_index_cases(bench),
+    }
+    for cls in (AddressBook, NotesBook, TagIndex):
+        missing = set(public_methods(cls)) - set(groups[cls.__name__])
+        if missing:
+            raise ValueError(f"No benchmark for method(s): {', '.join(sorted(missing))}")
+
+    output = NullWriter()
+    stdout, sys.stdout = sys.stdout, output
+    try:
+        # Таблиці першими, поки методи ще не змінили книги
+        measure(bench, "print_as_rich_table", table_cases(bench))
+        for group, cases in groups.items():
+            measure(bench, group, cases)
+        measure(bench, "storage", storage_cases(bench, store))
+        measure_snapshots(bench, store)
+    finally:
+        sys.stdout = stdout
+    # Набір даних тимчасовий, тож зміни методів не відкочуються
+    store.close()
+
+
+def run_size(label: str, seed: int, repeat: int) -> List[dict]:
+    """Генерує книгу розміру label у тимчасовому каталозі та проганяє всі заміри"""
+    with tempfile.TemporaryDirectory(prefix="lotus-bench-") as directory:
+        root = pathlib.Path(directory)
+        bench = Bench(label, SIZES[label], root / "base", seed, repeat)
+        bench.data_path.mkdir()
+        start = time.perf_counter()
+        prepare(bench)
+        print(f"{label}: generated {bench.size} contacts and notes in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        # Кожна фаза працює з власною копією, щоб зміни однієї не впливали на іншу
+        for phase, run in (("commands", run_commands), ("methods", run_methods)):
+            bench.data_path = root / phase
+            shutil.copytree(root / "base", bench.data_path)
+            gc.collect()
+            run(bench)
+        return bench.results
+
+
+def revision() -> str | None:
+    """Поточна ревізія git, якщо набір запущено з робочої копії"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=pathlib.Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: List[str] | None = None):
+    """Entry point for the benchmark suite"""
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Lotus bot benchmark suite")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma separated sizes out of {', '.join(SIZES)} (default: {DEFAULT_SIZES})")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help=f"samples per command and method (default: {REPEAT})")
+    parser.add_argument("--seed", type=int, default=generate.SEED, help="generator seed")
+    parser.add_argument("--output", default="bench-results.json", help="JSON file for results (default: bench-results.json)")
+    options = parser.parse_args(argv)
+
+    labels = [label.strip().lower() for label in options.sizes.split(",") if label.strip()]
+    unknown = [label for label in labels if label not in SIZES]
+    if unknown:
+        parser.error(f"unknown size(s): {', '.join(unknown)}")
+    if options.repeat < 1:
+        parser.error("--repeat must be positive")
+
+    os.environ["COLUMNS"] = CONSOLE_WIDTH
+    results = {
+        "format": RESULTS_FORMAT,
+        "meta": {
+            "revision": revision(),
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "engine": lotus_storage.STORAGE_ENGINE,
+            "seed": options.seed,
+            "repeat": options.repeat,
+            "unit": "s",
+        },
+        "results": [],
+    }
+    for label in labels:
+        results["results"] += run_size(label, options.seed, options.repeat)
+
+    with open(options.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=1)
+
+    for result in results["results"]:
+        print(f"{result['size']:>5} {result['group']:<20} {result['name']:<50} {result['median'] * 1000:>10.3f} ms")
+    print(f"Results written to {options.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
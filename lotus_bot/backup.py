@@ -0,0 +1,214 @@
+"""Module for incremental content-addressed backups of contacts and notes"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pathlib
+import pickle
+import tempfile
+import zlib
+from collections.abc import Iterable
+from collections.abc import Iterator
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Set
+from typing import Tuple
+
+from lotus_bot.compression import Codec
+from lotus_bot.compression import get_codec
+from lotus_bot.storage import fsync
+from lotus_bot.storage import fsync_dir
+from lotus_bot.storage import replace
+
+# Каталог резервних копій; за замовчуванням -- backups у каталозі даних
+BACKUP_DIR = os.environ.get("LOTUS_BACKUP_DIR")
+
+# Стиснення частин копії: none, zlib, lzma або "кодек:рівень"
+BACKUP_COMPRESSION = os.environ.get("LOTUS_BACKUP_COMPRESSION", "zlib")
+
+# Середня кількість записів в одній частині
+CHUNK_RECORDS = int(os.environ.get("LOTUS_BACKUP_CHUNK_RECORDS", 64))
+
+# Середня кількість хешів частин в одній частині індексу
+INDEX_FANOUT = 64
+
+
+def chunk_records(records: Mapping, average: int = CHUNK_RECORDS) -> Iterator[List[Tuple[Any, Any]]]:
+    """
+    Розбиває записи, впорядковані за ключем, на частини (списки пар ключ, запис).
+    Частина закінчується на ключі, crc32 якого ділиться на average, тож межі
+    залежать лише від ключів: зміна запису змінює одну частину, а додавання
+    чи видалення запису -- лише ту, куди потрапляє ключ
+    """
+    chunk = []
+    for key, value in sorted(records.items(), key=lambda item: item[0]):
+        chunk.append((key, value))
+        if zlib.crc32(repr(key).encode("utf-8")) % average == 0:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def chunk_digests(digests: Iterable[str], average: int = INDEX_FANOUT) -> Iterator[List[str]]:
+    """Розбиває список хешів частин на частини індексу; межа -- за значенням хеша, як у chunk_records"""
+    chunk = []
+    for digest in digests:
+        chunk.append(digest)
+        if int(digest[:8], 16) % average == 0:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class BackupReport:
+    """Підсумок резервного копіювання: скільки частин записано і скільки вже було"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.records: Dict[str, int] = {}
+        self.chunks = 0
+        self.new_chunks = 0
+        # Розмір усіх частин до стиснення та кількість записаних на диск байтів
+        self.size = 0
+        self.written = 0
+
+
+class BackupStore:
+    """
+    Каталог резервних копій з частинами, що адресуються вмістом:
+
+        chunks/ab/abcdef...  -- частина: назва кодека, "\\n" і (стиснений) pickle списку;
+                                ім'я -- sha256 нестисненого pickle
+        snapshots/NAME.json   -- маніфест копії: кількість записів і частини індексу кожної секції
+
+    Записи секції розбиваються на частини (chunk_records), а список їхніх хешів --
+    на частини індексу, тож маніфест малий навіть для великої книги.
+    Частина, що вже є в каталозі, не пишеться вдруге: копія записує лише
+    частини зі зміненими записами, а будь-яку попередню копію можна відновити.
+    """
+
+    def __init__(self, path: pathlib.Path, codec: Codec | None = None, average: int = CHUNK_RECORDS):
+        self.path = path
+        self.codec = codec
+        self.average = average
+        self.chunks_path = path.joinpath("chunks")
+        self.snapshots_path = path.joinpath("snapshots")
+
+    def chunk_path(self, digest: str) -> pathlib.Path:
+        return self.chunks_path.joinpath(digest[:2], digest)
+
+    def _write_chunk(self, items: List, report: BackupReport, written: Set[pathlib.Path]) -> str:
+        raw = pickle.dumps(items, pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.sha256(raw).hexdigest()
+        report.chunks += 1
+        report.size += len(raw)
+        path = self.chunk_path(digest)
+        if path.exists():
+            return digest
+
+        name, payload = "none", raw
+        if self.codec is not None:
+            packed = self.codec.compress(raw)
+            if len(packed) < len(raw):
+                name, payload = self.codec.name, packed
+        if not path.parent.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            written.add(path.parent.parent)
+        # Тимчасовий файл з унікальним ім'ям: ту саму частину може писати інший процес
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(name.encode("ascii") + b"\n")
+            f.write(payload)
+            fsync(f)
+        os.replace(tmp_path, path)
+        written.add(path.parent)
+        report.new_chunks += 1
+        report.written += len(payload)
+        return digest
+
+    def read_chunk(self, digest: str) -> List:
+        """Читає частину і перевіряє, що її вміст відповідає хешу"""
+        name, _, payload = self.chunk_path(digest).read_bytes().partition(b"\n")
+        codec = get_codec(name.decode("ascii"))
+        raw = payload if codec is None else codec.decompress(payload)
+        if hashlib.sha256(raw).hexdigest() != digest:
+            raise ValueError(f"Backup chunk {digest} is corrupted")
+        return pickle.loads(raw)
+
+    def _new_name(self) -> str:
+        name = datetime.now().strftime("%Y%m%d-%H%M%S")
+        number = 1
+        while self.snapshots_path.joinpath(f"{name}.json").exists():
+            number += 1
+            name = f"{datetime.now():%Y%m%d-%H%M%S}-{number}"
+        return name
+
+    def backup(self, sections: Dict[str, Mapping]) -> BackupReport:
+        """Записує копію секцій {назва: записи}: лише нові частини та маніфест"""
+        self.snapshots_path.mkdir(parents=True, exist_ok=True)
+        report = BackupReport(self._new_name())
+        written: Set[pathlib.Path] = set()
+        manifest: Dict[str, Any] = {"created": datetime.now().isoformat(timespec="seconds"), "sections": {}}
+        for section, records in sections.items():
+            digests = [self._write_chunk(items, report, written) for items in chunk_records(records, self.average)]
+            index = [self._write_chunk(items, report, written) for items in chunk_digests(digests)]
+            report.records[section] = len(records)
+            manifest["sections"][section] = {"records": len(records), "chunks": len(digests), "index": index}
+        manifest["size"] = report.size
+
+        # Маніфест пишеться останнім, коли всі його частини вже на диску
+        for directory in written:
+            fsync_dir(directory)
+        path = self.snapshots_path.joinpath(f"{report.name}.json")
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+            fsync(f)
+        replace(tmp_path, path)
+        return report
+
+    def snapshots(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Усі копії (назва, маніфест) від найстарішої"""
+        if not self.snapshots_path.exists():
+            return []
+        result = []
+        for path in sorted(self.snapshots_path.glob("*.json"), key=lambda path: path.stem):
+            with open(path, encoding="utf-8") as f:
+                result.append((path.stem, json.load(f)))
+        return result
+
+    def find(self, name: str | None = None) -> Tuple[str, Dict[str, Any]]:
+        """Копія з назвою чи єдиним префіксом назви name; без name -- остання"""
+        snapshots = self.snapshots()
+        if not snapshots:
+            raise ValueError(f"No backups in {self.path}")
+        if not name:
+            return snapshots[-1]
+        found = [snapshot for snapshot in snapshots if snapshot[0] == name] or [
+            snapshot for snapshot in snapshots if snapshot[0].startswith(name)
+        ]
+        if len(found) != 1:
+            raise ValueError(f"{'Ambiguous' if found else 'Unknown'} backup {name}, see the backups command")
+        return found[0]
+
+    def restore(self, name: str | None = None) -> Tuple[str, Dict[str, Dict]]:
+        """Читає копію name (див. find) і повертає її назву та секції {назва: {ключ: запис}}"""
+        name, manifest = self.find(name)
+        sections = {}
+        for section, entry in manifest["sections"].items():
+            records = sections[section] = {}
+            for index in entry["index"]:
+                for digest in self.read_chunk(index):
+                    records.update(self.read_chunk(digest))
+        return name, sections
+
+
+def open_backups(data_path: pathlib.Path) -> BackupStore:
+    """Каталог резервних копій сховища в data_path (LOTUS_BACKUP_DIR перевизначає)"""
+    return BackupStore(pathlib.Path(BACKUP_DIR) if BACKUP_DIR else data_path.joinpath("backups"), get_codec(BACKUP_COMPRESSION))
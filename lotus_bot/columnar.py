@@ -0,0 +1,547 @@
+"""Module for memory-mapped columnar snapshot of contacts and notes"""
+from __future__ import annotations
+
+import array
+import bisect
+import json
+import mmap
+import pathlib
+import pickle
+import struct
+from collections.abc import Iterator
+from collections.abc import MutableMapping
+from datetime import date
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from lotus_bot.contacts import ContactIndex
+from lotus_bot.notes import SORTED_COLUMNS
+from lotus_bot.notes import TagIndex
+from lotus_bot.storage import fsync
+from lotus_bot.storage import GENERATION
+from lotus_bot.storage import Journal
+from lotus_bot.storage import PickleStorage
+from lotus_bot.storage import read_dict
+from lotus_bot.storage import replace
+
+MAGIC = b"LOTUSCL1"
+HEADER = struct.Struct("<8sI")
+ALIGN = 8
+
+# Опис файла знімка:
+#   MAGIC, довжина JSON-заголовка, JSON-заголовок, вирівняні колонки.
+# Заголовок: {"generation": покоління,
+#             section: {"count": n, "columns": {name: [offset, length, typecode]}}}
+# Рядкові колонки зберігаються парою name.offsets (Q, n + 1) і name.data (B).
+#
+# contacts (відсортовані за ключем):
+#   key -- рядки, birthday -- i (номер дня, 0 якщо нема),
+#   phone_start -- Q (n + 1), phones -- рядки, email -- рядки (порожній якщо нема),
+#   record -- pickle запису
+# notes (відсортовані за id):
+#   id -- q, created / modified -- q (мікросекунди від EPOCH, як у NoteRecord;
+#   знімки попередньої версії мали тут d, timestamp()), tag_start -- Q (n + 1),
+#   tag_ids -- I, tags -- рядки (таблиця тегів), record -- pickle запису
+
+
+class StringColumn:
+    """Колонка рядків: масив зсувів (n + 1) плюс суцільні байти UTF-8"""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self) -> int:
+        return max(len(self.offsets) - 1, 0)
+
+    def raw(self, i: int) -> bytes:
+        """Повертає байти i-го рядка"""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return bytes(self.data[start:end])
+
+    def __getitem__(self, i: int) -> str:
+        return self.raw(i).decode("utf-8")
+
+
+class StringColumnBuilder:
+    """Накопичує рядки (або байти) для запису StringColumn"""
+
+    def __init__(self):
+        self.offsets = array.array("Q", [0])
+        self.data = bytearray()
+
+    def append(self, value: str | bytes):
+        self.data += value.encode("utf-8") if isinstance(value, str) else value
+        self.offsets.append(len(self.data))
+
+    def columns(self, name: str) -> Dict[str, Tuple[str, bytes]]:
+        return {
+            f"{name}.offsets": ("Q", self.offsets.tobytes()),
+            f"{name}.data": ("B", bytes(self.data)),
+        }
+
+
+class ColumnarSnapshot:
+    """Знімок, відкритий через mmap; колонки читаються без розпакування записів"""
+
+    def __init__(self, path: pathlib.Path):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Видані колонки: їх треба звільнити, перш ніж закрити mmap
+        self.views: List[memoryview] = []
+        magic, header_len = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a columnar snapshot")
+        header_start = HEADER.size
+        header_end = header_start + header_len
+        self.sections = json.loads(self.mm[header_start:header_end])
+        self.generation = self.sections.pop(GENERATION, 0)
+        self.base = _aligned(header_end)
+
+    def count(self, section: str) -> int:
+        """Кількість записів у секції"""
+        return self.sections[section]["count"]
+
+    def column(self, section: str, name: str) -> memoryview:
+        """Повертає колонку як memoryview потрібного типу"""
+        offset, length, typecode = self.sections[section]["columns"][name]
+        start = self.base + offset
+        end = start + length
+        view = memoryview(self.mm)[start:end].cast(typecode)
+        self.views.append(view)
+        return view
+
+    def strings(self, section: str, name: str) -> StringColumn:
+        """Повертає рядкову колонку"""
+        return StringColumn(
+            self.column(section, f"{name}.offsets"), self.column(section, f"{name}.data")
+        )
+
+    def close(self):
+        """
+        Звільняє видані колонки та закриває mmap; таблиці знімка після цього
+        не можна читати. У Windows файл, відкритий через mmap, не можна замінити,
+        тож старий знімок закривається перед заміною файла новим
+        """
+        for view in self.views:
+            view.release()
+        self.views.clear()
+        self.mm.close()
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_columnar(path: pathlib.Path, dictionary: Dict, generation: int = 0, before_replace: Callable[[], None] | None = None):
+    """
+    Записує секції contacts та notes словника у колонковий знімок покоління generation.
+    before_replace викликається, коли тимчасовий файл уже записано, а path ще не замінено:
+    незмінені рядки копіюються зі старого знімка, тож закрити його можна лише тоді
+    """
+    sections = {
+        "contacts": _contacts_columns(dictionary.get("contacts", {})),
+        "notes": _notes_columns(dictionary.get("notes", {})),
+    }
+
+    header = {GENERATION: generation}
+    chunks = []
+    offset = 0
+    for section, (count, columns) in sections.items():
+        described = {}
+        for name, (typecode, payload) in columns.items():
+            described[name] = [offset, len(payload), typecode]
+            chunks.append((offset, payload))
+            offset = _aligned(offset + len(payload))
+        header[section] = {"count": count, "columns": described}
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    base = _aligned(HEADER.size + len(header_bytes))
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(header_bytes)))
+        f.write(header_bytes)
+        for chunk_offset, payload in chunks:
+            f.seek(base + chunk_offset)
+            f.write(payload)
+        f.truncate(base + offset)
+        fsync(f)
+    if before_replace is not None:
+        before_replace()
+    replace(tmp_path, path)
+
+
+def _contacts_columns(records) -> Tuple[int, Dict]:
+    keys = StringColumnBuilder()
+    birthdays = array.array("i")
+    phone_start = array.array("Q", [0])
+    phones = StringColumnBuilder()
+    emails = StringColumnBuilder()
+    blobs = StringColumnBuilder()
+
+    for key in sorted(records):
+        row = records.base_row(key) if isinstance(records, ColumnarTable) else None
+        if row is not None:
+            # Незмінений рядок копіюємо зі старого знімка без розпакування
+            base = records
+            birthday = base.birthdays[row]
+            row_phones = [
+                base.phones.raw(i)
+                for i in range(base.phone_start[row], base.phone_start[row + 1])
+            ]
+            email = base.emails.raw(row)
+            blob = base.records.raw(row)
+        else:
+            record = records[key]
+            birthday = record.birthday.value.toordinal() if record.birthday else 0
+            row_phones = list(record.phones.data)
+            email = record.email.value if record.email else ""
+            blob = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+
+        keys.append(key)
+        birthdays.append(birthday)
+        for phone in row_phones:
+            phones.append(phone)
+        phone_start.append(phone_start[-1] + len(row_phones))
+        emails.append(email)
+        blobs.append(blob)
+
+    columns = {}
+    columns.update(keys.columns("key"))
+    columns["birthday"] = ("i", birthdays.tobytes())
+    columns["phone_start"] = ("Q", phone_start.tobytes())
+    columns.update(phones.columns("phones"))
+    columns.update(emails.columns("email"))
+    columns.update(blobs.columns("record"))
+    return len(birthdays), columns
+
+
+def _notes_columns(records) -> Tuple[int, Dict]:
+    ids = array.array("q")
+    created = array.array("q")
+    modified = array.array("q")
+    tag_start = array.array("Q", [0])
+    tag_ids = array.array("I")
+    tag_table: Dict[str, int] = {}
+    tags = StringColumnBuilder()
+    blobs = StringColumnBuilder()
+
+    def tag_id(tag: str) -> int:
+        if tag not in tag_table:
+            tag_table[tag] = len(tag_table)
+            tags.append(tag)
+        return tag_table[tag]
+
+    for key in sorted(records):
+        row = records.base_row(key) if isinstance(records, ColumnarTable) else None
+        if row is not None and records.created is not None:
+            base = records
+            row_created = base.created[row]
+            row_modified = base.modified[row]
+            row_tags = base.row_tags(row)
+            blob = base.records.raw(row)
+        else:
+            record = records[key]
+            row_created = record._created
+            row_modified = record._modified
+            row_tags = list(record.tags.data)
+            blob = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+
+        ids.append(key)
+        created.append(row_created)
+        modified.append(row_modified)
+        tag_ids.extend(tag_id(tag) for tag in row_tags)
+        tag_start.append(len(tag_ids))
+        blobs.append(blob)
+
+    columns = {
+        "id": ("q", ids.tobytes()),
+        "created": ("q", created.tobytes()),
+        "modified": ("q", modified.tobytes()),
+        "tag_start": ("Q", tag_start.tobytes()),
+        "tag_ids": ("I", tag_ids.tobytes()),
+    }
+    columns.update(tags.columns("tags"))
+    columns.update(blobs.columns("record"))
+    return len(ids), columns
+
+
+class ColumnarTable(MutableMapping):
+    """
+    Відображення ключ -> запис поверх колонкового знімка.
+    Запис розпаковується з колонки record лише при першому зверненні
+    і далі живе в overlay разом із новими та зміненими записами;
+    видалені ключі знімка запам'ятовуються в deleted.
+    """
+
+    section = ""
+
+    def __init__(self, snapshot: ColumnarSnapshot):
+        self.overlay: Dict = {}
+        self.deleted: set = set()
+        self.reopen(snapshot)
+
+    def reopen(self, snapshot: ColumnarSnapshot):
+        """Перемикається на свіжий знімок, в якому вже є всі зміни з overlay; старий закривається"""
+        old = getattr(self, "snapshot", None)
+        if old is not None and old is not snapshot:
+            old.close()
+        self.snapshot = snapshot
+        self.count = snapshot.count(self.section)
+        self.records = snapshot.strings(self.section, "record")
+        self.overlay.clear()
+        self.deleted.clear()
+        self._open_columns(snapshot)
+
+    def _open_columns(self, snapshot: ColumnarSnapshot):
+        raise NotImplementedError
+
+    def _key_column(self):
+        raise NotImplementedError
+
+    def _find_row(self, key) -> int | None:
+        keys = self._key_column()
+        row = bisect.bisect_left(keys, key)
+        if row < self.count and keys[row] == key:
+            return row
+        return None
+
+    def base_row(self, key) -> int | None:
+        """Номер рядка знімка для незміненого ключа, інакше None"""
+        if key in self.overlay or key in self.deleted:
+            return None
+        return self._find_row(key)
+
+    def live_rows(self) -> Iterator[int]:
+        """Рядки знімка, які не змінені та не видалені"""
+        if not self.overlay and not self.deleted:
+            yield from range(self.count)
+            return
+        keys = self._key_column()
+        for row in range(self.count):
+            key = keys[row]
+            if key not in self.overlay and key not in self.deleted:
+                yield row
+
+    def __getitem__(self, key):
+        if key in self.overlay:
+            return self.overlay[key]
+        if key in self.deleted:
+            raise KeyError(key)
+        row = self._find_row(key)
+        if row is None:
+            raise KeyError(key)
+        value = pickle.loads(self.records.raw(row))
+        self.overlay[key] = value
+        self._loaded(key, value)
+        return value
+
+    def _loaded(self, key, value):
+        """Викликається для кожного щойно розпакованого запису"""
+
+    def __setitem__(self, key, value):
+        self.overlay[key] = value
+        self.deleted.discard(key)
+
+    def __delitem__(self, key):
+        in_base = self._find_row(key) is not None and key not in self.deleted
+        if key not in self.overlay and not in_base:
+            raise KeyError(key)
+        self.overlay.pop(key, None)
+        if in_base:
+            self.deleted.add(key)
+
+    def __contains__(self, key):
+        if key in self.overlay:
+            return True
+        return key not in self.deleted and self._find_row(key) is not None
+
+    def __iter__(self) -> Iterator:
+        keys = self._key_column()
+        for row in range(self.count):
+            key = keys[row]
+            if key not in self.deleted:
+                yield key
+        for key in list(self.overlay):
+            if self._find_row(key) is None:
+                yield key
+
+    def __len__(self) -> int:
+        added = sum(1 for key in self.overlay if self._find_row(key) is None)
+        return self.count - len(self.deleted) + added
+
+
+class ColumnarContacts(ColumnarTable):
+    """Контакти з колонок знімка"""
+
+    section = "contacts"
+
+    def __init__(self, snapshot: ColumnarSnapshot):
+        self._contact_index: ContactIndex | None = None
+        super().__init__(snapshot)
+
+    def _open_columns(self, snapshot: ColumnarSnapshot):
+        self.key_strings = snapshot.strings(self.section, "key")
+        self.birthdays = snapshot.column(self.section, "birthday")
+        self.phone_start = snapshot.column(self.section, "phone_start")
+        self.phones = snapshot.strings(self.section, "phones")
+        self.emails = snapshot.strings(self.section, "email")
+
+    def _key_column(self):
+        return self.key_strings
+
+    def _loaded(self, key, value):
+        # розпакований запис має повідомляти індекс про свої зміни
+        if self._contact_index is not None:
+            self._contact_index.bind(key, value)
+
+    @property
+    def contact_index(self) -> ContactIndex:
+        """
+        Індекси телефонів, email та днів народження будуються з колонок
+        при першому зверненні, далі їх підтримують Record та AddressBook
+        """
+        if self._contact_index is None:
+            index = ContactIndex()
+            for row in self.live_rows():
+                key = self.key_strings[row]
+                for i in range(self.phone_start[row], self.phone_start[row + 1]):
+                    index.add_phone(key, self.phones[i])
+                email = self.emails[row]
+                if email:
+                    index.add_email(key, email)
+                if self.birthdays[row]:
+                    index.add_birthday(key, date.fromordinal(self.birthdays[row]))
+            for key, record in list(self.overlay.items()):
+                index.add_record(key, record)
+            self._contact_index = index
+        return self._contact_index
+
+
+class ColumnarNotes(ColumnarTable):
+    """Нотатки з колонок знімка"""
+
+    section = "notes"
+
+    def __init__(self, snapshot: ColumnarSnapshot):
+        self._tag_index: TagIndex | None = None
+        super().__init__(snapshot)
+
+    def _open_columns(self, snapshot: ColumnarSnapshot):
+        self.ids = snapshot.column(self.section, "id")
+        created = snapshot.column(self.section, "created")
+        modified = snapshot.column(self.section, "modified")
+        # Дати знімка попередньої версії (timestamp()) не читаються, а беруться з записів
+        if created.format == "q":
+            self.created, self.modified = created, modified
+        else:
+            self.created = self.modified = None
+        self.tag_start = snapshot.column(self.section, "tag_start")
+        self.tag_ids = snapshot.column(self.section, "tag_ids")
+        self.tags = snapshot.strings(self.section, "tags")
+        self.tag_names = [self.tags[i] for i in range(len(self.tags))]
+
+    def _key_column(self):
+        return self.ids
+
+    def row_tags(self, row: int) -> List[str]:
+        """Теги рядка знімка"""
+        return [
+            self.tag_names[self.tag_ids[i]]
+            for i in range(self.tag_start[row], self.tag_start[row + 1])
+        ]
+
+    @property
+    def tag_index(self) -> TagIndex:
+        """
+        Індекс тегів будується з колонки tag_ids при першому зверненні,
+        далі його підтримує NotesBook
+        """
+        if self._tag_index is None:
+            index = TagIndex({})
+            for row in self.live_rows():
+                for tag in self.row_tags(row):
+                    index.add_tag(self.ids[row], tag)
+            for record in list(self.overlay.values()):
+                index.add_record_to_index(record)
+            self._tag_index = index
+        return self._tag_index
+
+    def sort_values(self) -> Dict[str, List[Tuple[int, int]]] | None:
+        """
+        Пари (значення, id) для відсортованих індексів NotesBook за колонками id,
+        created та modified: рядки знімка читаються з колонок без розпакування,
+        записи з overlay -- як є. None для знімка попередньої версії.
+        """
+        if self.created is None:
+            return None
+        rows = list(self.live_rows())
+        records = list(self.overlay.values())
+        columns = {"id": self.ids, "created": self.created, "modified": self.modified}
+        return {
+            name: [(columns[name][row], self.ids[row]) for row in rows] + [(value(record), record.id) for record in records]
+            for name, value in SORTED_COLUMNS.items()
+        }
+
+    def last_key(self) -> int | None:
+        """Повертає найбільший id нотатки"""
+        last = max(self.overlay, default=None)
+        for row in range(self.count - 1, -1, -1):
+            if self.ids[row] not in self.deleted:
+                return max(self.ids[row], last) if last is not None else self.ids[row]
+        return last
+
+
+class ColumnarStorage(PickleStorage):
+    """
+    Рушій зберігання: колонковий знімок, відкритий через mmap, плюс журнал змін.
+    При першому запуску знімок будується з pickle-довідника, якщо він є.
+    """
+
+    # Згортання перемикає секції на новий знімок, тож читання чекають на фоновий запис
+    reads_during_flush = False
+
+    def __init__(self, path: pathlib.Path, legacy_path: pathlib.Path | None = None):
+        super().__init__(path, path.with_name(path.name + ".journal"))
+        self.legacy_path = legacy_path
+        self.snapshot: ColumnarSnapshot | None = None
+
+    def read_snapshot(self) -> Dict:
+        """Відкриває знімок і повертає словник секцій поверх нього"""
+        with self.lock:
+            if not self.path.exists():
+                legacy = {}
+                if self.legacy_path is not None and self.legacy_path.exists():
+                    journal = Journal(self.legacy_path.with_suffix(".journal"))
+                    legacy = read_dict(self.legacy_path, journal)
+                write_columnar(self.path, legacy)
+
+        # Словник, прочитаний раніше, застаріває разом зі своїм знімком
+        if self.snapshot is not None:
+            self.snapshot.close()
+        snapshot = self.snapshot = ColumnarSnapshot(self.path)
+        self.generation = snapshot.generation
+        return {
+            "contacts": ColumnarContacts(snapshot),
+            "notes": ColumnarNotes(snapshot),
+        }
+
+    def write_snapshot(self):
+        """Записує новий знімок і перемикає на нього секції"""
+        write_columnar(self.path, self.dictionary, self.generation, self._close_snapshot)
+        snapshot = self.snapshot = ColumnarSnapshot(self.path)
+        for table in self.dictionary.values():
+            table.reopen(snapshot)
+
+    def _close_snapshot(self):
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+    def close(self):
+        """Як PickleStorage.close, а потім закриває знімок"""
+        super().close()
+        self._close_snapshot()
@@ -0,0 +1,57 @@
+"""Module for command line auto-completion of commands and contact names"""
+from __future__ import annotations
+
+import shlex
+from collections.abc import Iterable
+from typing import Callable
+from typing import List
+
+from prompt_toolkit.completion import Completer
+from prompt_toolkit.completion import Completion
+
+# Скільки імен пропонувати за одне натискання клавіші
+COMPLETION_LIMIT = 50
+
+
+class CommandCompleter(Completer):
+    """
+    Completes the command name in the first word and the contact name
+    in the first argument of commands that take a name.
+    names -- function returning names starting with a prefix (up to a limit)
+    """
+
+    def __init__(
+        self,
+        commands: Iterable[str],
+        name_commands: Iterable[str],
+        names: Callable[[str, int], List[str]],
+    ):
+        self.commands = list(commands)
+        self.name_commands = set(name_commands)
+        self.names = names
+
+    def get_completions(self, document, complete_event):
+        text = document.text_before_cursor.lstrip()
+        command, separator, argument = text.partition(" ")
+        if not separator:
+            for name in self.commands:
+                if name.startswith(command.lower()):
+                    yield Completion(name, start_position=-len(command))
+            return
+
+        if command.lower() not in self.name_commands:
+            return
+        argument = argument.lstrip()
+        prefix = argument
+        if argument[:1] in ("'", '"'):
+            prefix = argument[1:]
+            # Ім'я в лапках вже закрите, отже курсор на наступному аргументі
+            if argument[0] in prefix:
+                return
+        elif " " in argument:
+            return
+
+        for name in self.names(prefix, COMPLETION_LIMIT):
+            yield Completion(
+                shlex.quote(name), start_position=-len(argument), display=name
+            )
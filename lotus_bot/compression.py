@@ -0,0 +1,230 @@
+"""Module for compressed sections of the snapshot and compressed journal frames"""
+from __future__ import annotations
+
+import pickle
+import struct
+from typing import Any
+from typing import BinaryIO
+from typing import Callable
+from typing import Dict
+from typing import Set
+from typing import Tuple
+
+# Знімок із секціями: MAGIC, далі для кожної секції FRAME (довжини назви,
+# назви кодека та даних), назва, кодек і стиснений pickle значення секції
+MAGIC = b"LOTUSZ1\n"
+FRAME = struct.Struct("<HHQ")
+
+# Розмір частини, якою дані подаються кодеку при розпакуванні
+CHUNK_SIZE = 64 * 1024
+
+# Кадри журналу, менші за це (у байтах), не стискаються: виграш менший за накладні витрати
+PACK_MIN_SIZE = 512
+
+# Секція знімка: (назва кодека, стиснений pickle значення)
+Frame = Tuple[str, bytes]
+
+
+class Writer:
+    """Файловий об'єкт для pickle.dump, що стискає дані частинами в пам'ять"""
+
+    def __init__(self, compressor):
+        self.compressor = compressor
+        self.chunks = []
+
+    def write(self, data) -> int:
+        chunk = self.compressor.compress(data)
+        if chunk:
+            self.chunks.append(chunk)
+        return len(data)
+
+    def payload(self) -> bytes:
+        """Завершує стиснення і повертає всі стиснені дані"""
+        self.chunks.append(self.compressor.flush())
+        return b"".join(self.chunks)
+
+
+class Reader:
+    """Файловий об'єкт для pickle.load, що розпаковує стиснені дані частинами"""
+
+    def __init__(self, decompressor, payload: bytes):
+        self.decompressor = decompressor
+        self.payload = memoryview(payload)
+        self.offset = 0
+        self.buffer = bytearray()
+
+    def _fill(self) -> bool:
+        if self.offset >= len(self.payload):
+            return False
+        start = self.offset
+        end = start + CHUNK_SIZE
+        chunk = self.payload[start:end]
+        self.offset += len(chunk)
+        self.buffer += self.decompressor.decompress(chunk)
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while (size < 0 or len(self.buffer) < size) and self._fill():
+            pass
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def readline(self) -> bytes:
+        while self.buffer.find(b"\n") < 0 and self._fill():
+            pass
+        end = self.buffer.find(b"\n")
+        return self.read(end + 1 if end >= 0 else -1)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+class Codec:
+    """
+    Кодек стиснення: compressor() та decompressor() створюють потокові
+    об'єкти з методами compress/flush та decompress (як у zlib і lzma)
+    """
+
+    def __init__(self, name: str, compressor: Callable[[], Any], decompressor: Callable[[], Any]):
+        self.name = name
+        self.compressor = compressor
+        self.decompressor = decompressor
+
+    def encode(self, value: Any) -> bytes:
+        """Стискає pickle значення, не тримаючи в пам'яті нестиснений pickle цілком"""
+        writer = Writer(self.compressor())
+        pickle.dump(value, writer, pickle.HIGHEST_PROTOCOL)
+        return writer.payload()
+
+    def decode(self, payload: bytes) -> Any:
+        """Розпаковує значення, стиснене encode()"""
+        return pickle.load(Reader(self.decompressor(), payload))
+
+    def compress(self, data: bytes) -> bytes:
+        """Стискає байти"""
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, payload: bytes) -> bytes:
+        """Розпаковує байти, стиснені compress()"""
+        return self.decompressor().decompress(payload)
+
+
+def _zlib(level: int | None) -> Codec:
+    import zlib
+
+    return Codec("zlib", lambda: zlib.compressobj(1 if level is None else level), zlib.decompressobj)
+
+
+def _lzma(level: int | None) -> Codec:
+    import lzma
+
+    return Codec("lzma", lambda: lzma.LZMACompressor(preset=0 if level is None else level), lzma.LZMADecompressor)
+
+
+# Фабрики кодеків за назвою; фабрика отримує рівень стиснення або None
+CODECS: Dict[str, Callable[[int | None], Codec]] = {
+    "zlib": _zlib,
+    "lzma": _lzma,
+}
+
+
+def register_codec(name: str, factory: Callable[[int | None], Codec]):
+    """Додає кодек name, який можна вибрати через LOTUS_COMPRESSION"""
+    CODECS[name] = factory
+
+
+def get_codec(spec: str | None) -> Codec | None:
+    """
+    Повертає кодек за описом "назва" або "назва:рівень" (zlib:6, lzma:0);
+    None для "none" чи порожнього опису -- без стиснення
+    """
+    if not spec or spec == "none":
+        return None
+    name, _, level = spec.partition(":")
+    if name not in CODECS:
+        raise ValueError(f"Unknown compression codec: {name}")
+    return CODECS[name](int(level) if level else None)
+
+
+class Packed:
+    """
+    Стиснене значення кадру журналу. Розпаковується самим pickle.load
+    (через unpack), тож читачі журналу бачать звичайні кадри
+    """
+
+    def __init__(self, codec: str, payload: bytes):
+        self.codec = codec
+        self.payload = payload
+
+    def __reduce__(self):
+        return unpack, (self.codec, self.payload)
+
+
+def unpack(codec: str, payload: bytes) -> Any:
+    """Розпаковує значення Packed"""
+    return get_codec(codec).decode(payload)
+
+
+def pack_frame(frame: Tuple[str, Any, Any], codec: Codec | None) -> bytes:
+    """Pickle кадру журналу; великі значення стискаються кодеком, якщо це зменшує кадр"""
+    data = pickle.dumps(frame, pickle.HIGHEST_PROTOCOL)
+    section, key, value = frame
+    if codec is None or value is None or len(data) < PACK_MIN_SIZE:
+        return data
+    packed = pickle.dumps((section, key, Packed(codec.name, codec.encode(value))), pickle.HIGHEST_PROTOCOL)
+    return packed if len(packed) < len(data) else data
+
+
+def write_sections(f: BinaryIO, dictionary: Dict[str, Any], codec: Codec, frames: Dict[str, Frame] | None = None, dirty: Set[str] | None = None):
+    """
+    Записує словник у f секціями, кожна стиснена окремо.
+    frames -- стиснені секції попереднього запису: секції, яких нема в dirty,
+    записуються з них без повторного стиснення. Після запису frames містить
+    секції щойно записаного знімка.
+    """
+    written = {}
+    for section, value in dictionary.items():
+        frame = frames.get(section) if frames is not None and dirty is not None and section not in dirty else None
+        if frame is None or frame[0] != codec.name:
+            frame = (codec.name, codec.encode(value))
+        written[section] = frame
+    f.write(MAGIC)
+    for section, (name, payload) in written.items():
+        section_bytes = section.encode("utf-8")
+        name_bytes = name.encode("ascii")
+        f.write(FRAME.pack(len(section_bytes), len(name_bytes), len(payload)))
+        f.write(section_bytes)
+        f.write(name_bytes)
+        f.write(payload)
+    if frames is not None:
+        frames.clear()
+        frames.update(written)
+
+
+def read_sections(f: BinaryIO, frames: Dict[str, Frame] | None = None) -> Dict[str, Any]:
+    """
+    Читає знімок із секціями або звичайний pickle-знімок.
+    Стиснені секції зберігаються у frames, щоб наступний запис міг їх повторно використати.
+    """
+    if f.read(len(MAGIC)) != MAGIC:
+        f.seek(0)
+        return pickle.load(f)
+    dictionary = {}
+    while True:
+        head = f.read(FRAME.size)
+        if not head:
+            break
+        section_size, name_size, payload_size = FRAME.unpack(head)
+        section = f.read(section_size).decode("utf-8")
+        name = f.read(name_size).decode("ascii")
+        payload = f.read(payload_size)
+        dictionary[section] = get_codec(name).decode(payload)
+        if frames is not None:
+            frames[section] = (name, payload)
+    return dictionary
@@ -1,19 +1,36 @@
 """Module for address book with phones and birthdays for contacts"""
 from __future__ import annotations
 
+import bisect
+import calendar
+from collections import OrderedDict
 from collections import UserDict
+from collections.abc import Iterable
+from collections.abc import Iterator
+from datetime import date
 from datetime import datetime
 from datetime import timedelta
+from itertools import chain
 from typing import Dict
+from typing import List
+from typing import Set
+from typing import Tuple
 
 from lotus_bot.field import Field
+from lotus_bot.ordering import SortedIndex
 from lotus_bot.verification_email import is_valid_email
 from lotus_bot.verification_phone_number import is_valid_ukrainian_phone
 
+# Скільки днів (кошиків) кеш привітань тримає: вистачає на вікно в рік,
+# а сервер, що працює роками, не накопичує всі дати, за які питали
+CONGRATULATIONS_CACHE_SIZE = 1024
+
 
 class Name(Field):
     """Class for name field"""
 
+    __slots__ = ()
+
     def __str__(self):
         return self.value
 
@@ -21,6 +38,8 @@ class Name(Field):
 class Phone(Field):
     """Class for Phone field"""
 
+    __slots__ = ()
+
     def __init__(self, phone: str, info: str):
         phone = phone.strip()
         if not is_valid_ukrainian_phone(phone):
@@ -33,16 +52,30 @@ class Phone(Field):
         return f"{self.value[0]}{':' + self.value[1] if self.value[1] else ''} "
 
 
-class Phones(UserDict):
+class Phones(dict):
     """Class for Phone field"""
 
+    __slots__ = ()
+
+    @property
+    def data(self) -> Dict[str, Phone]:
+        """The phones themselves (kept for the former UserDict interface)"""
+        return self
+
+    def __setstate__(self, state):
+        # Pickles made while Phones was a UserDict keep phones in state["data"]
+        if state:
+            self.update(state["data"])
+
     def __str__(self):
-        return " ".join([f"{v}" for v in self.data.values()])
+        return " ".join([f"{v}" for v in self.values()])
 
 
 class Birthday(Field):
     """Class for Birthday field"""
 
+    __slots__ = ()
+
     def __init__(self, value):
         try:
             super().__init__(datetime.strptime(value, "%d.%m.%Y").date())
@@ -56,6 +89,8 @@ class Birthday(Field):
 class Email(Field):
     """Class for email field"""
 
+    __slots__ = ()
+
     def __init__(self, email: str):
         email = email.strip()
         if not is_valid_email(email):
@@ -69,6 +104,8 @@ class Email(Field):
 class Address(Field):
     """Class for address field"""
 
+    __slots__ = ()
+
     def __init__(self, address: str):
         address = address.strip()
         super().__init__(address)
@@ -80,6 +117,8 @@ class Address(Field):
 class Record:
     """Class for an Address Book record"""
 
+    __slots__ = ("name", "phones", "birthday", "email", "address", "_index", "_key", "_version", "__weakref__")
+
     def __init__(self, name: str):
         name = name.strip()
         self.name: Name = Name(name)
@@ -87,26 +126,62 @@ class Record:
         self.birthday: Birthday | None = None
         self.email: Email | None = None
         self.address: Address | None = None
+        # Індекс книги, в яку додано запис, та ключ запису в ній
+        self._index: ContactIndex | None = None
+        self._key: str | None = None
+        # Лічильник змін запису: кеші (як-от рядки таблиць) порівнюють його зі своїм
+        self._version = 0
+
+    def __getstate__(self):
+        # Індекс належить книзі, тому не зберігається разом із записом
+        return {
+            "name": self.name,
+            "phones": self.phones,
+            "birthday": self.birthday,
+            "email": self.email,
+            "address": self.address,
+        }
+
+    def __setstate__(self, state):
+        # Старі знімки зберігали запис як __dict__, тож ключі збігаються
+        for slot in self.__slots__:
+            if slot != "__weakref__":
+                setattr(self, slot, None)
+        self._version = 0
+        for attr, value in state.items():
+            if attr in self.__slots__ and not attr.startswith("_"):
+                setattr(self, attr, value)
 
     def add_phone(self, phone: str, info: str):
         """Adds phone and additional info to the Record"""
 
         phone = phone.strip()
         self.phones.data[phone] = Phone(phone, info)
+        self._version += 1
+        if self._index is not None:
+            self._index.add_phone(self._key, phone)
 
     def remove_phone(self, phone: str):
         """Removes phone from the Record"""
 
         phone = phone.strip()
         del self.phones.data[phone]
+        self._version += 1
+        if self._index is not None:
+            self._index.remove_phone(self._key, phone)
 
     def edit_phone(self, old_phone: str, new_phone: str, info: str):
         """Changes phone in the Record from old_phone to new_phone"""
 
         old_phone = old_phone.strip()
         new_phone = new_phone.strip()
+        phone = Phone(new_phone, info)
         del self.phones.data[old_phone]
-        self.phones.data[new_phone] = Phone(new_phone, info)
+        self.phones.data[new_phone] = phone
+        self._version += 1
+        if self._index is not None:
+            self._index.remove_phone(self._key, old_phone)
+            self._index.add_phone(self._key, new_phone)
 
     def find_phone(self, phone: str) -> Phone | None:
         """Finds phone in the Record and returns it, if not found returns None"""
@@ -118,31 +193,214 @@ class Record:
         """Adds birthday to the Record"""
 
         birthday = birthday.strip()
+        old_birthday = self.birthday
         self.birthday = Birthday(birthday)
+        self._version += 1
+        if self._index is not None:
+            if old_birthday is not None:
+                self._index.remove_birthday(self._key, old_birthday.value)
+            self._index.add_birthday(self._key, self.birthday.value)
 
     def add_email(self, email: str):
         email = email.strip()
+        old_email = self.email
         self.email = Email(email)
+        self._version += 1
+        if self._index is not None:
+            if old_email is not None:
+                self._index.remove_email(self._key, old_email.value)
+            self._index.add_email(self._key, email)
 
     def add_address(self, address: str):
         address = address.strip()
         self.address = Address(address)
+        self._version += 1
 
     def __str__(self):
         return f"Contact name: {self.name}, phones: {self.phones}, birthday: {self.birthday}, email: {self.email}, address: {self.address}"
 
 
+class ContactIndex:
+    """
+    Secondary hash indexes phone -> keys and email -> keys of Records
+    and calendar buckets (month, day) -> keys for birthdays.
+    Keeps sets of keys, so the same phone on two contacts is detected in O(1).
+    Records added to the index report their changes back to it.
+    """
+
+    def __init__(self):
+        self.phones: Dict[str, Set[str]] = {}
+        self.emails: Dict[str, Set[str]] = {}
+        self.birthdays: Dict[Tuple[int, int], Set[str]] = {}
+        # Версія кошика змінюється з кожною зміною днів народження в ньому
+        self.birthday_versions: Dict[Tuple[int, int], int] = {}
+        # Дні народження за датою, будується при першому сортуванні за ними
+        self.birthday_order: SortedIndex | None = None
+
+    def bind(self, key: str, record: Record):
+        """Makes record report its changes to the index"""
+        record._index = self
+        record._key = key
+
+    def add_record(self, key: str, record: Record):
+        """Indexes all phones and email of the record"""
+        self.bind(key, record)
+        for phone in record.phones.data:
+            self.add_phone(key, phone)
+        if record.email is not None:
+            self.add_email(key, record.email.value)
+        if record.birthday is not None:
+            self.add_birthday(key, record.birthday.value)
+
+    def remove_record(self, key: str, record: Record):
+        """Removes all phones and email of the record from the index"""
+        for phone in record.phones.data:
+            self.remove_phone(key, phone)
+        if record.email is not None:
+            self.remove_email(key, record.email.value)
+        if record.birthday is not None:
+            self.remove_birthday(key, record.birthday.value)
+        record._index = None
+        record._key = None
+
+    def add_phone(self, key: str, phone: str):
+        self.phones.setdefault(phone, set()).add(key)
+
+    def remove_phone(self, key: str, phone: str):
+        _discard(self.phones, phone, key)
+
+    def add_email(self, key: str, email: str):
+        self.emails.setdefault(email, set()).add(key)
+
+    def remove_email(self, key: str, email: str):
+        _discard(self.emails, email, key)
+
+    def add_birthday(self, key: str, birthday: date):
+        bucket = (birthday.month, birthday.day)
+        self.birthdays.setdefault(bucket, set()).add(key)
+        self.birthday_versions[bucket] = self.birthday_versions.get(bucket, 0) + 1
+        if self.birthday_order is not None:
+            self.birthday_order.add(key, birthday)
+
+    def remove_birthday(self, key: str, birthday: date):
+        bucket = (birthday.month, birthday.day)
+        _discard(self.birthdays, bucket, key)
+        self.birthday_versions[bucket] = self.birthday_versions.get(bucket, 0) + 1
+        if self.birthday_order is not None:
+            self.birthday_order.remove(key)
+
+    def keys_by_phone(self, phone: str) -> Set[str]:
+        """Returns keys of Records having the phone"""
+        return self.phones.get(phone, set())
+
+    def keys_by_email(self, email: str) -> Set[str]:
+        """Returns keys of Records having the email"""
+        return self.emails.get(email, set())
+
+    def keys_by_birthday(self, month: int, day: int) -> Set[str]:
+        """Returns keys of Records born on the day of the month"""
+        return self.birthdays.get((month, day), set())
+
+    def birthday_version(self, month: int, day: int) -> int | None:
+        """Returns version of the (month, day) bucket, it changes with the bucket"""
+        return self.birthday_versions.get((month, day), 0)
+
+
+class NameIndex:
+    """
+    Prefix index over Record keys (normalized names).
+    Keeps the keys in a sorted list, so all keys starting with a prefix
+    are a contiguous run found by bisect in O(log n + matches).
+    """
+
+    def __init__(self, keys: Iterable[str] = ()):
+        self.keys: List[str] = sorted(keys)
+
+    def add(self, key: str):
+        """Adds key to the index"""
+        position = bisect.bisect_left(self.keys, key)
+        if position == len(self.keys) or self.keys[position] != key:
+            self.keys.insert(position, key)
+
+    def remove(self, key: str):
+        """Removes key from the index"""
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            del self.keys[position]
+
+    def ordered(self, reverse: bool = False) -> Iterator[str]:
+        """Returns all keys in alphabetical (or reversed) order"""
+        return iter(reversed(self.keys) if reverse else self.keys)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def starting_with(self, prefix: str, limit: int | None = None) -> List[str]:
+        """Returns up to limit keys starting with prefix in alphabetical order"""
+        result = []
+        for position in range(bisect.bisect_left(self.keys, prefix), len(self.keys)):
+            key = self.keys[position]
+            if not key.startswith(prefix) or len(result) == limit:
+                break
+            result.append(key)
+        return result
+
+
+def _merge(record: Record, other: Record):
+    """Adds phones of other to record and takes its email, birthday and address"""
+    record.phones.update(other.phones)
+    for field in ("email", "birthday", "address"):
+        value = getattr(other, field)
+        if value is not None:
+            setattr(record, field, value)
+    record._version += 1
+
+
+def _discard(index: Dict, value, key: str):
+    keys = index.get(value)
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del index[value]
+
+
 class AddressBook(UserDict):
     """Class representing Address Book"""
 
     def __init__(self, dictionary: Dict[str, Record]):
         self.data = dictionary
+        # Кеш рядків привітань: (кошик, день) -> (версія кошика, рядки),
+        # найдавніше використані записи витісняються (LRU)
+        self._congratulations: OrderedDict = OrderedDict()
+        # Сховище може мати власний індекс (наприклад, SQLite)
+        self.index = getattr(dictionary, "contact_index", None)
+        if self.index is None:
+            self.index = ContactIndex()
+            for key, record in dictionary.items():
+                self.index.add_record(key, record)
+        # Префіксний індекс імен будується при першому зверненні
+        self._name_index: NameIndex | None = None
+
+    @property
+    def name_index(self) -> NameIndex:
+        """Prefix index over normalized names"""
+        if self._name_index is None:
+            self._name_index = getattr(self.data, "name_index", None) or NameIndex(
+                self.data.keys()
+            )
+        return self._name_index
 
     def add_record(self, name: str, record: Record):
         """Adds new Record to the Address Book"""
 
         name = name.strip().lower()
+        old_record = self.data.get(name, None)
+        if old_record is not None and old_record is not record:
+            self.index.remove_record(name, old_record)
         self.data[name] = record
+        self.index.add_record(name, record)
+        if old_record is None and self._name_index is not None:
+            self._name_index.add(name)
 
     def find_record(self, name: str) -> Record | None:
         """Finds and returns Record in the Address Book by name"""
@@ -150,80 +408,206 @@ class AddressBook(UserDict):
         name = name.strip().lower()
         return self.data.get(name, None)
 
+    def find_records_starting_with(self, prefix: str, limit: int | None = None) -> List[Record]:
+        """Returns up to limit Records whose name starts with prefix, ordered by name"""
+
+        prefix = prefix.lstrip().lower()
+        return [self.data[key] for key in self.name_index.starting_with(prefix, limit)]
+
+    def sorted_keys(self, column: str, reverse: bool = False) -> Iterator[str] | None:
+        """
+        Returns keys ordered by column (name or birthday) from a sorted index,
+        so a sorted listing is a walk instead of a sort. Records without
+        a birthday go first, as with ordering.sort_key.
+        Returns None if the column has no sorted index.
+        """
+        column = column.casefold()
+        if column == "name":
+            return self.name_index.ordered(reverse)
+        if column != "birthday" or not hasattr(self.index, "birthday_order"):
+            return None
+
+        if self.index.birthday_order is None:
+            self.index.birthday_order = SortedIndex(
+                (record.birthday.value, key)
+                for key, record in self.data.items()
+                if record.birthday is not None
+            )
+        order = self.index.birthday_order
+        without_birthday = (k for k in self.name_index.ordered(reverse) if k not in order)
+        if reverse:
+            return chain(order.ordered(reverse), without_birthday)
+        return chain(without_birthday, order.ordered(reverse))
+
     def find_record_by_phone(self, phone: str) -> Record | None:
         """Finds and returns Record in the Address Book by phone"""
 
-        for (k, v) in self.data.items():
-            if phone in v.phones:
-                return self.data.get(k, None)
+        for key in self.index.keys_by_phone(phone.strip()):
+            return self.data.get(key, None)
         return None
 
     def find_record_by_email(self, email: str) -> Record | None:
         """Finds and returns Record in the Address Book by email"""
 
-        for (k, v) in self.data.items():
-            if v.email is not None and email == v.email.value:
-                return self.data.get(k, None)
+        for key in self.index.keys_by_email(email.strip()):
+            return self.data.get(key, None)
         return None
 
+    def find_phone_owners(self, phone: str, name: str = "") -> List[str]:
+        """Returns keys of other Records already having the phone"""
+
+        name = name.strip().lower()
+        return sorted(k for k in self.index.keys_by_phone(phone.strip()) if k != name)
+
+    def find_email_owners(self, email: str, name: str = "") -> List[str]:
+        """Returns keys of other Records already having the email"""
+
+        name = name.strip().lower()
+        return sorted(k for k in self.index.keys_by_email(email.strip()) if k != name)
+
+    def import_records(self, records: Iterable[Record], chunk_size: int = 1000) -> int:
+        """
+        Adds many Records at once and returns their number.
+        Records are written to the book chunk by chunk, a Record with an existing
+        name is merged into the old one. Phone, email and birthday indexes are
+        updated on the way, the name index and the congratulations cache are
+        rebuilt once afterwards.
+        """
+        count = 0
+        chunk: Dict[str, Record] = {}
+        for record in records:
+            key = record.name.value.lower()
+            old_record = chunk.get(key) or self.data.get(key, None)
+            if old_record is not None:
+                self.index.remove_record(key, old_record)
+                _merge(old_record, record)
+                record = old_record
+            self.index.add_record(key, record)
+            chunk[key] = record
+            count += 1
+            if len(chunk) >= chunk_size:
+                self.data.update(chunk)
+                chunk = {}
+        self.data.update(chunk)
+        self._name_index = None
+        self._congratulations.clear()
+        return count
+
     def remove_record(self, name: str):
         """Removes Record from the Address Book by name"""
 
         name = name.strip().lower()
+        self.index.remove_record(name, self.data[name])
         del self.data[name]
+        if self._name_index is not None:
+            self._name_index.remove(name)
+
+    def apply_change(self, key: str, record: Record | None):
+        """
+        Applies a change committed by another process: record is the new
+        state of the key or None if it was removed. Indexes are updated,
+        the storage is not written to.
+        """
+        if record is None:
+            if key in self.data:
+                self.remove_record(key)
+        else:
+            self.add_record(key, record)
+
+    def get_birthdays_between(self, start: date, end: date) -> List[Tuple[date, Record]]:
+        """
+        Returns (birthday, Record) pairs for birthdays from start to end
+        inclusive ordered by date. Costs O(days in window + matches).
+        """
+        result = []
+        for day in _days_between(start, end):
+            for month, month_day in _celebrated_on(day):
+                for key in sorted(self.index.keys_by_birthday(month, month_day)):
+                    result.append((day, self.data[key]))
+        return result
+
+    def get_congratulations(self, start: date, end: date, once: bool = False) -> str:
+        """
+        Returns string with congratulation dates for birthdays from start to end.
+        Lines are cached per day until a birthday in the day bucket changes.
+        once -- congratulate each contact only on the first birthday in the window
+        """
+        lines = []
+        seen = set()
+        for day in _days_between(start, end):
+            for bucket in _celebrated_on(day):
+                for key, line in self._congratulation_lines(bucket, day):
+                    if once:
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                    lines.append(line)
+        return "\n".join(lines)
+
+    def _congratulation_lines(self, bucket: Tuple[int, int], day: date) -> List[Tuple[str, str]]:
+        version = self.index.birthday_version(*bucket)
+        cached = self._congratulations.get((bucket, day))
+        if version is not None and cached is not None and cached[0] == version:
+            self._congratulations.move_to_end((bucket, day))
+            return cached[1]
+
+        # Якщо день народження у вихідний, вітаємо в понеділок
+        congratulation_date = day
+        if congratulation_date.weekday() > 4:
+            congratulation_date += timedelta(days=7 - congratulation_date.weekday())
+        text_date = congratulation_date.strftime("%d.%m.%Y")
+        lines = [
+            (key, f"{self.data[key].name}: congratulation date: {text_date}")
+            for key in sorted(self.index.keys_by_birthday(*bucket))
+        ]
+        if version is not None:
+            self._congratulations[(bucket, day)] = (version, lines)
+            self._congratulations.move_to_end((bucket, day))
+            if len(self._congratulations) > CONGRATULATIONS_CACHE_SIZE:
+                self._congratulations.popitem(last=False)
+        return lines
 
     def get_upcoming_birthdays(self, n_day: int = 7):
-        """Returns string representing list of Records whome to congratulate in next 7 days"""
-        # Функція перевіряє чи дата потрапляє в потрібний інтервал дат
-        def birthday_in_interval(record: Record, n_day) -> bool:
-            if record.birthday:
-                today = datetime.today()
-                year = today.year
-                month = record.birthday.value.month
-                day = record.birthday.value.day
-
-                birthday = datetime(year, month, day)
-                delta = (birthday - today).days
-                if delta < n_day and delta >= 0:
-                    return True
-                birthday = datetime(year + 1, month, day)
-                delta = (birthday - today).days
-                if delta < n_day and delta >= 0:
-                    return True
-                return False
-
-            else:
-                return False
-
-        # Функція створює рядок привітання (при потребі зсуває дату на понеділок)
-        def make_congratulation_date(record: Record):
-
-            if record.birthday:
-                today = datetime.today()
-                year = today.year
-                month = record.birthday.value.month
-                day = record.birthday.value.day
-
-                congratulation_date = datetime(year, month, day)
-                if congratulation_date < today:
-                    congratulation_date = datetime(year + 1, month, day)
-
-                if congratulation_date.weekday() > 4:
-                    congratulation_date += timedelta(
-                        days=7 - congratulation_date.weekday()
-                    )
-                return f"{record.name}: congratulation date: {congratulation_date.strftime('%d.%m.%Y')}"
-            else:
-                return ""
-
-        # Формуємо список привітань на наступні n_day днів
-        return "\n".join(
-            [
-                make_congratulation_date(record)
-                for record in self.data.values()
-                if birthday_in_interval(record, n_day)
-            ]
+        """Returns string representing list of Records whome to congratulate in next n_day days"""
+
+        # Сьогоднішні дні народження вважаються вже минулими, як і раніше;
+        # за рік кожен контакт вітаємо не більше одного разу
+        today = date.today()
+        n_day = min(n_day, 366)
+        return self.get_congratulations(
+            today + timedelta(days=1), today + timedelta(days=n_day), once=True
         )
 
+    def index_sizes(self) -> Dict[str, int]:
+        """
+        Returns the number of entries of every in-memory index built so far.
+        Indexes kept by the storage (e.g. SQLite) are not counted.
+        """
+        sizes = {}
+        for name in ("phones", "emails", "birthdays"):
+            entries = getattr(self.index, name, None)
+            if isinstance(entries, dict):
+                sizes[name] = len(entries)
+        if getattr(self.index, "birthday_order", None) is not None:
+            sizes["birthday order"] = len(self.index.birthday_order)
+        if isinstance(self._name_index, NameIndex):
+            sizes["names"] = len(self._name_index)
+        return sizes
+
     def __str__(self):
         return "\n".join(str(rec) for rec in self.data.values())
+
+
+def _days_between(start: date, end: date) -> Iterator[date]:
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def _celebrated_on(day: date) -> List[Tuple[int, int]]:
+    """Returns (month, day) buckets celebrated on the day, 29.02 moves to 28.02 in non-leap years"""
+    buckets = [(day.month, day.day)]
+    if day.month == 2 and day.day == 28 and not calendar.isleap(day.year):
+        buckets.append((2, 29))
+    return buckets
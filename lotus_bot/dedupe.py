@@ -0,0 +1,262 @@
+"""Module for finding and merging duplicate contacts"""
+from __future__ import annotations
+
+import re
+from collections.abc import Iterable
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Set
+from typing import Tuple
+
+from lotus_bot.contacts import AddressBook
+from lotus_bot.contacts import Record
+from lotus_bot.search import trigrams
+
+# Блоки, більші за це, пропускаються: такий ключ нічого не розрізняє (номер офісу,
+# спільний для десятків контактів), а попарне порівняння в нечітких блоках квадратичне
+MAX_BLOCK = 10
+
+# Найменша схожість імен (частка спільних трійок), за якої збіг фонетичного ключа
+# чи імені скриньки email вважається дублікатом
+SIMILAR_NAME = 0.75
+SIMILAR_NAME_WITH_EMAIL = 0.4
+
+WORD_PATTERN = re.compile(r"\w+")
+# Літера (код), за якою йде така сама: видаляється, щоб подвоєні літери (коди) стали одинарними
+REPEATED_LETTER = re.compile(r"([^\W\d])(?=\1)")
+REPEATED_CODE = re.compile(r"(\d)(?=\1)")
+NOT_DIGIT = re.compile(r"\D")
+NOT_ALNUM = re.compile(r"[\W_]")
+
+# Транслітерація кирилиці (українська та російська абетки) для фонетичних ключів
+TRANSLITERATION = str.maketrans(
+    {
+        **dict(zip("абвгґдезийклмнопрстуфыэ", "abvhgdezyiklmnoprstufye")),
+        "є": "ie",
+        "ж": "zh",
+        "і": "i",
+        "ї": "i",
+        "ё": "e",
+        "х": "kh",
+        "ц": "ts",
+        "ч": "ch",
+        "ш": "sh",
+        "щ": "shch",
+        "ю": "iu",
+        "я": "ia",
+        "ъ": None,
+        "ь": None,
+        "'": None,
+        "’": None,
+    }
+)
+
+# Латинські літери, якими по-різному передають ті самі звуки (Gnatyuk -- Hnatiuk, Iwan -- Ivan)
+SPELLING = str.maketrans({"w": "v", "g": "h", "y": "i", "j": "i", "x": "ks"})
+
+# Групи приголосних, що звучать схоже (як у Soundex); голосні відкидаються,
+# а цифри замінюються великими літерами, щоб номери не змішувались з кодами
+SOUND_CODES = str.maketrans(
+    {
+        **{
+            letter: code
+            for code, letters in (("1", "bfpvw"), ("2", "cgjkqsxzh"), ("3", "dt"), ("4", "l"), ("5", "mn"), ("6", "r"))
+            for letter in letters
+        },
+        **dict.fromkeys("aeiouy"),
+        **dict(zip("0123456789", "ABCDEFGHIJ")),
+    }
+)
+
+
+def name_key(name: str) -> str:
+    """Ім'я без регістру, розділових знаків і зайвих пробілів, зі словами за абеткою"""
+    return " ".join(sorted(WORD_PATTERN.findall(name.casefold())))
+
+
+def latin_name(name: str) -> str:
+    """Ім'я в нижньому регістрі, транслітероване латиницею"""
+    return name.casefold().translate(TRANSLITERATION)
+
+
+def spelling_key(latin: str) -> str:
+    """
+    Ім'я (з latin_name) без різниці в написанні: з однаковими літерами для тих
+    самих звуків і без подвоєних літер ("Олена Коваль" і "Olena Koval" -- "koval olena")
+    """
+    return " ".join(sorted(WORD_PATTERN.findall(REPEATED_LETTER.sub("", latin.translate(SPELLING)))))
+
+
+def sound_key(latin: str) -> str:
+    """
+    Фонетичний ключ імені (з latin_name): голосні відкидаються, а схожі
+    приголосні замінюються кодом групи ("Іван Петренко" і "Iwan Petrenko" -- "13652 15")
+    """
+    return " ".join(sorted(WORD_PATTERN.findall(REPEATED_CODE.sub("", latin.translate(SOUND_CODES)))))
+
+
+def phone_key(phone: str) -> str:
+    """Телефон лише з цифр"""
+    return NOT_DIGIT.sub("", phone)
+
+
+def email_name_key(email: str) -> str:
+    """Ім'я скриньки (до @) без +мітки та розділових знаків: john.doe+work@ -> johndoe"""
+    return NOT_ALNUM.sub("", email.casefold().partition("@")[0].partition("+")[0])
+
+
+def name_similarity(grams: Set[str], other: Set[str]) -> float:
+    """Частка спільних трійок символів двох імен (коефіцієнт Жаккара)"""
+    if not grams or not other:
+        return 0.0
+    common = len(grams & other)
+    return common / (len(grams) + len(other) - common)
+
+
+class Cluster:
+    """Група ймовірних дублікатів: ключі контактів (першим -- той, що лишиться) і причини збігу"""
+
+    def __init__(self, keys: List[str], reasons: Set[str]):
+        self.keys = keys
+        self.reasons = reasons
+
+
+class Duplicates:
+    """
+    Пошук дублікатів блокуванням: кожен контакт отримує кілька ключів,
+    і порівнюються лише контакти з однаковим ключем, тож час майже лінійний.
+
+    Точні ключі (ім'я без регістру і зайвих пробілів, ім'я без різниці в написанні,
+    телефон, email) самі означають дублікат: усі контакти блоку об'єднуються
+    без попарного порівняння. Нечіткі ключі (фонетичний ключ імені, ім'я скриньки email)
+    лише дають кандидатів, що перевіряються схожістю імен за трійками символів.
+    Групи будуються через систему неперетинних множин (union-find).
+    """
+
+    def __init__(self, book: AddressBook):
+        self.book = book
+        self.parent: Dict[str, str] = {}
+        self.reasons: Dict[str, Set[str]] = {}
+        self._grams: Dict[str, Set[str]] = {}
+
+    def _find(self, key: str) -> str:
+        parent = self.parent
+        root = key
+        while parent.get(root, root) != root:
+            root = parent[root]
+        # Стискання шляху
+        while key != root:
+            parent[key], key = root, parent[key]
+        return root
+
+    def _union(self, key: str, other: str, reason: str):
+        root, other_root = self._find(key), self._find(other)
+        if root != other_root:
+            self.parent[other_root] = root
+            self.reasons.setdefault(root, set()).update(self.reasons.pop(other_root, ()), (reason,))
+        else:
+            self.reasons.setdefault(root, set()).add(reason)
+
+    def _name_grams(self, key: str) -> Set[str]:
+        grams = self._grams.get(key)
+        if grams is None:
+            name = " ".join(WORD_PATTERN.findall(latin_name(self.book.data[key].name.value)))
+            grams = self._grams[key] = trigrams(f" {name} ")
+        return grams
+
+    def _block_keys(self, record: Record) -> Iterable[Tuple[str, str]]:
+        latin = latin_name(record.name.value)
+        yield "name", name_key(record.name.value)
+        yield "spelling", spelling_key(latin)
+        for phone in record.phones.data:
+            yield "phone", phone_key(phone)
+        if record.email is not None:
+            yield "email", record.email.value.casefold()
+            local = email_name_key(record.email.value)
+            if len(local) >= 3:
+                yield "email name", local
+        yield "similar name", sound_key(latin)
+
+    def find(self) -> List[Cluster]:
+        """Повертає групи дублікатів, упорядковані за ключем першого контакту"""
+        # Для більшості ключів блок з одного контакту: список створюється лише для другого
+        first: Dict[Tuple[str, str], str] = {}
+        blocks: Dict[Tuple[str, str], List[str]] = {}
+        for key, record in self.book.data.items():
+            for block in self._block_keys(record):
+                other = first.setdefault(block, key)
+                if other is not key:
+                    keys = blocks.get(block)
+                    if keys is None:
+                        blocks[block] = [other, key]
+                    else:
+                        keys.append(key)
+
+        # Нечіткі ключі та поріг схожості імен для них
+        fuzzy = {"similar name": SIMILAR_NAME, "email name": SIMILAR_NAME_WITH_EMAIL}
+        for (reason, _), keys in blocks.items():
+            if len(keys) > MAX_BLOCK:
+                continue
+            threshold = fuzzy.get(reason)
+            if threshold is None:
+                for other in keys[1:]:
+                    self._union(keys[0], other, reason)
+            else:
+                for i, key in enumerate(keys, 1):
+                    for other in keys[i:]:
+                        if self._find(key) != self._find(other) and name_similarity(self._name_grams(key), self._name_grams(other)) >= threshold:
+                            self._union(key, other, reason)
+
+        groups: Dict[str, List[str]] = {}
+        for key in self.parent:
+            groups.setdefault(self._find(key), []).append(key)
+        clusters = []
+        for root, keys in groups.items():
+            keys = sorted(set(keys) | {root}, key=self._survivor_order)
+            clusters.append(Cluster(keys, self.reasons.get(root, set())))
+        clusters.sort(key=lambda cluster: cluster.keys[0])
+        return clusters
+
+    def _survivor_order(self, key: str) -> Tuple:
+        # Лишається контакт з найбільшою кількістю даних, далі -- з охайно записаним ім'ям
+        record = self.book.data[key]
+        filled = len(record.phones.data) + sum(getattr(record, field) is not None for field in ("email", "birthday", "address"))
+        name = record.name.value
+        tidy = name == " ".join(name.split()) and name != name.lower()
+        return (-filled, not tidy, key)
+
+
+def find_duplicates(book: AddressBook) -> List[Cluster]:
+    """Знаходить групи ймовірних дублікатів контактів книги"""
+    return Duplicates(book).find()
+
+
+def merge_cluster(book: AddressBook, cluster: Cluster, changed: Callable[[str], None] | None = None) -> List[str]:
+    """
+    Зливає контакти групи в перший: його телефони доповнюються телефонами решти,
+    а email, день народження та адреса беруться з інших, якщо їх нема.
+    Решта контактів видаляється з книги; changed(key) викликається для кожного
+    зміненого чи видаленого ключа. Повертає відкинуті значення, що суперечили збереженим
+    """
+    keep = book.data[cluster.keys[0]]
+    dropped = []
+    for key in cluster.keys[1:]:
+        record = book.data[key]
+        for phone, value in record.phones.data.items():
+            if phone not in keep.phones.data:
+                keep.add_phone(phone, value.value[1])
+        for field, setter in (("email", keep.add_email), ("birthday", keep.add_birthday), ("address", keep.add_address)):
+            value = getattr(record, field)
+            if value is None:
+                continue
+            if getattr(keep, field) is None:
+                setter(str(value))
+            elif str(getattr(keep, field)) != str(value):
+                dropped.append(f"{field} {value} of {record.name}")
+        book.remove_record(key)
+        if changed is not None:
+            changed(key)
+    if changed is not None:
+        changed(cluster.keys[0])
+    return dropped
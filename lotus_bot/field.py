@@ -5,5 +5,22 @@ from __future__ import annotations
 class Field:
     """Base class for field"""
 
+    # Поля створюються на кожен запис, тож __dict__ їм не потрібен
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
+
+    @classmethod
+    def from_value(cls, value):
+        """Створює поле з уже перевіреного значення, оминаючи перевірки __init__"""
+        field = cls.__new__(cls)
+        field.value = value
+        return field
+
+    def __getstate__(self):
+        return {"value": self.value}
+
+    def __setstate__(self, state):
+        # Старі знімки зберігали поле як __dict__ {"value": ...}
+        self.value = state["value"]
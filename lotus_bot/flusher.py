@@ -0,0 +1,94 @@
+"""Module for background (write-behind) flushing of the store"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+# Скільки секунд без нових змін чекати перед фоновим записом:
+# серія команд згортається в один запис
+FLUSH_DELAY = float(os.environ.get("LOTUS_FLUSH_DELAY", 0.5))
+
+
+class Flusher:
+    """
+    Фоновий потік, що виконує повільну частину запису сховища:
+    згортання переповненого журналу у знімок і fsync журналу.
+    Команда лише дописує свої кадри в журнал і одразу повертається.
+
+    Запис виконується через delay секунд після останньої зміни,
+    але не пізніше за fsync_interval сховища від першої незаписаної.
+    Команди виконуються під busy, тож фоновий запис не бачить книги
+    посеред зміни; сам він не чекає ні на busy, ні на замок сховища,
+    а відкладає спробу, якщо їх зайнято.
+    """
+
+    def __init__(self, storage, delay: float = FLUSH_DELAY):
+        self.storage = storage
+        self.delay = delay
+        self.max_delay = max(delay, storage.fsync_interval)
+        self.busy = threading.RLock()
+        # Помилка фонового запису, яку notify() передасть наступній команді
+        self.error: Exception | None = None
+        self._condition = threading.Condition()
+        # Час першої та останньої незаписаних змін
+        self._first: float | None = None
+        self._last = 0.0
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="lotus-flush", daemon=True)
+
+    def start(self) -> Flusher:
+        """Запускає потік і перемикає сховище на фоновий запис"""
+        self.storage.background = self.notify
+        self._thread.start()
+        return self
+
+    def notify(self):
+        """Планує фоновий запис; кидає помилку попереднього, якщо він не вдався"""
+        with self._condition:
+            now = time.monotonic()
+            if self._first is None:
+                self._first = now
+            self._last = now
+            self._condition.notify()
+        error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def stop(self):
+        """
+        Зупиняє потік, дочекавшись поточного запису, і повертає сховище
+        до синхронного запису; решту записує storage.close()
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        self.storage.background = None
+
+    def _due(self) -> float:
+        return min(self._last + self.delay, self._first + self.max_delay)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopping and (self._first is None or time.monotonic() < self._due()):
+                    self._condition.wait(None if self._first is None else self._due() - time.monotonic())
+                if self._stopping:
+                    return
+                self._first = None
+            if not self._flush():
+                # Команда чи інший процес тримає замок: повторити через delay
+                with self._condition:
+                    self._first = self._last = time.monotonic()
+
+    def _flush(self) -> bool:
+        if not self.busy.acquire(blocking=False):
+            return False
+        try:
+            return self.storage.background_flush()
+        except Exception as ex:
+            self.error = ex
+            return True
+        finally:
+            self.busy.release()
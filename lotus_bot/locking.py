@@ -0,0 +1,99 @@
+"""Module for inter-process file lock of the store"""
+from __future__ import annotations
+
+import pathlib
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Файл замка в каталозі даних, спільний для всіх рушіїв зберігання
+LOCK_NAME = "lotus.lock"
+
+
+def _lock(f, blocking: bool) -> bool:
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+    f.seek(0)
+    while True:
+        # LK_LOCK сам повторює спробу 10 секунд, далі кидає OSError
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    """
+    Ексклюзивний замок на файлі, яким процеси Lotus узгоджують запис у сховище.
+    Повторне захоплення в тому ж потоці лише збільшує лічильник,
+    а файл відпускається разом з останнім release().
+    Інші потоки процесу чекають так само, як і інші процеси.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Захоплює замок, чекаючи, поки його відпустять інші.
+        З blocking=False не чекає і повертає False, якщо замок зайнятий.
+        """
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if self._depth == 0:
+            try:
+                f = open(self.path, "a+b")
+                try:
+                    locked = _lock(f, blocking)
+                except BaseException:
+                    f.close()
+                    raise
+            except BaseException:
+                self._thread_lock.release()
+                raise
+            if not locked:
+                f.close()
+                self._thread_lock.release()
+                return False
+            self._file = f
+        self._depth += 1
+        return True
+
+    def release(self):
+        """Відпускає замок"""
+        self._depth -= 1
+        if self._depth == 0:
+            f, self._file = self._file, None
+            try:
+                _unlock(f)
+            finally:
+                f.close()
+        self._thread_lock.release()
+
+    def __enter__(self) -> FileLock:
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
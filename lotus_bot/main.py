@@ -1,58 +1,44 @@
 """Main module for assistant bot"""
 from __future__ import annotations
 
+import argparse
+import os
 import pathlib
-import pickle
 import shlex
 import sys
-from typing import Dict
+import threading
+from collections.abc import Iterable
+from contextlib import contextmanager
+from datetime import datetime
 from typing import List
 from typing import Tuple
+from typing import TYPE_CHECKING
 
 from appdirs import user_data_dir
-from prompt_toolkit import PromptSession
-from prompt_toolkit.completion import WordCompleter
-from prompt_toolkit.history import FileHistory
 from rich.console import Console
+from rich.markup import escape
 
 from lotus_bot.contacts import AddressBook
 from lotus_bot.contacts import Record
+from lotus_bot.flusher import Flusher
+from lotus_bot.metrics import format_size
+from lotus_bot.metrics import Metrics
 from lotus_bot.notes import NoteRecord
 from lotus_bot.notes import NotesBook
 from lotus_bot.rich_table_printer import print_as_rich_table
+from lotus_bot.rich_table_printer import RowCache
+from lotus_bot.storage import open_storage
+
+# prompt_toolkit, модуль імпорту/експорту (csv, json) та completion
+# імпортуються лише тоді, коли знадобляться: запуск не чекає на них
+if TYPE_CHECKING:
+    from lotus_bot.transfer import ImportReport
 
 
 app_name = "Lotus"
 app_author = "i-form"
 
 
-def read_dict(path: pathlib.Path) -> Dict:
-    """Заванатажує довідник з файла
-
-    path -- шлях до довідника
-    """
-    if path.exists():
-        try:
-            with open(path, "rb") as f:
-                return pickle.load(f)
-        except Exception as ex:
-            print(f"Loading Contacts error: {ex}, create new dictionary")
-            return {}
-    else:
-        # Якщо довідника ще нема, то повертаємо поржній
-        return {}
-
-
-def write_dict(path: pathlib.Path, dictionary: Dict):
-    """Записує довідник в файл
-
-    path -- шлях до довідника
-    dict -- словник довідника
-    """
-    with open(path, "wb") as f:
-        pickle.dump(dictionary, f)
-
-
 # Команди та їхні ариті
 commands = {
     "add-phone": 2,
@@ -65,8 +51,12 @@ commands = {
     "phone": 1,
     "show-birthday": 1,
     "birthdays": 1,
+    "birthdays-between": 2,
     "find-by-phone": 1,
     "find-by-email": 1,
+    "find-by-name": 1,
+    "find": 1,
+    "explain": 1,
     "add-note": 2,
     "add-tags": 2,
     "remove-tag": 2,
@@ -76,6 +66,16 @@ commands = {
     "all-notes": 0,
     "notes-by-tags": 1,
     "notes-by-text": 1,
+    "search": 1,
+    "import-contacts": 1,
+    "export-contacts": 1,
+    "import-notes": 1,
+    "export-notes": 1,
+    "backup": 0,
+    "backups": 0,
+    "restore": 0,
+    "dedupe": 0,
+    "stats": 0,
     "exit": 0,
     "quit": 0,
     "close": 0,
@@ -91,21 +91,40 @@ command_usage = {
     "add-address": 'Add or update address: name address (add-address "John Dou" "Kyiv, Ukraine")',
     "change": 'Update phone: name old-phone new-phone (change "John Dou" +380123334455 +380245556677)',
     "remove": 'Remove contact: name (remove "John Dou")',
-    "all": "Print all contacts: all [sort-by-column, desc|reverse|true] (all birthday desc)",
+    "all": "Print all contacts: all [sort-by-column] [desc] [limit [offset]] [pager] (all birthday desc)",
     "phone": 'Print phones: name (phone "John Dou")',
     "show-birthday": 'Print birthday: name (show-birthday "John Dou")',
     "birthdays": "Print birthdays next n day: n_day (birthdays 10)",
+    "birthdays-between": "Print birthdays between two dates: start end (birthdays-between 01.03.2026 31.03.2026)",
     "find-by-phone": "Find and print contact by phone: phone (find-by-phone +380123334455)",
     "find-by-email": "Find and print contact by email: email (find-by-email john.dou@example.com)",
+    "find-by-name": 'Print contacts whose name starts with prefix: prefix [sort-by-column] [desc] [limit [offset]] [pager] (find-by-name "jo")',
+    "find": "Print contacts matching a query, '=' or ':' is equals, '^' starts with, '~' contains, "
+    "space or ',' is AND, '|' is OR, '!' is NOT: query [sort-by-column] [desc] [limit [offset]] [pager] "
+    '(find "birthday:may address~kyiv has:email" name)',
+    "explain": 'Print how a find query runs: the index used for it and the filter checked on each candidate (explain "name^jo phone~067")',
     "add-note": 'Add new note: title text [tags] (add-note "New note" "text to be noted" tag,new,note)',
     "add-tags": "Add tags to the note: id tags (add-tags 1 tag1,tag2,tag3)",
     "remove-tag": "Remove tag from the note: id tag (remove-tag 1 tag1)",
     "edit-note": 'Update note: id title text (edit-note 1 "Edited title" "Edited text to be noted")',
     "edit-note-text": 'Update note: id text (edit-note-text 1 "Edited text to be noted")',
     "remove-note": "Remove note: id (remove-note 1)",
-    "all-notes": "Print all notes: all-notes [sort-by-column, desc|reverse|true] (all-notes created desc)",
-    "notes-by-tags": "Print notes filtered by tags: tags [sort-by-column, desc|reverse|true] (notes-by-tag important,other title desc)",
-    "notes-by-text": "Print notes containing text: text [sort-by-column, desc|reverse|true] (notes-by-text space title desc)",
+    "all-notes": "Print all notes: all-notes [sort-by-column] [desc] [limit [offset]] [pager] (all-notes created desc 20)",
+    "notes-by-tags": "Print notes filtered by tags, ',' is AND, '|' is OR, '!' is NOT, a tag with these characters is quoted: "
+    "tags [sort-by-column] [desc] [limit [offset]] [pager] "
+    '(notes-by-tags "(work|home),!draft" title desc)',
+    "notes-by-text": "Print notes containing text: text [sort-by-column] [desc] [limit [offset]] [pager] (notes-by-text space title desc)",
+    "search": "Print notes best matching the words, ranked: query [top-k] (search \"project meeting\" 5)",
+    "import-contacts": "Import contacts from a .csv, .vcf or .jsonl file: path [format] (import-contacts contacts.vcf)",
+    "export-contacts": "Export all contacts to a .csv, .vcf or .jsonl file: path [format] (export-contacts contacts.csv)",
+    "import-notes": "Import notes from a .csv or .jsonl file: path [format] (import-notes notes.jsonl)",
+    "export-notes": "Export all notes to a .csv or .jsonl file: path [format] (export-notes notes.csv)",
+    "backup": "Back up contacts and notes, writing only the chunks changed since earlier backups",
+    "backups": "Print the backups that can be restored",
+    "restore": "Replace contacts and notes with a backup: [name] (restore 20260301-120000, the latest by default)",
+    "dedupe": "Print clusters of likely duplicate contacts or merge them into the first contact of each: "
+    "[limit [offset]] [pager] | merge [cluster ...] (dedupe, dedupe merge 1 3)",
+    "stats": "Print command latency percentiles, store and index sizes",
     "exit": "Close bot",
     "quit": "Close bot",
     "close": "Close bot",
@@ -114,41 +133,148 @@ command_usage = {
 }
 
 
-def main():
+def main(argv: List[str] | None = None):
     """Entry point for Assistant Bot"""
 
+    parser = argparse.ArgumentParser(
+        prog="lotus-cli", description="Assistant bot with contacts book and notes"
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="run commands from FILE ('-' for stdin) without the interactive prompt",
+    )
+    parser.add_argument(
+        "--commit-every",
+        metavar="N",
+        type=int,
+        default=0,
+        help="in batch mode commit after every N commands (default: once at the end)",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="ADDRESS",
+        nargs="?",
+        const="127.0.0.1:8765",
+        help="serve the commands as a local JSON API on HOST:PORT or unix:PATH (default: 127.0.0.1:8765); "
+        "a non-loopback HOST requires LOTUS_API_TOKEN",
+    )
+    options = parser.parse_args(argv)
+
     console = Console()
 
-    data_path = pathlib.Path(user_data_dir(app_name, app_author))
+    # LOTUS_DATA_DIR перевизначає каталог даних (окремі книги, бенчмарки)
+    data_path = pathlib.Path(
+        os.environ.get("LOTUS_DATA_DIR") or user_data_dir(app_name, app_author)
+    )
     if not data_path.exists():
         data_path.mkdir(parents=True, exist_ok=True)
     elif not data_path.is_dir():
         console.print(f"[bold red]Path {data_path} is not dir![/bold red]")
         sys.exit(1)
 
-    dict_path = data_path.joinpath("lotus.pickle")
-    dictionary = read_dict(dict_path)
+    storage = open_storage(data_path)
+    # У сесії (prompt чи сервер) згортання журналу та fsync виконує фоновий потік,
+    # а команди виконуються під busy, щоб не перетинатися з ним
+    # (читання сервера, поки він пише, -- без busy, див. api_execute)
+    flusher: Flusher | None = None
+    busy = threading.RLock()
 
-    if len(dictionary) == 0:
-        book = AddressBook({})
-        dictionary["contacts"] = book.data
-        notes_book = NotesBook({})
-        dictionary["notes"] = notes_book.data
-    else:
-        book = AddressBook(dictionary["contacts"])
-        notes_book = NotesBook(dictionary["notes"])
+    def start_flusher():
+        nonlocal flusher, busy
+        if hasattr(storage, "background_flush"):
+            flusher = Flusher(storage).start()
+            busy = flusher.busy
 
-    # Декоратор записує словник у файл при вдалому завершенні функції
+    # Зупиняє фоновий запис і синхронно записує все перед виходом
+    def close_storage():
+        if flusher is not None:
+            flusher.stop()
+        storage.close()
+    # Затримки команд за фазами; LOTUS_PROFILE_SLOW_MS вмикає профілювання
+    metrics = Metrics(data_path.joinpath("profiles"))
 
-    def writer(func):
-        def inner(name: str, *args) -> Tuple[bool, str]:
+    # Книги створюються після завантаження сховища: одразу в пакетному режимі
+    # або у фоновому потоці, поки інтерактивний prompt вже приймає ввід
+    book: AddressBook
+    notes_book: NotesBook
+    load_errors: List[Exception] = []
 
-            res = func(name, *args)
-            if res[0]:
-                write_dict(dict_path, dictionary)
-            return res
+    def load_books():
+        nonlocal book, notes_book
+        try:
+            dictionary = storage.load()
+            book = AddressBook(dictionary["contacts"])
+            notes_book = NotesBook(dictionary["notes"])
+        except Exception as ex:
+            load_errors.append(ex)
 
-        return inner
+    loader = threading.Thread(target=load_books, name="lotus-load", daemon=True)
+
+    # Чекає на завершення фонового завантаження перед першою командою
+    def wait_loaded():
+        if loader.is_alive():
+            with metrics.phase("load"):
+                loader.join()
+        if load_errors:
+            console.print(f"[bold red]Can't load data: {load_errors[0]}[/bold red]")
+            sys.exit(1)
+
+    # Застосовує до книг зміни, записані іншими процесами Lotus з тим самим сховищем.
+    # Зазвичай це кілька нових кадрів журналу; якщо сховище згорнуто далі
+    # (або це SQLite), книги створюються заново.
+    # З blocking=False синхронізація пропускається, поки замок тримає хтось інший
+    def sync_books(blocking: bool = True):
+        with metrics.phase("sync"):
+            changes = storage.changes(blocking)
+            if changes is None:
+                load_books()
+                if load_errors:
+                    raise load_errors.pop()
+                return
+            for section, key, value in changes:
+                if section == "contacts":
+                    book.apply_change(key, value)
+                elif section == "notes":
+                    notes_book.apply_change(key, value)
+
+    # Виконує команду на синхронізованих книгах. Команда, що змінює дані,
+    # тримає замок сховища від синхронізації до запису, тож зміни
+    # іншого процесу не можуть загубитись між ними
+    def execute_synced(repl: List[str]) -> Tuple[bool, str]:
+        with busy:
+            if repl[0] not in write_commands:
+                sync_books()
+                return execute(repl)
+            with metrics.phase("sync"):
+                storage.lock.acquire()
+            try:
+                sync_books()
+                return execute(repl)
+            finally:
+                storage.lock.release()
+
+    def contact_key(name: str, *args) -> str:
+        return name.strip().lower()
+
+    def note_key(id: str, *args) -> int:
+        return int(id)
+
+    # Декоратор зберігає змінений запис при вдалому завершенні функції
+    # key -- функція, що за аргументами обробника повертає ключ запису
+    def writer(section: str, key):
+        def decorator(func):
+            def inner(name: str, *args) -> Tuple[bool, str]:
+
+                res = func(name, *args)
+                if res[0]:
+                    with metrics.phase("persist"):
+                        storage.commit(section, key(name, *args))
+                return res
+
+            return inner
+
+        return decorator
 
     # Декоратор виводить повідомлення про результат операції
     def verbose(func):
@@ -156,7 +282,8 @@ def main():
             name: str | None = None, phone: str | None = None, phone2: str | None = None
         ) -> Tuple[bool, str]:
             res = func(name, phone, phone2)
-            console.print(res[1])
+            with metrics.phase("render"):
+                console.print(res[1])
             return res
 
         return inner
@@ -165,7 +292,8 @@ def main():
     # та паервіряє ариті команди (кількість параметрів)
     def validate(func):
         def inner(msg_prompt: str) -> List[str]:
-            res: List[str] = func(msg_prompt)
+            with metrics.phase("parse"):
+                res: List[str] = func(msg_prompt)
             if len(res) > 0:
                 res[0] = res[0].strip().lower()
                 arity = len(res) - 1
@@ -186,14 +314,22 @@ def main():
             else:
                 res = ["error"]
 
+            metrics.name = res[0]
             return res
 
         return inner
 
+    # Попередження, якщо телефон чи email вже є в інших контактах
+    def duplicate_warning(owners: List[str]) -> str:
+        if owners:
+            return f" [yellow](also used by: {', '.join(owners)})[/yellow]"
+        return ""
+
     # Handler: add name phone - додає новий контакт
-    @writer
+    @writer("contacts", contact_key)
     @verbose
     def add(name: str, phone: str, *args) -> Tuple[bool, str]:
+        owners = book.find_phone_owners(phone, name)
         record = book.find_record(name)
         if record:
             record.add_phone(phone, "")
@@ -201,21 +337,26 @@ def main():
             record = Record(name)
             record.add_phone(phone, "")
             book.add_record(name, record)
-        return True, f"Phone {phone} to {name} added"
+        return True, f"Phone {phone} to {name} added" + duplicate_warning(owners)
 
     # Handler: change name phone - змінює існуючий контакт
-    @writer
+    @writer("contacts", contact_key)
     @verbose
     def change(name: str, old_phone: str, new_phone: str, *args) -> Tuple[bool, str]:
         record = book.find_record(name)
         if record:
+            owners = book.find_phone_owners(new_phone, name)
             record.edit_phone(old_phone, new_phone, "")
-            return True, f"Contact {name}: {old_phone} changed to {new_phone}"
+            return (
+                True,
+                f"Contact {name}: {old_phone} changed to {new_phone}"
+                + duplicate_warning(owners),
+            )
         else:
             return False, f"[bold red]Contact {name} not found[/bold red]"
 
     # Handler: remove name  - видаляє існуючий контакт
-    @writer
+    @writer("contacts", contact_key)
     @verbose
     def remove(name: str, *args) -> Tuple[bool, str]:
         record = book.find_record(name)
@@ -226,7 +367,7 @@ def main():
             return False, f"[bold red]Contact {name} not found[/bold red]"
 
     # Handler: add-birthday name dd.mm.yyyy
-    @writer
+    @writer("contacts", contact_key)
     @verbose
     def add_birthday(name: str, birthday: str, *args) -> Tuple[bool, str]:
         record = book.find_record(name)
@@ -239,9 +380,10 @@ def main():
         return True, f"Birthday {birthday} to {name} added"
 
     # Handler: add-email name email
-    @writer
+    @writer("contacts", contact_key)
     @verbose
     def add_email(name: str, email: str, *args) -> Tuple[bool, str]:
+        owners = book.find_email_owners(email, name)
         record = book.find_record(name)
         if record:
             record.add_email(email)
@@ -249,10 +391,10 @@ def main():
             record = Record(name)
             record.add_email(email)
             book.add_record(name, record)
-        return True, f"Email {email} to {name} added"
+        return True, f"Email {email} to {name} added" + duplicate_warning(owners)
 
     # Handler: add-address name address
-    @writer
+    @writer("contacts", contact_key)
     @verbose
     def add_address(name: str, address: str, *args) -> Tuple[bool, str]:
         record = book.find_record(name)
@@ -264,50 +406,82 @@ def main():
             book.add_record(name, record)
         return True, f"Address {address} to {name} added"
 
-    def print_all(*args) -> Tuple[bool, str]:
-        sort_by, reverse_sort = sort_params(args)
-
-        print_as_rich_table(
-            columns=[
-                {"name": "Name", "min_width": 20, "max_width": 30, "no_wrap": False},
-                {"name": "Birthday", "min_width": 10},
-                {
-                    "name": "Address",
-                    "justify": "right",
-                    "no_wrap": False,
-                    "max_width": 30,
-                },
-                {
-                    "name": "Phones",
-                    "justify": "right",
-                    "no_wrap": False,
-                    "max_width": 16,
-                },
-                {"name": "Email", "justify": "right"},
-            ],
-            rows=[
-                [
-                    record.name,
-                    record.birthday.value if record.birthday else "",
-                    record.address,
-                    record.phones,
-                    record.email,
-                ]
-                for record in book.values()
-            ],
-            sort_by=sort_by,
-            reverse_sort=reverse_sort,
+    # Колонки таблиці контактів
+    contact_columns = [
+        {"name": "Name", "min_width": 20, "max_width": 30, "no_wrap": False},
+        {"name": "Birthday", "min_width": 10},
+        {
+            "name": "Address",
+            "justify": "right",
+            "no_wrap": False,
+            "max_width": 30,
+        },
+        {
+            "name": "Phones",
+            "justify": "right",
+            "no_wrap": False,
+            "max_width": 16,
+        },
+        {"name": "Email", "justify": "right"},
+    ]
+
+    def contact_row(record: Record) -> List:
+        return [
+            record.name,
+            record.birthday.value if record.birthday else "",
+            record.address,
+            record.phones,
+            record.email,
+        ]
+
+    # Рядки контактів між командами: перебудовуються лише для змінених записів
+    contact_rows = RowCache(contact_row)
+
+    def print_all(*args, records=None) -> Tuple[bool, str]:
+        params = listing_params(args)
+        if records is None:
+            records = book.values()
+            # Колонки з відсортованим індексом виводяться проходом по ньому
+            keys = book.sorted_keys(params["sort_by"], params["reverse_sort"])
+            if keys is not None:
+                records = (book[key] for key in keys)
+                params.update(sort_by="", reverse_sort=False)
+
+        print_table(
+            columns=contact_columns,
+            rows=(contact_rows(record) for record in records),
+            **params,
         )
         return True, "[bold green]OK[/bold green]\n"
 
-    def sort_params(args):
-        sort_by = ""
-        reverse_sort = False
-        if args:
-            sort_by = args[0]
-            if len(args) > 1:
-                reverse_sort = args[1].lower() in {"desc", "reverse", "true"}
-        return sort_by, reverse_sort
+    # Вивід таблиці враховується у фазі render разом з обходом рядків
+    # Консоль сервера збирає таблиці у відповідь замість виводу
+    def print_table(**kwargs):
+        with metrics.phase("render"):
+            add_table = getattr(console, "add_table", None)
+            if add_table is not None:
+                add_table(**kwargs)
+            else:
+                print_as_rich_table(**kwargs)
+
+    # Параметри виводу таблиці: [колонка] [desc|reverse|true] [limit [offset]] [pager]
+    def listing_params(args) -> dict:
+        params = {"sort_by": "", "reverse_sort": False, "limit": None, "offset": 0}
+        numbers = []
+        for arg in args:
+            if arg.isdigit():
+                numbers.append(int(arg))
+            elif arg.lower() in {"desc", "reverse", "true"}:
+                params["reverse_sort"] = True
+            elif arg.lower() == "pager":
+                params["pager"] = True
+            elif not params["sort_by"] and arg.lower() not in {"asc", "false"}:
+                params["sort_by"] = arg
+        if numbers:
+            params["limit"] = numbers[0]
+        if len(numbers) > 1:
+            params["offset"] = numbers[1]
+        return params
 
     # Handler: phone name - виводить телефони вказаного контакту
     @verbose
@@ -340,6 +514,21 @@ def main():
         else:
             return True, "[bold green]Empty list[/bold green]\n"
 
+    # Handler: birthdays-between - виводить дні народження між двома датами
+    @verbose
+    def birthdays_between(start: str, end: str, *args):
+        try:
+            start_date = datetime.strptime(start, "%d.%m.%Y").date()
+            end_date = datetime.strptime(end, "%d.%m.%Y").date()
+        except ValueError:
+            return False, "[bold red]Invalid date format. Use DD.MM.YYYY[/bold red]"
+        report = book.get_congratulations(start_date, end_date)
+        if report:
+            console.print(report)
+            return True, "[bold green]OK[/bold green]\n"
+        else:
+            return True, "[bold green]Empty list[/bold green]\n"
+
     # Handler: find-by-phone - шукає та виводить контакт за телефоном
     @verbose
     def find_by_phone(phone: str, *args):
@@ -360,8 +549,29 @@ def main():
         else:
             return False, f"[bold red]Contact with email {email} not found[/bold red]"
 
+    # Handler: find-by-name prefix - виводить контакти, чиє ім'я починається з prefix
+    def find_by_name(prefix: str, *args) -> Tuple[bool, str]:
+        return print_all(*args, records=book.find_records_starting_with(prefix))
+
+    # Handler: find query - виводить контакти, що задовольняють запит (див. lotus_bot.query)
+    def find_contacts(query: str, *args) -> Tuple[bool, str]:
+        from lotus_bot.query import plan_query
+
+        return print_all(*args, records=plan_query(query, book).records())
+
+    # Handler: explain query - виводить план запиту find та скільки контактів він перевіряє
+    def explain_query(query: str, *args) -> Tuple[bool, str]:
+        from lotus_bot.query import plan_query
+
+        plan = plan_query(query, book)
+        for line in plan.explain():
+            console.print(escape(line))
+        matched = sum(1 for _ in plan.records())
+        console.print(f"Checked {plan.checked} contact(s), matched {matched}")
+        return True, ""
+
     # Handler: add-note title text - додає нову нотатку
-    @writer
+    @writer("notes", lambda *args: notes_book.last_id)
     @verbose
     def add_note(title: str, *args) -> Tuple[bool, str]:
         tags = None
@@ -372,7 +582,7 @@ def main():
         notes_book.add_note(record)
         return True, f"Note '{title}' added"
 
-    @writer
+    @writer("notes", note_key)
     @verbose
     def add_tags(id: str, tags: str, *args) -> Tuple[bool, str]:
         result = notes_book.edit_note(int(id), tags=tags)
@@ -381,7 +591,7 @@ def main():
         else:
             return True, f"Note '{id}' updated"
 
-    @writer
+    @writer("notes", note_key)
     @verbose
     def remove_tag(id: str, tag: str, *args) -> Tuple[bool, str]:
         result = notes_book.remove_tag(int(id), tag=tag)
@@ -392,7 +602,7 @@ def main():
 
     # Handler: edit-note id title text - додає нову нотатку
 
-    @writer
+    @writer("notes", note_key)
     @verbose
     def edit_note(id: str, title: str, text: str, *args) -> Tuple[bool, str]:
         result = notes_book.edit_note(int(id), title, text)
@@ -402,7 +612,7 @@ def main():
             return True, f"Note '{id}' updated"
 
     # Handler: edit-note-text id title text - додає нову нотатку
-    @writer
+    @writer("notes", note_key)
     @verbose
     def edit_note_text(id: str, text: str, *args) -> Tuple[bool, str]:
         result = notes_book.edit_note(int(id), new_text=text)
@@ -412,15 +622,52 @@ def main():
             return True, f"Note '{id}' updated"
 
     # Handler: remove-note id - видаляє  нотатку
-    @writer
+    @writer("notes", note_key)
     @verbose
     def remove_note(id: str, *args) -> Tuple[bool, str]:
         notes_book.delete_note(int(id))
         return True, f"Note '{id}' removed"
 
+    # Колонки таблиці нотаток
+    note_columns = [
+        {"name": "Id", "min_width": 2, "max_width": 6},
+        {"name": "Title", "min_width": 10, "max_width": 20},
+        {"name": "Text", "justify": "left", "no_wrap": False, "min_width": 30},
+        {
+            "name": "Tags",
+            "justify": "center",
+            "no_wrap": False,
+            "min_width": 10,
+        },
+        {
+            "name": "Created",
+            "justify": "right",
+            "no_wrap": False,
+            "max_width": 12,
+        },
+        {
+            "name": "Modified",
+            "justify": "right",
+            "no_wrap": False,
+            "max_width": 12,
+        },
+    ]
+
+    def note_row(record: NoteRecord) -> List:
+        return [
+            record.id,
+            record.title,
+            record.text,
+            record.tags,
+            record.date_created,
+            record.date_modified,
+        ]
+
+    note_rows = RowCache(note_row)
+
     # Handler: all-notes виводить всі нотатки у вигляді таблиці
     def all_notes(*args, by_tags=None, by_text=None) -> Tuple[bool, str]:
-        sort_by, reverse_sort = sort_params(args)
+        params = listing_params(args)
         filtered_records = {}
         if by_tags:
             filtered_records = notes_book.search_by_tags(by_tags)
@@ -428,133 +675,512 @@ def main():
             filtered_records = notes_book.search_by_notes_text(by_text)
         else:
             filtered_records = notes_book.values()
+            ids = notes_book.sorted_ids(params["sort_by"], params["reverse_sort"])
+            if ids is not None:
+                filtered_records = (notes_book[id] for id in ids)
+                params.update(sort_by="", reverse_sort=False)
 
-        print_as_rich_table(
-            columns=[
-                {"name": "Id", "min_width": 2, "max_width": 6},
-                {"name": "Title", "min_width": 10, "max_width": 20},
-                {"name": "Text", "justify": "left", "no_wrap": False, "min_width": 30},
-                {
-                    "name": "Tags",
-                    "justify": "center",
-                    "no_wrap": False,
-                    "min_width": 10,
-                },
-                {
-                    "name": "Created",
-                    "justify": "right",
-                    "no_wrap": False,
-                    "max_width": 12,
-                },
-                {
-                    "name": "Modified",
-                    "justify": "right",
-                    "no_wrap": False,
-                    "max_width": 12,
-                },
-            ],
-            rows=[
-                [
-                    record.id,
-                    record.title,
-                    record.text,
-                    record.tags,
-                    record.date_created,
-                    record.date_modified,
-                ]
-                for record in filtered_records
-            ],
-            sort_by=sort_by,
-            reverse_sort=reverse_sort,
+        print_table(
+            columns=note_columns,
+            rows=(note_rows(record) for record in filtered_records),
+            **params,
         )
         return True, "[bold green]OK[/bold green]\n"
 
-    history_path = data_path.joinpath(".history")
-    history = FileHistory(history_path)
-    completer = WordCompleter(list(commands.keys()))
+    # Handler: search виводить найрелевантніші нотатки (BM25)
+    def search_notes(query: str, *args) -> Tuple[bool, str]:
+        k = int(args[0]) if args else 10
+        results = notes_book.search_ranked(query, k)
+        if not results:
+            return True, "[bold green]Empty list[/bold green]\n"
 
-    session = PromptSession(
-        history=history, completer=completer, reserve_space_for_menu=True
-    )
+        print_table(
+            columns=[{"name": "Score", "justify": "right", "max_width": 7}]
+            + note_columns,
+            rows=[[f"{score:.2f}"] + note_row(record) for score, record in results],
+        )
+        return True, "[bold green]OK[/bold green]\n"
+
+    # Скільки відхилених рядків імпорту показувати
+    rejected_limit = 20
+
+    def import_summary(report: ImportReport, what: str) -> str:
+        lines = [f"Imported {report.imported} {what}, rejected {len(report.rejected)}"]
+        for number, reason in report.rejected[:rejected_limit]:
+            lines.append(f"[yellow]  line {number}: {reason}[/yellow]")
+        if len(report.rejected) > rejected_limit:
+            lines.append(f"[yellow]  ... and {len(report.rejected) - rejected_limit} more[/yellow]")
+        return "\n".join(lines)
+
+    # Імпорт або записується весь, або не лишає жодного запису: якщо файл
+    # зламано посередині, вже додані записи відкочуються разом з індексами книг
+    @contextmanager
+    def import_atomically():
+        nonlocal book, notes_book
+        try:
+            with storage.atomic():
+                yield
+        except BaseException:
+            book = AddressBook(storage.dictionary["contacts"])
+            notes_book = NotesBook(storage.dictionary["notes"])
+            raise
+
+    # Handler: import-contacts path [format] - імпортує контакти з файла
+    # Імпорт записується одним знімком (persist), а не по запису
+    @verbose
+    def import_contacts_file(path: str, *args) -> Tuple[bool, str]:
+        from lotus_bot import transfer
+
+        fmt = transfer.file_format(path, args[0] if args and args[0] else None)
+        with open(path, encoding="utf-8", newline="") as f, import_atomically():
+            report = transfer.import_contacts(book, f, fmt)
+            storage.persist()
+        return True, import_summary(report, "contact(s)")
+
+    # Handler: export-contacts path [format] - вивантажує всі контакти у файл
+    @verbose
+    def export_contacts_file(path: str, *args) -> Tuple[bool, str]:
+        from lotus_bot import transfer
+
+        fmt = transfer.file_format(path, args[0] if args and args[0] else None)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            count = transfer.export_contacts(book, f, fmt)
+        return True, f"Exported {count} contact(s) to {path}"
+
+    # Handler: import-notes path [format] - імпортує нотатки з файла
+    @verbose
+    def import_notes_file(path: str, *args) -> Tuple[bool, str]:
+        from lotus_bot import transfer
+
+        fmt = transfer.file_format(path, args[0] if args and args[0] else None)
+        with open(path, encoding="utf-8", newline="") as f, import_atomically():
+            report = transfer.import_notes(notes_book, f, fmt)
+            storage.persist()
+        return True, import_summary(report, "note(s)")
+
+    # Handler: export-notes path [format] - вивантажує всі нотатки у файл
+    @verbose
+    def export_notes_file(path: str, *args) -> Tuple[bool, str]:
+        from lotus_bot import transfer
+
+        fmt = transfer.file_format(path, args[0] if args and args[0] else None)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            count = transfer.export_notes(notes_book, f, fmt)
+        return True, f"Exported {count} note(s) to {path}"
+
+    # Handler: backup - записує резервну копію контактів і нотаток;
+    # пишуться лише частини, яких ще нема в каталозі копій
+    @verbose
+    def backup_books(*args) -> Tuple[bool, str]:
+        from lotus_bot.backup import open_backups
+
+        report = open_backups(data_path).backup({"contacts": book.data, "notes": notes_book.data})
+        return True, (
+            f"Backup {report.name}: {report.records['contacts']} contact(s), {report.records['notes']} note(s), "
+            f"{report.new_chunks} of {report.chunks} chunk(s) written ({format_size(report.written)})"
+        )
+
+    backup_columns = [
+        {"name": "Backup", "min_width": 15},
+        {"name": "Created", "min_width": 19},
+        {"name": "Contacts", "justify": "right"},
+        {"name": "Notes", "justify": "right"},
+        {"name": "Size", "justify": "right"},
+    ]
+
+    # Handler: backups - виводить резервні копії
+    def print_backups(*args) -> Tuple[bool, str]:
+        from lotus_bot.backup import open_backups
+
+        rows = [
+            [
+                name,
+                manifest["created"].replace("T", " "),
+                manifest["sections"]["contacts"]["records"],
+                manifest["sections"]["notes"]["records"],
+                format_size(manifest["size"]),
+            ]
+            for name, manifest in open_backups(data_path).snapshots()
+        ]
+        print_table(columns=backup_columns, rows=rows)
+        return True, ""
+
+    # Handler: restore [name] - замінює контакти й нотатки копією (за замовчуванням останньою).
+    # Як і імпорт, записується одним знімком (persist)
+    @verbose
+    def restore_books(name: str | None = None, *args) -> Tuple[bool, str]:
+        from lotus_bot.backup import open_backups
+
+        name, sections = open_backups(data_path).restore(name)
+        for target, records in ((book, sections["contacts"]), (notes_book, sections["notes"])):
+            for key in [key for key in target.data.keys() if key not in records]:
+                target.apply_change(key, None)
+            for key, record in records.items():
+                target.apply_change(key, record)
+        storage.persist()
+        return True, f"Restored {len(sections['contacts'])} contact(s) and {len(sections['notes'])} note(s) from backup {name}"
+
+    dedupe_columns = [{"name": "Cluster", "justify": "right"}, *contact_columns, {"name": "Match", "no_wrap": False}]
+
+    # Handler: dedupe [limit [offset]] [pager] - виводить групи ймовірних дублікатів контактів;
+    # dedupe merge [cluster ...] - зливає всі (або вказані) групи в перший контакт кожної
+    def dedupe(*args) -> Tuple[bool, str]:
+        from lotus_bot.dedupe import find_duplicates
+        from lotus_bot.dedupe import merge_cluster
+
+        clusters = find_duplicates(book)
+        if not args or args[0].lower() != "merge":
+            rows = (
+                [number, *contact_row(book.data[key]), ", ".join(sorted(cluster.reasons)) if position == 0 else ""]
+                for number, cluster in enumerate(clusters, 1)
+                for position, key in enumerate(cluster.keys)
+            )
+            print_table(columns=dedupe_columns, rows=rows, **listing_params(args))
+            console.print(f"{len(clusters)} cluster(s) of likely duplicates, 'dedupe merge \\[cluster ...]' keeps the first contact of each")
+            return True, ""
+
+        numbers = [int(arg) for arg in args[1:]]
+        if any(not 1 <= number <= len(clusters) for number in numbers):
+            console.print(f"[bold red]Clusters are numbered from 1 to {len(clusters)}[/bold red]")
+            return False, ""
+        selected = [clusters[number - 1] for number in dict.fromkeys(numbers)] if numbers else clusters
+
+        def commit(key: str):
+            with metrics.phase("persist"):
+                storage.commit("contacts", key)
+
+        removed = 0
+        for cluster in selected:
+            for note in merge_cluster(book, cluster, commit):
+                console.print(f"[yellow]{book.data[cluster.keys[0]].name}: kept the existing value, dropped {note}[/yellow]")
+            removed += len(cluster.keys) - 1
+        console.print(f"[bold green]Merged {len(selected)} cluster(s), removed {removed} duplicate contact(s)[/bold green]")
+        return True, ""
+
+    # Колонки таблиці затримок (у мілісекундах)
+    stats_columns = [
+        {"name": "Command", "min_width": 10},
+        {"name": "Phase", "min_width": 7},
+        {"name": "Count", "justify": "right"},
+        {"name": "p50 ms", "justify": "right"},
+        {"name": "p95 ms", "justify": "right"},
+        {"name": "p99 ms", "justify": "right"},
+        {"name": "Max ms", "justify": "right"},
+    ]
+
+    # Handler: stats виводить перцентилі затримок команд, розмір сховища та індексів
+    def print_stats(*args) -> Tuple[bool, str]:
+        print_table(columns=stats_columns, rows=metrics.rows())
+        files = [path for path in sorted(data_path.glob("lotus.*")) if path.is_file()]
+        store = ", ".join(f"{path.name} {format_size(path.stat().st_size)}" for path in files)
+        indexes = {**book.index_sizes(), **notes_book.index_sizes()}
+        console.print(f"Store: {store or 'empty'}")
+        console.print(f"Records: {len(book)} contact(s), {len(notes_book)} note(s)")
+        console.print(
+            "Indexes: "
+            + (", ".join(f"{name} {size}" for name, size in indexes.items()) or "none built")
+        )
+        console.print(f"Cached rows: {len(contact_rows)} contact(s), {len(note_rows)} note(s)")
+        return True, ""
+
+    # Команди, першим аргументом яких є ім'я контакту
+    name_commands = [
+        "add-phone",
+        "add-birthday",
+        "add-email",
+        "add-address",
+        "change",
+        "remove",
+        "phone",
+        "show-birthday",
+        "find-by-name",
+    ]
+
+    # Команди завершення роботи
+    exit_commands = {"exit", "quit", "close"}
+
+    # Команди, що змінюють контакти чи нотатки
+    write_commands = {
+        "add-phone",
+        "add-birthday",
+        "add-email",
+        "add-address",
+        "change",
+        "remove",
+        "add-note",
+        "add-tags",
+        "remove-tag",
+        "edit-note",
+        "edit-note-text",
+        "remove-note",
+        "import-contacts",
+        "import-notes",
+        "restore",
+        "dedupe",
+    }
+
+    # Команди, що самі записують увесь стан одним знімком (persist),
+    # разом з усіма незаписаними змінами пакета
+    persist_commands = {"import-contacts", "import-notes", "restore"}
 
     @validate
-    def parse_input(msg_prompt: str, *args) -> List[str]:
-        msg = session.prompt(msg_prompt)
+    def parse_line(line: str, *args) -> List[str]:
+        return shlex.split(line)
 
-        cmd = shlex.split(msg)
-        return cmd
+    # Команди, недоступні через API: сервер не завершується за запитом,
+    # а шляхи до файлів клієнта не мають сенсу для сервера
+    api_excluded = exit_commands | {"import-contacts", "export-contacts", "import-notes", "export-notes"}
+
+    @validate
+    def parse_request(request: dict) -> List[str]:
+        return [request["command"], *request.get("args", [])]
+
+    # Виконує запит сервера {"command": ..., "args": [...]} з консоллю,
+    # що збирає вивід у відповідь. Команда запису виконується
+    # в потоці сервера, що вже тримає замок сховища.
+    # Поки фоновий запис тримає busy (згортання великого журналу триває секунди),
+    # читання не чекають на нього, а відповідають з книг у пам'яті без синхронізації
+    def api_execute(request: dict, write: bool) -> dict:
+        nonlocal console
+        terminal, console = console, ReplyConsole()
+        reply = console
+        synced = busy.acquire(blocking=write or not getattr(storage, "reads_during_flush", False))
+        try:
+            with metrics.command():
+                repl = parse_request(request)
+                if repl[0] in api_excluded:
+                    console.print(f"[bold red]Command '{repl[0]}' is not available over the API[/bold red]")
+                    return reply.reply(False)
+                if synced:
+                    sync_books(blocking=write)
+                ok = execute(repl)[0]
+        except Exception as ex:
+            console.print(f"[bold red]{ex}[/bold red]")
+            ok = False
+        finally:
+            if synced:
+                busy.release()
+            console = terminal
+        return reply.reply(ok)
 
     def print_help():
         console.print("Available commands and their arities:")
         for k, v in commands.items():
             console.print(f"    {k}/{v} -- {command_usage.get(k, '')}")
 
+    # Виконує розібрану команду і повертає результат обробника
+    def execute(repl: List[str]) -> Tuple[bool, str]:
+        match repl:
+            case ["add-phone", name, phone]:
+                return add(name, phone)
+            case ["add-birthday", name, birthday]:
+                return add_birthday(name, birthday)
+            case ["add-email", name, email]:
+                return add_email(name, email)
+            case ["add-address", name, address]:
+                return add_address(name, address)
+            case ["change", name, old_phone, new_phone]:
+                return change(name, old_phone, new_phone)
+            case ["remove", name]:
+                return remove(name)
+            case ["all", *args]:
+                return print_all(*args)
+            case ["phone", name]:
+                return print_phone(name)
+            case ["show-birthday", name]:
+                return show_birthday(name)
+            case ["birthdays", n_day]:
+                return birthdays(n_day)
+            case ["birthdays-between", start, end]:
+                return birthdays_between(start, end)
+            case ["find-by-phone", phone]:
+                return find_by_phone(phone)
+            case ["find-by-email", email]:
+                return find_by_email(email)
+            case ["find-by-name", prefix, *args]:
+                return find_by_name(prefix, *args)
+            case ["find", query, *args]:
+                return find_contacts(query, *args)
+            case ["explain", query, *args]:
+                return explain_query(query, *args)
+            case ["add-note", title, *args]:
+                return add_note(title, *args)
+            case ["add-tags", id, tags, *args]:
+                return add_tags(id, tags, *args)
+            case ["remove-tag", id, tag, *args]:
+                return remove_tag(id, tag, *args)
+            case ["edit-note", id, title, text, *args]:
+                return edit_note(id, title, text, *args)
+            case ["edit-note-text", id, text, *args]:
+                return edit_note_text(id, text, *args)
+            case ["remove-note", id]:
+                return remove_note(id)
+            case ["all-notes", *args]:
+                return all_notes(*args)
+            case ["notes-by-tags", tags, *args]:
+                return all_notes(*args, by_tags=tags)
+            case ["notes-by-text", text, *args]:
+                return all_notes(*args, by_text=text)
+            case ["search", query, *args]:
+                return search_notes(query, *args)
+            case ["import-contacts", path, *args]:
+                return import_contacts_file(path, *args)
+            case ["export-contacts", path, *args]:
+                return export_contacts_file(path, *args)
+            case ["import-notes", path, *args]:
+                return import_notes_file(path, *args)
+            case ["export-notes", path, *args]:
+                return export_notes_file(path, *args)
+            case ["backup"]:
+                return backup_books()
+            case ["backups"]:
+                return print_backups()
+            case ["restore", *args]:
+                return restore_books(*args)
+            case ["dedupe", *args]:
+                return dedupe(*args)
+            case ["stats"]:
+                return print_stats()
+            case ["hello"]:
+                console.print("[bold green]How can I help you?[/bold green]")
+                return True, ""
+            case ["help"]:
+                print_help()
+                return True, ""
+            case ["error"]:
+                console.print("")
+                return False, ""
+            case _:
+                console.print(
+                    f"[bold red]Unexpected command: {' '.join(repl)}[/bold red]"
+                )
+                return False, ""
+
+    # Пакетний режим: команди з файла чи stdin без prompt_toolkit.
+    # Зміни записуються разом наприкінці або кожні commit_every команд,
+    # а при першій помилці команди, що змінює дані (чи нерозпізнаному рядку),
+    # незаписані зміни відкочуються. Невдале читання (нічого не знайдено) лише виводиться.
+    def run_batch(lines: Iterable[str], commit_every: int) -> int:
+        storage.begin()
+        uncommitted = 0
+        for number, line in enumerate(lines, 1):
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            try:
+                with metrics.command():
+                    repl = parse_line(line)
+                    if repl[0] in exit_commands:
+                        break
+                    ok = execute(repl)[0]
+                    if ok and repl[0] in persist_commands:
+                        # Команда вже записала й усі попередні зміни пакета
+                        uncommitted = 0
+                    elif ok:
+                        uncommitted += 1
+                        if commit_every and uncommitted >= commit_every:
+                            with metrics.phase("persist"):
+                                storage.flush()
+                            uncommitted = 0
+                    elif repl[0] != "error" and repl[0] not in write_commands:
+                        console.print(f"[yellow]Line {number} found nothing: {line.strip()}[/yellow]")
+                        continue
+            except Exception as ex:
+                console.print(f"[bold red]{ex}[/bold red]")
+                ok = False
+            if not ok:
+                storage.rollback()
+                console.print(
+                    f"[bold red]Line {number} failed: {line.strip()}. "
+                    f"{uncommitted} uncommitted command(s) rolled back[/bold red]"
+                )
+                storage.close()
+                return 1
+        storage.close()
+        return 0
+
+    # Пакет тримає замок сховища від завантаження до кінця,
+    # тож інші процеси Lotus чекають на нього з командами, що змінюють дані
+    if options.batch is not None:
+        with storage.lock:
+            load_books()
+            wait_loaded()
+            if options.batch == "-":
+                sys.exit(run_batch(sys.stdin, options.commit_every))
+            with open(options.batch, encoding="utf-8") as f:
+                sys.exit(run_batch(f, options.commit_every))
+
+    # Сервер: книги завантажуються один раз, далі синхронізуються перед кожною командою
+    if options.serve is not None:
+        from lotus_bot.server import ReplyConsole
+        from lotus_bot.server import serve
+
+        load_books()
+        wait_loaded()
+        start_flusher()
+        try:
+            serve(
+                options.serve,
+                api_execute,
+                lambda command: command in write_commands,
+                storage.lock,
+                {command: usage for command, usage in command_usage.items() if command not in api_excluded},
+                lambda address: console.print(f"[bold green]Serving the API on {address}, press Ctrl+C to stop[/bold green]"),
+                # Токен у змінній середовища, а не в аргументах, яких видно в списку процесів
+                os.environ.get("LOTUS_API_TOKEN") or None,
+            )
+        except ValueError as ex:
+            console.print(f"[bold red]{ex}[/bold red]")
+            close_storage()
+            sys.exit(1)
+        close_storage()
+        sys.exit(0)
+
     console.print("[bold green]Welcome to the assistant bot![/bold green]")
     print_help()
     console.print("Press [yellow]Tab[/yellow] for auto-completion.")
 
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.history import FileHistory
+
+    from lotus_bot.completion import CommandCompleter
+
+    history_path = data_path.joinpath(".history")
+    history = FileHistory(history_path)
+
+    # Поки контакти завантажуються, імена не доповнюються
+    def complete_names(prefix: str, limit: int) -> List[str]:
+        if loader.is_alive() or load_errors:
+            return []
+        return [
+            record.name.value
+            for record in book.find_records_starting_with(prefix, limit)
+        ]
+
+    completer = CommandCompleter(commands.keys(), name_commands, complete_names)
+
+    session = PromptSession(
+        history=history, completer=completer, reserve_space_for_menu=True
+    )
+    loader.start()
+    start_flusher()
+
     while True:
         try:
-            repl = parse_input("Enter a command: ")
-            match repl:
-                case ["add-phone", name, phone]:
-                    add(name, phone)
-                case ["add-birthday", name, birthday]:
-                    add_birthday(name, birthday)
-                case ["add-email", name, email]:
-                    add_email(name, email)
-                case ["add-address", name, address]:
-                    add_address(name, address)
-                case ["change", name, old_phone, new_phone]:
-                    change(name, old_phone, new_phone)
-                case ["remove", name]:
-                    remove(name)
-                case ["all", *args]:
-                    print_all(*args)
-                case ["phone", name]:
-                    print_phone(name)
-                case ["show-birthday", name]:
-                    show_birthday(name)
-                case ["birthdays", n_day]:
-                    birthdays(n_day)
-                case ["find-by-phone", phone]:
-                    find_by_phone(phone)
-                case ["find-by-email", email]:
-                    find_by_email(email)
-                case ["add-note", title, *args]:
-                    add_note(title, *args)
-                case ["add-tags", id, tags, *args]:
-                    add_tags(id, tags, *args)
-                case ["remove-tag", id, tag, *args]:
-                    remove_tag(id, tag, *args)
-                case ["edit-note", id, title, text, *args]:
-                    edit_note(id, title, text, *args)
-                case ["edit-note-text", id, text, *args]:
-                    edit_note_text(id, text, *args)
-                case ["remove-note", id]:
-                    remove_note(id)
-                case ["all-notes", *args]:
-                    all_notes(*args)
-                case ["notes-by-tags", tags, *args]:
-                    all_notes(*args, by_tags=tags)
-                case ["notes-by-text", text, *args]:
-                    all_notes(*args, by_text=text)
-                case ["exit"] | ["quit"] | ["close"]:
-                    console.print("[bold green]Good bye![/bold green]")
+            # Очікування вводу не входить у заміри команди
+            msg = session.prompt("Enter a command: ")
+            with metrics.command():
+                repl = parse_line(msg)
+                if repl[0] in exit_commands:
                     break
-                case ["hello"]:
-                    console.print("[bold green]How can I help you?[/bold green]")
-                case ["help"]:
-                    print_help()
-                case ["error"]:
-                    console.print("")
-                case _:
-                    console.print(
-                        f"[bold red]Unexpected command: {' '.join(repl)}[/bold red]"
-                    )
+                wait_loaded()
+                execute_synced(repl)
         except Exception as ex:
             console.print(f"[bold red]{ex}[/bold red]")
 
+    wait_loaded()
+    close_storage()
+    console.print("[bold green]Good bye![/bold green]")
+
 
 if __name__ == "__main__":
     main()
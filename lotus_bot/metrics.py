@@ -0,0 +1,164 @@
+"""Module for per-command latency histograms and profiling of slow commands"""
+from __future__ import annotations
+
+import math
+import os
+import pathlib
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import TYPE_CHECKING
+
+# cProfile потрібен лише з LOTUS_PROFILE_SLOW_MS, тож імпортується при потребі
+if TYPE_CHECKING:
+    from cProfile import Profile
+
+# Поріг (у мілісекундах), після якого профіль команди зберігається у файл.
+# Якщо не задано, команди не профілюються.
+PROFILE_SLOW_MS = os.environ.get("LOTUS_PROFILE_SLOW_MS")
+
+# Кошиків на кожну степінь двійки: відносна похибка перцентилів до ~9%
+SUB_BUCKETS = 8
+
+# Фази команди: розбір рядка, очікування фонового завантаження,
+# очікування замка та застосування змін інших процесів,
+# обробник, запис у сховище, вивід
+PHASES = ("parse", "load", "sync", "execute", "persist", "render")
+
+TOTAL = "total"
+
+
+class Histogram:
+    """
+    Гістограма затримок з логарифмічними кошиками:
+    пам'ять не залежить від кількості замірів, перцентиль -- верхня межа кошика
+    """
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        """Додає замір тривалістю seconds"""
+        nanoseconds = max(1, int(seconds * 1e9))
+        bucket = int(math.log2(nanoseconds) * SUB_BUCKETS)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        """Повертає перцентиль percent (0-100) у секундах"""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(percent / 100 * self.count)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.max, 2 ** ((bucket + 1) / SUB_BUCKETS) / 1e9)
+        return self.max
+
+
+class Metrics:
+    """
+    Затримки команд за фазами. command() охоплює одну команду,
+    phase() всередині неї додає час до фази, решта часу -- фаза execute.
+    З profile_slow_ms кожна команда виконується під cProfile,
+    а профілі команд, довших за поріг, зберігаються в profile_dir.
+    """
+
+    def __init__(self, profile_dir: pathlib.Path | None = None, profile_slow_ms: str | None = PROFILE_SLOW_MS):
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.profile_dir = profile_dir
+        self.profile_slow = float(profile_slow_ms) / 1000 if profile_slow_ms else None
+        # Назва та фази поточної команди
+        self.name = ""
+        self._phases: Dict[str, float] | None = None
+
+    def record(self, command: str, phase: str, seconds: float):
+        """Додає замір фази phase команди command"""
+        histogram = self.histograms.get((command, phase))
+        if histogram is None:
+            histogram = self.histograms[(command, phase)] = Histogram()
+        histogram.record(seconds)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Враховує час блоку у фазі name поточної команди"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self._phases is not None:
+                self._phases[name] = self._phases.get(name, 0.0) + time.perf_counter() - start
+
+    @contextmanager
+    def command(self) -> Iterator[Metrics]:
+        """Заміряє одну команду; її назву задає self.name"""
+        self.name = ""
+        self._phases = {}
+        profiler = None
+        if self.profile_slow is not None:
+            from cProfile import Profile
+
+            profiler = Profile()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield self
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            total = time.perf_counter() - start
+            phases, self._phases = self._phases, None
+            name = self.name or "error"
+            self.record(name, TOTAL, total)
+            for phase, seconds in phases.items():
+                self.record(name, phase, seconds)
+            self.record(name, "execute", max(0.0, total - sum(phases.values())))
+            if profiler is not None and total >= self.profile_slow:
+                self.dump(profiler, name)
+
+    def dump(self, profiler: Profile, name: str) -> pathlib.Path | None:
+        """Зберігає профіль команди name у profile_dir (для pstats чи snakeviz)"""
+        if self.profile_dir is None:
+            return None
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        path = self.profile_dir.joinpath(f"{datetime.now():%Y%m%d-%H%M%S-%f}-{name}.prof")
+        profiler.dump_stats(path)
+        return path
+
+    def rows(self) -> List[List]:
+        """Рядки звіту: команда, фаза, кількість, p50, p95, p99 та максимум у мілісекундах"""
+        order = {phase: number for number, phase in enumerate((TOTAL,) + PHASES)}
+        rows = []
+        for (command, phase), histogram in sorted(self.histograms.items(), key=lambda item: (item[0][0], order.get(item[0][1], len(order)))):
+            rows.append(
+                [
+                    command,
+                    phase,
+                    histogram.count,
+                    *(round(histogram.percentile(percent) * 1000, 3) for percent in (50, 95, 99)),
+                    round(histogram.max * 1000, 3),
+                ]
+            )
+        return rows
+
+
+def format_size(size: int) -> str:
+    """Розмір у байтах у зручному для читання вигляді"""
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
@@ -1,11 +1,21 @@
 """Module for notebook with notes"""
 from __future__ import annotations
 
+import re
+import sys
 from collections import UserDict
-from collections import UserList
-from datetime import datetime  # , timedelta
+from collections.abc import Iterable
+from collections.abc import Iterator
+from datetime import datetime
+from datetime import timedelta
+from typing import Dict
+from typing import Set
 
 from lotus_bot.field import Field
+from lotus_bot.ordering import SortedIndex
+from lotus_bot.search import scan_ranked
+from lotus_bot.search import TextIndex
+from lotus_bot.search import TrigramIndex
 
 # Клас для поля Title
 
@@ -13,6 +23,8 @@ from lotus_bot.field import Field
 class Title(Field):
     """Клас Title представляє поле заголовка нотатки"""
 
+    __slots__ = ()
+
     def __str__(self):
         return self.value
 
@@ -23,6 +35,8 @@ class Title(Field):
 class Note(Field):
     """Клас Note представляє поле самого тексту нотатки"""
 
+    __slots__ = ()
+
     def __str__(self):
         return self.value
 
@@ -30,20 +44,39 @@ class Note(Field):
 # Клас для тегів
 
 
-class Tags(UserList):
-    """Клас Tags - представляє список унікальних тегів"""
+class Tags(list):
+    """
+    Клас Tags - представляє список унікальних тегів.
+    Теги інтернуються, тож однаковий тег у тисячах нотаток -- один рядок.
+    """
+
+    __slots__ = ()
 
     def __init__(self, tag_string=""):
         initial_tags = tag_string.split(",") if tag_string else []
         unique_tags = self._normalize_and_filter(initial_tags)
         super().__init__(unique_tags)
 
+    @property
+    def data(self):
+        """список тегів (залишено для сумісності з UserList)"""
+        return self
+
+    def __reduce__(self):
+        # теги не містять ком, тож зберігаємо їх одним рядком,
+        # а при завантаженні вони знову нормалізуються та інтернуються
+        return (Tags, (",".join(self),))
+
+    def __setstate__(self, state):
+        # Знімки часів UserList зберігали теги в state["data"]
+        self.extend(self._normalize_and_filter(state["data"]))
+
     def _normalize_and_filter(self, tags):
         """Приймає iterable тегів та повертає унікальний список нормалізованих тегів"""
         seen = set()
         result = []
         for tag in tags:
-            cleaned = tag.strip().lower()
+            cleaned = sys.intern(tag.strip().lower())
             if cleaned and cleaned not in seen:
                 seen.add(cleaned)
                 result.append(cleaned)
@@ -53,17 +86,32 @@ class Tags(UserList):
         """Додає список тегів, уникаючи дублікатів"""
         tags = tags.split(",")
         new_tags = self._normalize_and_filter(tags)
-        added = [tag for tag in new_tags if tag not in self.data]
-        self.data.extend(added)
+        added = [tag for tag in new_tags if tag not in self]
+        self.extend(added)
 
     def remove_one(self, tag: str):
         """Видаляє тег"""
         tag = tag.strip().lower()
-        if tag in self.data:
-            self.data.remove(tag)
+        if tag in self:
+            self.remove(tag)
 
     def __str__(self):
-        return ", ".join(self.data)
+        return ", ".join(self)
+
+
+# Дати нотаток зберігаються цілим числом мікросекунд від цієї дати
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_epoch(moment: datetime) -> int:
+    """Перетворює дату в ціле число мікросекунд від EPOCH"""
+    return (moment - EPOCH) // MICROSECOND
+
+
+def from_epoch(value: int) -> datetime:
+    """Перетворює ціле число мікросекунд від EPOCH у дату"""
+    return EPOCH + value * MICROSECOND
 
 
 # Клас для нотатки
@@ -80,6 +128,11 @@ class NoteRecord:
 
     # _id_counter = 1
 
+    __slots__ = ("id", "title", "text", "_created", "_modified", "tags", "_version", "__weakref__")
+
+    # Поля, що зберігаються; лічильник змін належить лише об'єкту в пам'яті
+    _state_slots = ("id", "title", "text", "_created", "_modified", "tags")
+
     def __init__(self, title=None, text="", tags=None):
         self.id = -1  # NoteRecord._id_counter
         # NoteRecord._id_counter += 1
@@ -88,6 +141,34 @@ class NoteRecord:
         self.date_created = datetime.now()
         self.date_modified = self.date_created
         self.tags = Tags(tags if tags else "")
+        # Лічильник змін нотатки: кеші (як-от рядки таблиць) порівнюють його зі своїм
+        self._version = 0
+
+    @property
+    def date_created(self) -> datetime:
+        return from_epoch(self._created)
+
+    @date_created.setter
+    def date_created(self, value: datetime):
+        self._created = to_epoch(value)
+
+    @property
+    def date_modified(self) -> datetime:
+        return from_epoch(self._modified)
+
+    @date_modified.setter
+    def date_modified(self, value: datetime):
+        self._modified = to_epoch(value)
+
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self._state_slots}
+
+    def __setstate__(self, state):
+        # Старі знімки зберігали __dict__ з датами як datetime,
+        # присвоєння через властивості перетворює їх на числа
+        self._version = 0
+        for attr, value in state.items():
+            setattr(self, attr, value)
 
     def modify(self, new_title=None, new_text=None, tags=None):
         """метод для редагування нотатки
@@ -104,17 +185,19 @@ class NoteRecord:
         if tags:
             self.tags.add(tags)
         self.date_modified = datetime.now()
+        self._version += 1
 
     def remove_tag(self, tag: str):
         """видалення тегу з об'єкту NoteRecord"""
         if tag:
             self.tags.remove_one(tag)
+            self._version += 1
 
     def __str__(self):
         return (
             f"ID: {self.id}\nTitle: {self.title}\nText: {self.text}\n"
             f"Created: {self.date_created}\nModified: {self.date_modified}\n"
-            f"Tags: {self.tags.data}"
+            f"Tags: {list(self.tags)}"
         )
 
 
@@ -125,50 +208,145 @@ class TagIndex:
     """
     Підтримка індексації по тегам.
     модель словник де ключі - назви тегів,
-    а значення список id заміток, яка містить тег
+    а значення множина id заміток, яка містить тег,
+    плюс зворотний словник id замітки -> її теги,
+    тож видалення замітки коштує O(тегів замітки).
     """
 
     def __init__(self, dictionary):
-        self.index = {}
+        self.index: Dict[str, Set[int]] = {}
+        self.note_tags: Dict[int, Set[str]] = {}
         for record in dictionary.values():
             self.add_record_to_index(record)
 
     def add_record_to_index(self, record):
         """індексує нотатку по тегу"""
         for tag in record.tags.data:
-            self.index.setdefault(tag, []).append(record.id)
+            self.add_tag(record.id, tag)
 
     def remove_record_from_index(self, note_id):
         """видаляє ID нотатки з кожного тегу в якому зустрічається"""
-        for tag, ids in list(self.index.items()):
-            if note_id in ids:
-                ids.remove(note_id)
-                if not ids:
-                    del self.index[tag]
+        for tag in self.note_tags.pop(note_id, set()):
+            ids = self.index[tag]
+            ids.discard(note_id)
+            if not ids:
+                del self.index[tag]
 
     def add_tag(self, note_id, tag):
         """додає нотатку у індекс за тегом tag."""
-        ids = self.index.setdefault(tag, [])
-        if note_id not in ids:
-            ids.append(note_id)
+        self.index.setdefault(tag, set()).add(note_id)
+        self.note_tags.setdefault(note_id, set()).add(tag)
 
     def remove_tag(self, note_id, tag):
-        """видалення ID нотатки з списку для відповідного тега tag"""
-        ids = self.index.get(tag, [])
-        if note_id in ids:
-            ids.remove(note_id)
+        """видалення ID нотатки з множини для відповідного тега tag"""
+        ids = self.index.get(tag)
+        if ids is not None and note_id in ids:
+            ids.discard(note_id)
             if not ids:
                 del self.index[tag]
+            tags = self.note_tags[note_id]
+            tags.discard(tag)
+            if not tags:
+                del self.note_tags[note_id]
+
+    def postings(self, tag) -> Set[int]:
+        """повертає множину id заміток з тегом (не змінювати!)"""
+        return self.index.get(tag, set())
 
     def search(self, tag):
         """повертає список id заміток з тегом"""
-        return list(self.index.get(tag, []))
+        return sorted(self.index.get(tag, set()))
 
     def all(self):
         """повертає весь індекс."""
         return self.index
 
 
+# Вирази тегів: "," або "&" -- І, "|" -- АБО, "!" -- НЕ, дужки для групування.
+# Кома має вищий пріоритет за "|": "a,b|c" означає (a І b) АБО c.
+# Тег із символами операторів береться в лапки: '"r&d" | work'. Лапки без пари
+# або не перед оператором -- звичайні символи тегу: o'brien, rock'n'roll, 5" disk.
+TAG_QUERY_TOKEN = re.compile(
+    r"""\s*(?:(?P<quoted>"[^"]*"|'[^']*')(?=\s*(?:[(),&|!]|$))|(?P<token>[(),&|!]|[^(),&|!]+))"""
+)
+
+
+def parse_tag_query(query: str):
+    """
+    Розбирає вираз тегів у дерево з кортежів:
+    ("tag", назва), ("not", вузол), ("and", [вузли]), ("or", [вузли]).
+    Повертає None для порожнього виразу.
+    """
+    # Теги в лапках стають готовими вузлами ("tag", назва), решта -- рядками
+    tokens = []
+    position = 0
+    while position < len(query):
+        match = TAG_QUERY_TOKEN.match(query, position)
+        if match is None:
+            raise ValueError(f"Unexpected '{query[position:]}' in tag query: {query}")
+        if match["quoted"] is not None:
+            tokens.append(("tag", match["quoted"][1:-1].strip().lower()))
+        elif match["token"].strip():
+            tokens.append(match["token"].strip().lower())
+        position = match.end()
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        nodes = [parse_and()]
+        while peek() == "|":
+            take()
+            nodes.append(parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_and():
+        nodes = [parse_not()]
+        while peek() in (",", "&"):
+            take()
+            nodes.append(parse_not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def parse_not():
+        if peek() == "!":
+            take()
+            return ("not", parse_not())
+        if peek() == "(":
+            take()
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError(f"Missing ')' in tag query: {query}")
+            take()
+            return node
+        token = peek()
+        if token is None or token in ("|", ",", "&", ")"):
+            raise ValueError(f"Tag expected in tag query: {query}")
+        token = take()
+        return token if isinstance(token, tuple) else ("tag", token)
+
+    if not tokens:
+        return None
+    tree = parse_or()
+    if position != len(tokens):
+        token = peek()
+        raise ValueError(f"Unexpected '{token[1] if isinstance(token, tuple) else token}' in tag query: {query}")
+    return tree
+
+
+# Колонки, за якими нотатки мають відсортовані індекси, та значення для них
+SORTED_COLUMNS = {
+    "id": lambda record: record.id,
+    "created": lambda record: record._created,
+    "modified": lambda record: record._modified,
+}
+
+
 # Клас для списка нотаток
 
 
@@ -184,13 +362,85 @@ class NotesBook(UserDict):
     def __init__(self, dictionary):
         super().__init__()
         self.data = dictionary
-        self.tag_index = TagIndex(dictionary)
+        # Сховище може мати власний індекс тегів (наприклад, SQLite)
+        self.tag_index = getattr(dictionary, "tag_index", None) or TagIndex(dictionary)
+        # id останньої доданої нотатки
+        self.last_id = None
+        # наступний вільний id, обчислюється при першому додаванні
+        self._next_id: int | None = None
+        # Нотатки в базі (SQLite) розпаковуються лише при зверненні, тож текст у них
+        # шукається проходом: побудова індексів нижче розпакувала б усі нотатки
+        # і повторювалась би після кожного запису іншого процесу
+        self.text_indexed = isinstance(self.tag_index, TagIndex)
+        # повнотекстовий індекс та індекс трійок будуються при першому пошуку
+        self._text_index: TextIndex | None = None
+        self._trigram_index: TrigramIndex | None = None
+        # відсортовані індекси колонок будуються при першому сортуванні
+        self._orders: Dict[str, SortedIndex] | None = None
+
+    @property
+    def text_index(self) -> TextIndex:
+        """Повнотекстовий індекс заголовків та текстів нотаток"""
+        if self._text_index is None:
+            self._text_index = TextIndex(self.data.values())
+        return self._text_index
+
+    @property
+    def trigram_index(self) -> TrigramIndex:
+        """Індекс трійок символів заголовків та текстів нотаток"""
+        if self._trigram_index is None:
+            self._trigram_index = TrigramIndex(self.data.values())
+        return self._trigram_index
+
+    def sorted_ids(self, column: str, reverse: bool = False) -> Iterator[int] | None:
+        """
+        Повертає id нотаток, впорядковані за колонкою (id, created, modified),
+        проходом по відсортованому індексу; None, якщо індексу для колонки нема
+        """
+        column = column.casefold()
+        if column not in SORTED_COLUMNS:
+            return None
+        # Сховище може впорядкувати нотатки саме (SQLite -- ORDER BY за індексом)
+        ordered_ids = getattr(self.data, "ordered_ids", None)
+        if ordered_ids is not None:
+            return ordered_ids(column, reverse)
+        if self._orders is None:
+            # Колонковий знімок дає значення колонок без розпакування нотаток
+            sort_values = getattr(self.data, "sort_values", None)
+            pairs = sort_values() if sort_values is not None else None
+            if pairs is None:
+                records = list(self.data.values())
+                pairs = {
+                    name: [(value(record), record.id) for record in records]
+                    for name, value in SORTED_COLUMNS.items()
+                }
+            self._orders = {name: SortedIndex(pairs[name]) for name in SORTED_COLUMNS}
+        return self._orders[column].ordered(reverse)
+
+    def _reorder(self, record: NoteRecord):
+        if self._orders is not None:
+            for name, value in SORTED_COLUMNS.items():
+                self._orders[name].add(record.id, value(record))
+
+    def _reindex_text(self, record: NoteRecord):
+        if self._text_index is not None:
+            self._text_index.add_record(record)
+        if self._trigram_index is not None:
+            self._trigram_index.add_record(record)
 
     def __next_id(self) -> int:
-        if len(self.data) == 0:
-            return 1
-        else:
-            return max(self.data.keys()) + 1
+        # Лічильник обчислюється один раз, далі кожен id видається за O(1)
+        if self._next_id is None:
+            last_key = getattr(self.data, "last_key", None)
+            if last_key is not None:
+                self._next_id = (last_key() or 0) + 1
+            elif len(self.data) == 0:
+                self._next_id = 1
+            else:
+                self._next_id = max(self.data.keys()) + 1
+        id = self._next_id
+        self._next_id += 1
+        return id
 
     def add_note(self, record: NoteRecord):
         """
@@ -201,43 +451,114 @@ class NotesBook(UserDict):
         id = self.__next_id()
         record.id = id
         self.data[id] = record
+        self.last_id = id
         self.tag_index.add_record_to_index(record)
+        self._reindex_text(record)
+        self._reorder(record)
+
+    def import_notes(self, records: Iterable[NoteRecord], chunk_size: int = 1000) -> int:
+        """
+        Додає багато нотаток з новими id, повертає їх кількість.
+        Нотатки записуються пачками, індекс тегів оновлюється по ходу,
+        а повнотекстовий індекс та індекс трійок перебудуються при наступному пошуку.
+        """
+        count = 0
+        chunk: Dict[int, NoteRecord] = {}
+        for record in records:
+            record.id = self.__next_id()
+            self.tag_index.add_record_to_index(record)
+            chunk[record.id] = record
+            self.last_id = record.id
+            count += 1
+            if len(chunk) >= chunk_size:
+                self.data.update(chunk)
+                chunk = {}
+        self.data.update(chunk)
+        self._text_index = None
+        self._trigram_index = None
+        self._orders = None
+        return count
 
     def search_by_tags(self, tags: str):
         """
-        Повертає list of objects:NoteRecord, які мають задані теги.
-        tags повинен бути рядком з тегами через кому: "tag1, tag2"
+        Повертає list of objects:NoteRecord, які задовольняють вираз тегів.
+        Теги через кому означають І: "tag1, tag2";
+        підтримуються також "|" (АБО), "!" (НЕ) та дужки: "(work|home),!draft"
         """
-        # нормалізовані вхідні теги до списку
-        tag_list = [t.strip().lower() for t in tags.split(",") if t.strip()]
+        # Теги можуть містити символи операторів чи лапки (r&d, a|b, o'brien): запит,
+        # усі частини якого через кому -- наявні теги, шукається як раніше, без розбору виразу
+        parts = [part.strip().lower() for part in tags.split(",") if part.strip()]
+        if parts and all(self.tag_index.postings(part) for part in parts):
+            tree = ("and", [("tag", part) for part in parts])
+        else:
+            tree = parse_tag_query(tags)
 
         # якщо не передано жодного тегу, метод повартає пустий список
-        if not tag_list:
+        if tree is None:
             return []
 
-        # множини id для кожного тегу
-        id_sets = []
-        for tag in tag_list:
-            ids = set(self.tag_index.search(tag))
-            # якщо хоча б одного тегу не знайдено, метод повартає пустий список
-            if not ids:
-                return []
-            id_sets.append(ids)
-
-        # перетин всіх множини, щоб знайти спільні id
-        common_ids = set.intersection(*id_sets)
+        ids = self._evaluate_tags(tree)
 
         # список об’єктів NoteRecord за знайденими id
-        return [self.data[nid] for nid in common_ids if nid in self.data]
+        return [self.data[nid] for nid in sorted(ids) if nid in self.data]
+
+    def _evaluate_tags(self, node) -> Set[int]:
+        """Обчислює вузол виразу тегів; множини з індексу не змінюються"""
+        kind = node[0]
+        if kind == "tag":
+            return self.tag_index.postings(node[1])
+        if kind == "or":
+            result = set()
+            for child in node[1]:
+                result |= self._evaluate_tags(child)
+            return result
+        if kind == "not":
+            return set(self.data.keys()) - self._evaluate_tags(node[1])
+
+        # "and": перетинаємо позитивні множини, починаючи з найменшої,
+        # а заперечення віднімаємо наприкінці
+        positive = [self._evaluate_tags(c) for c in node[1] if c[0] != "not"]
+        negative = [c[1] for c in node[1] if c[0] == "not"]
+        if positive:
+            positive.sort(key=len)
+            result = set(positive[0])
+            for ids in positive[1:]:
+                if not result:
+                    return result
+                result &= ids
+        else:
+            result = set(self.data.keys())
+        for child in negative:
+            if not result:
+                break
+            result -= self._evaluate_tags(child)
+        return result
+
+    def search_ranked(self, query: str, k: int = 10):
+        """
+        Повертає до k пар (оцінка, NoteRecord), впорядкованих за релевантністю BM25
+        """
+        if self.text_indexed:
+            ranked = self.text_index.search(query, k)
+        else:
+            ranked = scan_ranked(self.data.values(), query, k)
+        return [(score, self.data[nid]) for score, nid in ranked]
 
     def search_by_notes_text(self, text: str):
         """
         Повертає список об'єктів NoteRecord, які містять текст .
+        Кандидати звужуються індексом трійок (для нотаток у SQLite -- всі нотатки),
+        а потім перевіряються підрядком.
         """
         text = text.lower()
+        # Короткі запити не мають трійок, тож переглядаємо всі нотатки
+        if len(text) < 3 or not self.text_indexed:
+            records = self.data.values()
+        else:
+            records = [self.data[nid] for nid in sorted(self.trigram_index.candidates(text))]
         return [
             record
-            for record in self.data.values()
+            for record in records
             if text in record.text.value.lower() or text in record.title.value.lower()
         ]
 
@@ -248,6 +569,13 @@ class NotesBook(UserDict):
         if note_id in self.data:
             del self.data[note_id]
             self.tag_index.remove_record_from_index(note_id)
+            if self._text_index is not None:
+                self._text_index.remove_record(note_id)
+            if self._trigram_index is not None:
+                self._trigram_index.remove_record(note_id)
+            if self._orders is not None:
+                for order in self._orders.values():
+                    order.remove(note_id)
             return True
         return False
 
@@ -273,6 +601,11 @@ class NotesBook(UserDict):
             added = new_tags.difference(old_tags)
             for tag in added:
                 self.tag_index.add_tag(note_id, tag)
+        if new_title or new_text:
+            self._reindex_text(note)
+        self._reorder(note)
+        # повторне присвоєння зберігає зміни у зовнішньому сховищі
+        self.data[note_id] = note
         return True
 
     def remove_tag(self, note_id, tag):
@@ -284,5 +617,40 @@ class NotesBook(UserDict):
             return False
 
         note.remove_tag(tag)
-        self.tag_index.remove_tag(note_id, tag)
+        self.tag_index.remove_tag(note_id, tag.strip().lower())
+        self.data[note_id] = note
         return True
+
+    def apply_change(self, note_id: int, record: NoteRecord | None):
+        """
+        Застосовує зміну нотатки, записану іншим процесом:
+        record -- її новий стан або None, якщо нотатку видалено.
+        Оновлює індекси, але нічого не пише у сховище.
+        """
+        if record is None:
+            self.delete_note(note_id)
+            return
+        self.tag_index.remove_record_from_index(note_id)
+        self.data[note_id] = record
+        self.tag_index.add_record_to_index(record)
+        self._reindex_text(record)
+        self._reorder(record)
+        if self._next_id is not None and note_id >= self._next_id:
+            self._next_id = note_id + 1
+
+    def index_sizes(self) -> Dict[str, int]:
+        """
+        Повертає кількість елементів кожного вже побудованого індексу в пам'яті
+        (індекси сховища, як у SQLite, не враховуються)
+        """
+        sizes = {}
+        if isinstance(self.tag_index, TagIndex):
+            sizes["tags"] = len(self.tag_index.index)
+        if self._text_index is not None:
+            sizes["words"] = len(self._text_index.postings)
+        if self._trigram_index is not None:
+            sizes["trigrams"] = len(self._trigram_index.postings)
+        if self._orders is not None:
+            for name, order in self._orders.items():
+                sizes[f"{name} order"] = len(order)
+        return sizes
@@ -0,0 +1,69 @@
+"""Module for typed sort keys and incrementally maintained sorted indexes"""
+from __future__ import annotations
+
+import bisect
+from collections.abc import Hashable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from datetime import date
+from datetime import datetime
+from datetime import time
+from typing import Any
+from typing import Dict
+from typing import Tuple
+
+
+def sort_key(field) -> Tuple:
+    """
+    Повертає типізований ключ сортування значення комірки:
+    спочатку порожні значення, далі числа, дати (за часом) і текст (без регістру)
+    """
+    if field is None or (isinstance(field, str) and not field):
+        return (0, 0)
+    if isinstance(field, (int, float)) and not isinstance(field, bool):
+        return (1, field)
+    if isinstance(field, datetime):
+        return (2, field)
+    if isinstance(field, date):
+        return (2, datetime.combine(field, time()))
+    return (3, str(field).casefold())
+
+
+class SortedIndex:
+    """
+    Відсортований індекс колонки: список пар (значення, ключ) за зростанням
+    плюс словник ключ -> значення, щоб зміна чи видалення запису знаходили
+    його пару бінарним пошуком. Впорядкований вивід -- прохід по списку
+    замість сортування всіх записів при кожному запиті.
+    """
+
+    def __init__(self, items: Iterable[Tuple[Any, Hashable]] = ()):
+        self.values: Dict[Hashable, Any] = {key: value for value, key in items}
+        self.entries = sorted((value, key) for key, value in self.values.items())
+
+    def add(self, key: Hashable, value: Any):
+        """Додає ключ key зі значенням value або оновлює його значення"""
+        if key in self.values:
+            if self.values[key] == value:
+                return
+            self.remove(key)
+        self.values[key] = value
+        bisect.insort(self.entries, (value, key))
+
+    def remove(self, key: Hashable):
+        """Видаляє ключ key з індексу"""
+        if key not in self.values:
+            return
+        entry = (self.values.pop(key), key)
+        del self.entries[bisect.bisect_left(self.entries, entry)]
+
+    def ordered(self, reverse: bool = False) -> Iterator[Hashable]:
+        """Повертає ключі за зростанням (або спаданням) значень"""
+        entries = reversed(self.entries) if reverse else self.entries
+        return (key for _, key in entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self.values
+
+    def __len__(self) -> int:
+        return len(self.values)
@@ -0,0 +1,387 @@
+"""Module for contact queries: parsing, planning over the indexes and execution"""
+from __future__ import annotations
+
+import calendar
+import re
+from collections.abc import Iterable
+from collections.abc import Iterator
+from datetime import date
+from typing import Callable
+from typing import List
+from typing import Set
+from typing import Tuple
+
+from lotus_bot.contacts import AddressBook
+from lotus_bot.contacts import Record
+
+# Запит -- умови поле-оператор-значення, з'єднані "and" (пробіл, ","), "or" ("|"),
+# "not" ("!") та дужками; "and" має вищий пріоритет за "or", як у виразах тегів:
+#   birthday:may address~kyiv has:email
+#   (name^iv | name^petr) !has:phone
+# Оператори: "=" або ":" -- дорівнює, "^" -- починається з, "~" -- містить
+QUERY_TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<punct>[()!|,&])
+        | (?P<field>\w+)\s*(?P<op>[=:^~])\s*(?P<value>"[^"]*"|'[^']*'|[^\s()!|,&]+)
+        | (?P<word>[^\s()!|,&]+)
+    )""",
+    re.VERBOSE,
+)
+
+KEYWORDS = {"and": "&", "or": "|", "not": "!"}
+
+TEXT_FIELDS = ("name", "phone", "email", "address")
+HAS_FIELDS = ("phone", "email", "birthday", "address")
+
+# Назви місяців англійською (повні та скорочені) -> номер місяця
+MONTHS = {
+    **{name.lower(): number for number, name in enumerate(calendar.month_name) if name},
+    **{name.lower(): number for number, name in enumerate(calendar.month_abbr) if name},
+}
+
+
+def _quote(value: str) -> str:
+    return f'"{value}"' if re.search(r"[\s()!|,&]", value) or not value else value
+
+
+class Condition:
+    """
+    Одна умова запиту: field, op ("=", "^", "~") та value.
+    Текстові поля порівнюються без регістру, крім "=" для phone та email, що
+    збігається з пошуком за індексом. birthday приймає місяць (may, 5), день
+    (22.07), дату (22.07.2000) або рік (2000); has -- назву поля, що має бути заповнене.
+    """
+
+    def __init__(self, field: str, op: str, value: str):
+        field = field.lower()
+        op = "=" if op == ":" else op
+        if field not in TEXT_FIELDS and field not in ("birthday", "has"):
+            raise ValueError(f"Unknown field '{field}' in query, use one of: {', '.join((*TEXT_FIELDS, 'birthday', 'has'))}")
+        if field in ("birthday", "has") and op != "=":
+            raise ValueError(f"Only '=' or ':' can be used with {field} in query")
+        self.field = field
+        self.op = op
+        self.value = value
+        self.month = self.day = self.year = None
+        if field == "has":
+            self.value = value.lower()
+            if self.value not in HAS_FIELDS:
+                raise ValueError(f"Unknown field '{value}' in has:, use one of: {', '.join(HAS_FIELDS)}")
+        elif field == "birthday":
+            self._parse_birthday(value)
+        self.match = self._matcher()
+
+    def _parse_birthday(self, value: str):
+        parts = value.split(".")
+        try:
+            if value.lower() in MONTHS:
+                self.month = MONTHS[value.lower()]
+            elif len(parts) == 1 and len(value) == 4:
+                self.year = int(value)
+            elif len(parts) == 1:
+                self.month = int(value)
+            elif len(parts) in (2, 3):
+                self.day, self.month = int(parts[0]), int(parts[1])
+                if len(parts) == 3:
+                    self.year = int(parts[2])
+                # Перевірка, що такий день існує (29.02 -- у високосному році)
+                date(self.year or 2000, self.month, self.day)
+            else:
+                raise ValueError
+            if not 1 <= (self.month or 1) <= 12:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"Invalid birthday '{value}' in query, use a month (may, 5), DD.MM, DD.MM.YYYY or YYYY") from None
+
+    def _matcher(self) -> Callable[[Record], bool]:
+        field, op = self.field, self.op
+        if field == "has":
+            if self.value == "phone":
+                return lambda record: bool(record.phones.data)
+            attribute = self.value
+            return lambda record: getattr(record, attribute) is not None
+
+        if field == "birthday":
+            month, day, year = self.month, self.day, self.year
+
+            def birthday(record: Record) -> bool:
+                if record.birthday is None:
+                    return False
+                value = record.birthday.value
+                return (
+                    (month is None or value.month == month)
+                    and (day is None or value.day == day)
+                    and (year is None or value.year == year)
+                )
+
+            return birthday
+
+        # Телефони -- лише цифри та "+", а email за індексом шукається точно.
+        # Ім'я нормалізується як ключі контактів і NameIndex (lower, а не casefold),
+        # тож перебір і шлях через індекс повертають те саме: "Straße" не збігається з "strass"
+        if field == "phone" or field == "email" and op == "=":
+            value = self.value.strip()
+        elif field == "name":
+            value = (self.value.lstrip() if op == "^" else self.value.strip()).lower()
+        else:
+            value = self.value.strip().casefold()
+        if op == "=":
+            compare = str.__eq__
+        elif op == "^":
+            compare = str.startswith
+        else:
+            compare = str.__contains__
+
+        if field == "phone":
+            return lambda record: any(compare(phone, value) for phone in record.phones.data)
+        if field == "name":
+            return lambda record: compare(record.name.value.lower(), value)
+        if field == "email" and op == "=":
+            return lambda record: record.email is not None and record.email.value == value
+
+        def text(record: Record) -> bool:
+            attribute = getattr(record, field)
+            return attribute is not None and compare(attribute.value.casefold(), value)
+
+        return text
+
+    def __str__(self):
+        return f"{self.field}{':' if self.field in ('has', 'birthday') else self.op}{_quote(self.value)}"
+
+
+def parse_query(query: str):
+    """
+    Розбирає запит у дерево з кортежів:
+    ("cond", Condition), ("not", вузол), ("and", [вузли]), ("or", [вузли]).
+    Повертає None для порожнього запиту.
+    """
+    tokens = []
+    position = 0
+    while position < len(query):
+        found = QUERY_TOKEN.match(query, position)
+        if found is None or found.end() == position:
+            if query[position:].strip():
+                raise ValueError(f"Cannot parse query at '{query[position:]}'")
+            break
+        position = found.end()
+        if found["punct"]:
+            tokens.append(found["punct"])
+        elif found["field"]:
+            value = found["value"]
+            if value[:1] in ("'", '"'):
+                value = value[1:-1]
+            tokens.append(Condition(found["field"], found["op"], value))
+        elif found["word"].lower() in KEYWORDS:
+            tokens.append(KEYWORDS[found["word"].lower()])
+        else:
+            raise ValueError(f"Condition expected in query, got '{found['word']}' (e.g. name^jo, birthday:may, has:email)")
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        nodes = [parse_and()]
+        while peek() == "|":
+            take()
+            nodes.append(parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_and():
+        nodes = [parse_not()]
+        # Умови підряд без оператора теж з'єднуються "and"
+        while peek() in (",", "&", "!", "(") or isinstance(peek(), Condition):
+            if peek() in (",", "&"):
+                take()
+            nodes.append(parse_not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def parse_not():
+        if peek() == "!":
+            take()
+            return ("not", parse_not())
+        if peek() == "(":
+            take()
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError(f"Missing ')' in query: {query}")
+            take()
+            return node
+        token = peek()
+        if not isinstance(token, Condition):
+            raise ValueError(f"Condition expected in query: {query}")
+        return ("cond", take())
+
+    if not tokens:
+        return None
+    tree = parse_or()
+    if position != len(tokens):
+        raise ValueError(f"Unexpected '{peek()}' in query: {query}")
+    return tree
+
+
+def describe(node) -> str:
+    """Запит у канонічному записі: AND, OR, NOT та дужки навколо вкладених груп"""
+    kind, value = node
+    if kind == "cond":
+        return str(value)
+    if kind == "not":
+        return f"NOT {describe(value)}" if value[0] in ("cond", "not") else f"NOT ({describe(value)})"
+    parts = [describe(child) if child[0] in ("cond", "not") else f"({describe(child)})" for child in value]
+    return f" {kind.upper()} ".join(parts)
+
+
+def matches(node, record: Record) -> bool:
+    """Перевіряє, чи задовольняє контакт запит"""
+    kind, value = node
+    if kind == "cond":
+        return value.match(record)
+    if kind == "not":
+        return not matches(value, record)
+    if kind == "and":
+        return all(matches(child, record) for child in value)
+    return any(matches(child, record) for child in value)
+
+
+class AccessPath:
+    """
+    Шлях доступу через індекс: опис, функція, що повертає ключі кандидатів
+    (не більше limit, якщо індекс уміє зупинитись раніше), і чи точно
+    збігаються кандидати з умовою (тоді її не треба перевіряти вдруге)
+    """
+
+    def __init__(self, description: str, keys: Callable[[int | None], Iterable[str]], exact: bool, rank: int):
+        self.description = description
+        self.keys = keys
+        self.exact = exact
+        # Порядок оцінки: спочатку дешеві точкові пошуки, потім діапазони
+        self.rank = rank
+
+
+def access_path(node, book: AddressBook) -> AccessPath | None:
+    """Шлях через індекс для умови (чи "or" умов з індексами) або None, якщо потрібен перебір"""
+    kind, value = node
+    if kind == "or":
+        paths = [access_path(child, book) for child in value]
+        if any(path is None for path in paths):
+            return None
+
+        def union(limit: int | None) -> Set[str]:
+            keys: Set[str] = set()
+            for path in paths:
+                keys.update(path.keys(limit))
+            return keys
+
+        return AccessPath(
+            " + ".join(path.description for path in paths), union, all(path.exact for path in paths), max(path.rank for path in paths)
+        )
+    if kind != "cond":
+        return None
+
+    condition = value
+    index = book.index
+    if condition.field == "name" and condition.op == "=":
+        key = condition.value.strip().lower()
+        return AccessPath(f"name key {_quote(key)}", lambda limit: [key] if key in book.data else [], True, 0)
+    if condition.field == "name" and condition.op == "^":
+        prefix = condition.value.lstrip().lower()
+        return AccessPath(f"name index prefix {_quote(prefix)}", lambda limit: book.name_index.starting_with(prefix, limit), True, 2)
+    if condition.field == "phone" and condition.op == "=":
+        phone = condition.value.strip()
+        return AccessPath(f"phone index {_quote(phone)}", lambda limit: index.keys_by_phone(phone), True, 0)
+    if condition.field == "email" and condition.op == "=":
+        email = condition.value.strip()
+        return AccessPath(f"email index {_quote(email)}", lambda limit: index.keys_by_email(email), True, 0)
+    if condition.field == "birthday" and condition.month is not None:
+        month = condition.month
+        if condition.day is not None:
+            day = condition.day
+            return AccessPath(
+                f"birthday index {day:02}.{month:02}", lambda limit: index.keys_by_birthday(month, day), condition.year is None, 1
+            )
+
+        def month_keys(limit: int | None) -> Set[str]:
+            keys: Set[str] = set()
+            for day in range(1, calendar.monthrange(2000, month)[1] + 1):
+                keys.update(index.keys_by_birthday(month, day))
+            return keys
+
+        return AccessPath(f"birthday index month {calendar.month_abbr[month]}", month_keys, condition.year is None, 2)
+    return None
+
+
+class Plan:
+    """
+    План запиту: найвибірковіший шлях через індекс серед умов верхнього рівня,
+    з'єднаних "and" (або перебір усіх контактів, якщо індексу нема),
+    та решта умов, що перевіряються на кожному кандидаті.
+
+    Кожен шлях оцінюється кількістю своїх кандидатів; шляхи з тих самих
+    хеш-індексів рахуються майже безкоштовно, а префікс імені обмежується
+    найменшою вже знайденою кількістю, тож дорогий шлях не обходиться повністю.
+    """
+
+    def __init__(self, tree, book: AddressBook):
+        self.tree = tree
+        self.book = book
+        conjuncts = tree[1] if tree[0] == "and" else [tree]
+        # Оцінені шляхи: (шлях, умова, кількість кандидатів для explain)
+        self.paths: List[Tuple[AccessPath, object, str]] = []
+        self.driver: Tuple[AccessPath, object] | None = None
+        self.keys: List[str] | None = None
+        found = [(path, node) for node in conjuncts if (path := access_path(node, book)) is not None]
+        for path, node in sorted(found, key=lambda item: item[0].rank):
+            # При рівній кількості лишається дешевший шлях, знайдений раніше
+            limit = None if self.keys is None else len(self.keys)
+            keys = list(path.keys(limit))
+            if limit is not None and len(keys) >= limit:
+                self.paths.append((path, node, f">= {limit}" if len(keys) == limit else str(len(keys))))
+                continue
+            self.paths.append((path, node, str(len(keys))))
+            self.keys = keys
+            self.driver = (path, node)
+        driver_node = self.driver[1] if self.driver is not None and self.driver[0].exact else None
+        self.residual = [node for node in conjuncts if node is not driver_node]
+        self.checked = 0
+
+    def records(self) -> Iterator[Record]:
+        """Контакти, що задовольняють запит, за ключем (іменем)"""
+        data = self.book.data
+        self.checked = 0
+        if self.keys is None:
+            candidates = data.items()
+        else:
+            candidates = ((key, data[key]) for key in self.keys if key in data)
+        found = []
+        for key, record in candidates:
+            self.checked += 1
+            if all(matches(node, record) for node in self.residual):
+                found.append((key, record))
+        found.sort(key=lambda item: item[0])
+        return (record for _, record in found)
+
+    def explain(self) -> List[str]:
+        """Рядки з описом плану: оцінені шляхи, обраний шлях і фільтр"""
+        lines = [f"Query: {describe(self.tree)}"]
+        for path, node, count in self.paths:
+            lines.append(f"  candidate: {path.description} -> {count} key(s)")
+        if self.driver is None:
+            lines.append(f"Plan: full scan of {len(self.book.data)} contact(s)")
+        else:
+            lines.append(f"Plan: {self.driver[0].description} -> {len(self.keys)} of {len(self.book.data)} contact(s)")
+        if self.residual:
+            lines.append(f"Filter: {' AND '.join(describe(node) if node[0] != 'or' else f'({describe(node)})' for node in self.residual)}")
+        return lines
+
+
+def plan_query(query: str, book: AddressBook) -> Plan:
+    """Розбирає запит і будує для нього план над індексами книги"""
+    tree = parse_query(query)
+    if tree is None:
+        raise ValueError("Empty query, e.g. find \"birthday:may address~kyiv has:email\"")
+    return Plan(tree, book)
@@ -1,18 +1,120 @@
 """Module for printing output in table-like format in single style"""
 from __future__ import annotations
 
+import heapq
+from collections.abc import Iterable
+from collections.abc import Sequence
 from datetime import datetime
 from datetime import time
+from itertools import islice
+from typing import Any
+from typing import Callable
+from weakref import WeakKeyDictionary
 
 from rich.console import Console
 from rich.table import Table
 
+from lotus_bot.ordering import sort_key
+
 SORTABLE_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
 SORTABLE_DATE_FORMAT = "%Y-%m-%d"
 
 
+def format_field(field) -> str:
+    """Text of a table cell: dates in sortable format, None as empty"""
+    if isinstance(field, datetime):
+        if field.time() == time(0, 0, 0):
+            return field.strftime(SORTABLE_DATE_FORMAT)
+        return field.strftime(SORTABLE_TIMESTAMP_FORMAT)
+    return str(field) if field is not None else ""
+
+
+class CachedRow(list):
+    """Row of typed cell values (sorted by them) whose cell texts are cached per record, see RowCache"""
+
+    __slots__ = ("record", "cache")
+
+
+def format_row(row: list) -> Sequence[str]:
+    """Texts of the row cells, see format_field; a CachedRow is formatted once per record version"""
+    if type(row) is CachedRow:
+        return row.cache.cells(row)
+    return [format_field(field) for field in row]
+
+
+class RowCache:
+    """
+    Table rows of records built by row(record) with their cell texts cached.
+    Rows are cheap and are built on every listing, so sorting stays as it was;
+    only the printed rows are formatted, and the texts are reused while the
+    record's _version (bumped by its mutators) is the one they were made for.
+    Repeated listings thus skip formatting for untouched records.
+    Records are weakly referenced: their texts go away with them.
+    """
+
+    def __init__(self, row: Callable[[Any], list]):
+        self.row = row
+        self.texts: WeakKeyDictionary = WeakKeyDictionary()
+
+    def __call__(self, record) -> CachedRow:
+        row = CachedRow(self.row(record))
+        row.record = record
+        row.cache = self
+        return row
+
+    def cells(self, row: CachedRow) -> Sequence[str]:
+        """Cell texts of the row, formatted only if its record changed since the last time"""
+        record = row.record
+        version = record._version
+        cached = self.texts.get(record)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        cells = tuple(format_field(field) for field in row)
+        self.texts[record] = (version, cells)
+        return cells
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+
+def select_rows(
+    columns: list[dict],
+    rows: Iterable[list],
+    sort_by: str = "",
+    reverse_sort: bool = False,
+    limit: int | None = None,
+    offset: int = 0,
+) -> Iterable[list]:
+    """
+    Sorts, skips offset and keeps up to limit rows, as print_as_rich_table does.
+    With sort_by and limit only the first offset + limit rows are kept
+    while sorting (heapq), without sort_by rows are consumed lazily.
+    """
+    end = None if limit is None else offset + limit
+    if not sort_by:
+        return islice(rows, offset, end)
+
+    sort_col_index = [col.get("name").casefold() for col in columns].index(
+        sort_by.casefold()
+    )
+
+    def row_key(row):
+        return sort_key(row[sort_col_index])
+
+    if end is not None:
+        select = heapq.nlargest if reverse_sort else heapq.nsmallest
+        return select(end, rows, key=row_key)[offset:]
+    return sorted(rows, key=row_key, reverse=reverse_sort)[offset:]
+
+
 def print_as_rich_table(
-    columns: list[dict], rows: list[list], sort_by: str = "", reverse_sort: bool = False
+    columns: list[dict],
+    rows: Iterable[list],
+    sort_by: str = "",
+    reverse_sort: bool = False,
+    limit: int | None = None,
+    offset: int = 0,
+    pager: bool = False,
 ):
     """
     Prints data as a rich table with customizable columns and rows.
@@ -23,26 +125,19 @@ def print_as_rich_table(
                  "max_width", "justify", "no_wrap".
                  Example: [{"name": "Name", "min_width": 10},
                      {"name": "Age", "justify": "center"}]
-        rows: A list of lists, where each inner list represents a row of data.
+        rows: An iterable of lists, where each inner list represents a row of data.
               The order of elements in each inner list should match the order
               of columns defined in the 'columns' parameter.
-        sort_by: optional column name to sort by
+        sort_by: optional column name to sort by (typed, see ordering.sort_key)
         reverse_sort: optional boolean flag to sort in reversed order
+        limit: optional maximum number of rows to print
+        offset: optional number of leading rows to skip
+        pager: optional flag to show the table in a pager
+    Rows are selected by select_rows, so only the printed rows are ever formatted;
+    the texts of a CachedRow (see RowCache) are reused until its record changes.
     """
     console = Console()
 
-    def none_as_empty(field):
-        return str(field) if field is not None else ""
-
-    def date_time_sortable_format(field):
-        if isinstance(field, datetime):
-            if field.time() == time(0, 0, 0):
-                return field.strftime(SORTABLE_DATE_FORMAT)
-            else:
-                return field.strftime(SORTABLE_TIMESTAMP_FORMAT)
-        else:
-            return field
-
     table = Table(
         show_header=True,
         header_style="bold green",
@@ -60,16 +155,11 @@ def print_as_rich_table(
             no_wrap=col_info.get("no_wrap", False),
         )
 
-    if sort_by:
-        sort_col_index = [col.get("name").casefold() for col in columns].index(
-            sort_by.casefold()
-        )
-        rows.sort(key=lambda row: str(row[sort_col_index]), reverse=reverse_sort)
-
-    for row_data in rows:
-        processed_row = [
-            none_as_empty(date_time_sortable_format(field)) for field in row_data
-        ]
-        table.add_row(*processed_row)
+    for row_data in select_rows(columns, rows, sort_by, reverse_sort, limit, offset):
+        table.add_row(*format_row(row_data))
 
-    console.print(table)
+    if pager:
+        with console.pager(styles=True):
+            console.print(table)
+    else:
+        console.print(table)
@@ -0,0 +1,198 @@
+"""Module for ranked full-text search in notes"""
+from __future__ import annotations
+
+import heapq
+import math
+import re
+from collections import Counter
+from collections.abc import Iterable
+from typing import Dict
+from typing import List
+from typing import Set
+from typing import Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Параметри BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Розбиває текст на слова в нижньому регістрі"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class TextIndex:
+    """
+    Інвертований індекс слів заголовків та текстів нотаток.
+    модель: словник слово -> {id нотатки: кількість входжень},
+    плюс зворотний словник id нотатки -> слова, щоб видалення
+    коштувало O(слів нотатки), а не O(розміру індексу).
+    """
+
+    def __init__(self, records: Iterable = ()):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.terms: Dict[int, Counter] = {}
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+        for record in records:
+            self.add_record(record)
+
+    def add_record(self, record):
+        """індексує заголовок та текст нотатки"""
+        self.remove_record(record.id)
+        words = tokenize(f"{record.title.value}\n{record.text.value}")
+        terms = Counter(words)
+        self.terms[record.id] = terms
+        self.lengths[record.id] = len(words)
+        self.total_length += len(words)
+        postings = self.postings
+        for term, count in terms.items():
+            ids = postings.get(term)
+            if ids is None:
+                postings[term] = {record.id: count}
+            else:
+                ids[record.id] = count
+
+    def remove_record(self, note_id):
+        """видаляє нотатку з індексу"""
+        terms = self.terms.pop(note_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.lengths.pop(note_id)
+        for term in terms:
+            ids = self.postings[term]
+            del ids[note_id]
+            if not ids:
+                del self.postings[term]
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[float, int]]:
+        """
+        повертає до k пар (оцінка BM25, id нотатки), найкращі першими
+        """
+        n_docs = len(self.terms)
+        if n_docs == 0:
+            return []
+        avg_length = self.total_length / n_docs
+
+        return bm25(set(tokenize(query)), self.postings, self.lengths, n_docs, avg_length, k)
+
+
+def bm25(
+    terms: Set[str],
+    postings: Dict[str, Dict[int, int]],
+    lengths: Dict[int, int],
+    n_docs: int,
+    avg_length: float,
+    k: int,
+) -> List[Tuple[float, int]]:
+    """
+    повертає до k пар (оцінка BM25, id нотатки) за входженнями слів terms
+    (postings: слово -> {id нотатки: кількість}, lengths: id нотатки -> кількість слів)
+    """
+    scores: Dict[int, float] = {}
+    for term in terms:
+        ids = postings.get(term)
+        if not ids:
+            continue
+        idf = math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+        for note_id, count in ids.items():
+            length = lengths[note_id]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            scores[note_id] = scores.get(note_id, 0.0) + idf * count * (
+                BM25_K1 + 1
+            ) / (count + norm)
+
+    return heapq.nlargest(k, ((score, nid) for nid, score in scores.items()))
+
+
+def scan_ranked(records: Iterable, query: str, k: int = 10) -> List[Tuple[float, int]]:
+    """
+    повертає до k пар (оцінка BM25, id нотатки) одним проходом по нотатках без індексу,
+    з тими самими оцінками, що й TextIndex.search (запам'ятовуються лише слова запиту)
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+    postings: Dict[str, Dict[int, int]] = {term: {} for term in terms}
+    lengths: Dict[int, int] = {}
+    n_docs = 0
+    total_length = 0
+    for record in records:
+        words = tokenize(f"{record.title.value}\n{record.text.value}")
+        n_docs += 1
+        total_length += len(words)
+        for term in terms.intersection(words):
+            postings[term][record.id] = words.count(term)
+            lengths[record.id] = len(words)
+    if n_docs == 0:
+        return []
+    return bm25(terms, postings, lengths, n_docs, total_length / n_docs, k)
+
+
+def trigrams(text: str) -> Set[str]:
+    """Повертає множину трійок символів рядка"""
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """
+    Індекс трійок символів заголовків та текстів нотаток (в нижньому регістрі).
+    модель: словник трійка -> множина id нотаток,
+    плюс зворотний словник id нотатки -> її трійки.
+    Використовується лише для звуження кандидатів: кожна нотатка,
+    що містить рядок, містить і всі його трійки.
+    """
+
+    def __init__(self, records: Iterable = ()):
+        self.postings: Dict[str, Set[int]] = {}
+        self.grams: Dict[int, Set[str]] = {}
+        for record in records:
+            self.add_record(record)
+
+    def add_record(self, record):
+        """індексує заголовок та текст нотатки"""
+        self.remove_record(record.id)
+        grams = trigrams(record.title.value.lower()) | trigrams(
+            record.text.value.lower()
+        )
+        self.grams[record.id] = grams
+        postings = self.postings
+        for gram in grams:
+            ids = postings.get(gram)
+            if ids is None:
+                postings[gram] = {record.id}
+            else:
+                ids.add(record.id)
+
+    def remove_record(self, note_id):
+        """видаляє нотатку з індексу"""
+        grams = self.grams.pop(note_id, None)
+        if grams is None:
+            return
+        for gram in grams:
+            ids = self.postings[gram]
+            ids.discard(note_id)
+            if not ids:
+                del self.postings[gram]
+
+    def candidates(self, text: str) -> Set[int]:
+        """
+        повертає id нотаток, що містять усі трійки рядка text
+        (text вже в нижньому регістрі і не коротший за 3 символи)
+        """
+        postings = []
+        for gram in trigrams(text):
+            ids = self.postings.get(gram)
+            if not ids:
+                return set()
+            postings.append(ids)
+        # перетинаємо, починаючи з найкоротших списків
+        postings.sort(key=len)
+        result = set(postings[0])
+        for ids in postings[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
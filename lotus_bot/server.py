@@ -0,0 +1,347 @@
+"""
+Module for the local JSON API server over the bot commands
+
+    lotus-cli --serve [HOST:PORT | unix:PATH]
+
+POST /command with a JSON body {"command": "find-by-phone", "args": ["+380501234567"]}
+runs the command like the prompt does and answers with
+{"ok": true, "output": [...], "records": [...], "tables": [...]}.
+GET /commands lists the available commands and their usage.
+With LOTUS_API_TOKEN set, every request must send "Authorization: Bearer <token>";
+without it the server only binds to loopback addresses and unix sockets.
+"""
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import os
+import pathlib
+import signal
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from rich.errors import MarkupError
+from rich.text import Text
+
+from lotus_bot import transfer
+from lotus_bot.contacts import Record
+from lotus_bot.notes import NoteRecord
+from lotus_bot.rich_table_printer import format_row
+from lotus_bot.rich_table_printer import select_rows
+
+# Найбільший дозволений розмір тіла запиту
+MAX_BODY = 64 * 1024
+
+# Найбільший розмір рядка запиту чи заголовка
+MAX_LINE = 8 * 1024
+
+LOOPBACK_HOSTS = {"127.0.0.1", "localhost", "::1", "[::1]"}
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    415: "Unsupported Media Type",
+}
+
+
+class ApiError(Exception):
+    """Помилка запиту, що повертається клієнту з HTTP-статусом"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ReplyConsole:
+    """
+    Підміняє консоль під час виконання команди сервером:
+    рядки виводу, записи та таблиці збираються у JSON-відповідь
+    """
+
+    def __init__(self):
+        self.output: List[str] = []
+        self.records: List[Dict[str, Any]] = []
+        self.tables: List[Dict[str, Any]] = []
+
+    def print(self, *objects, **kwargs):
+        """Те саме, що Console.print: рядки з розміткою rich, записи контактів і нотаток"""
+        for obj in objects:
+            if isinstance(obj, Record):
+                self.records.append(transfer.contact_row(obj))
+            elif isinstance(obj, NoteRecord):
+                self.records.append(transfer.note_row(obj))
+            else:
+                self.output.extend(line for line in plain(obj).splitlines() if line.strip())
+
+    def add_table(
+        self,
+        columns: List[dict],
+        rows,
+        sort_by: str = "",
+        reverse_sort: bool = False,
+        limit: int | None = None,
+        offset: int = 0,
+        pager: bool = False,
+    ):
+        """Додає таблицю з тими ж рядками, що вивела б print_as_rich_table"""
+        selected = select_rows(columns, rows, sort_by, reverse_sort, limit, offset)
+        self.tables.append(
+            {
+                "columns": [column["name"] for column in columns],
+                "rows": [list(format_row(row)) for row in selected],
+            }
+        )
+
+    def reply(self, ok: bool) -> Dict[str, Any]:
+        """Тіло відповіді"""
+        return {"ok": ok, "output": self.output, "records": self.records, "tables": self.tables}
+
+
+def plain(obj) -> str:
+    """Текст без розмітки rich"""
+    if not isinstance(obj, str):
+        return str(obj)
+    try:
+        return Text.from_markup(obj).plain
+    except MarkupError:
+        return obj
+
+
+def host_name(host: str) -> str:
+    """Ім'я з заголовка Host без порту"""
+    host = host.strip().lower()
+    if host.startswith("["):
+        return host.partition("]")[0] + "]"
+    return host.partition(":")[0]
+
+
+def parse_address(address: str) -> Tuple[str, str | None, int | None]:
+    """Розбирає адресу: ("unix", шлях, None) або ("tcp", хост, порт)"""
+    if address.startswith("unix:"):
+        return "unix", address.removeprefix("unix:"), None
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"Invalid server address {address!r}, expected HOST:PORT or unix:PATH")
+    return "tcp", host.strip("[]") or "127.0.0.1", int(port)
+
+
+class Server:
+    """
+    HTTP/1.1 сервер JSON API з keep-alive з'єднаннями.
+
+    Команди читання виконуються одразу в циклі подій: вони працюють з книгами
+    в пам'яті і не чекають на ввід-вивід, тож багато з'єднань обслуговуються
+    навперемінно без перемикання потоків.
+    Команди запису виконуються по одній: одразу, якщо замок сховища вільний,
+    інакше в окремому потоці, що чекає на замок (його тримає інший процес),
+    не зупиняючи читання; лише на час самої зміни книг нові читання чекають на gate.
+
+    run(request, write) виконує команду і повертає тіло відповіді,
+    lock -- замок сховища, який потік запису тримає на час команди.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[Dict[str, Any], bool], Dict[str, Any]],
+        is_write: Callable[[str], bool],
+        lock,
+        usage: Dict[str, str],
+        token: str | None = None,
+    ):
+        self.run = run
+        self.is_write = is_write
+        self.lock = lock
+        self.usage = usage
+        # Токен, який кожен запит має надіслати в заголовку Authorization
+        self.token = token
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lotus-write")
+        self.writes: asyncio.Lock | None = None
+        # Відкритий, поки жоден запис не змінює книги
+        self.gate: asyncio.Event | None = None
+        self.allowed_hosts: set | None = None
+
+    async def execute(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Виконує команду: читання -- одразу, запис -- в потоці запису"""
+        if not self.is_write(str(request.get("command", "")).strip().lower()):
+            await self.gate.wait()
+            return self.run(request, False)
+
+        loop = asyncio.get_running_loop()
+        async with self.writes:
+            # Замок вільний: запис виконується одразу, без переходу в інший потік
+            if self.lock.acquire(blocking=False):
+                try:
+                    return self.run(request, True)
+                finally:
+                    self.lock.release()
+
+            ready = loop.create_future()
+            go = threading.Event()
+
+            def write() -> Dict[str, Any]:
+                with self.lock:
+                    loop.call_soon_threadsafe(ready.set_result, None)
+                    go.wait()
+                    return self.run(request, True)
+
+            done = loop.run_in_executor(self.writer, write)
+            # Поки потік чекає на замок сховища, читання тривають
+            await asyncio.wait({ready, done}, return_when=asyncio.FIRST_COMPLETED)
+            self.gate.clear()
+            go.set()
+            try:
+                return await done
+            finally:
+                self.gate.set()
+
+    async def route(self, method: str, target: str, headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+        """Обробляє запит і повертає тіло відповіді"""
+        if self.allowed_hosts is not None and host_name(headers.get("host", "")) not in self.allowed_hosts:
+            # Захист від DNS rebinding: сторінка в браузері не може звернутися до сервера під чужим ім'ям
+            raise ApiError(403, "Host is not allowed")
+        if self.token is not None and not hmac.compare_digest(
+            headers.get("authorization", "").encode("utf-8"), f"Bearer {self.token}".encode("utf-8")
+        ):
+            raise ApiError(401, "Missing or invalid API token")
+        path = target.split("?", 1)[0]
+        if path == "/commands":
+            if method != "GET":
+                raise ApiError(405, "Use GET /commands")
+            return {"commands": self.usage}
+        if path != "/command":
+            raise ApiError(404, f"Unknown path {path}")
+        if method != "POST":
+            raise ApiError(405, "Use POST /command")
+        # Браузер не надішле application/json на чужий сервер без дозволу CORS
+        if headers.get("content-type", "").split(";", 1)[0].strip().lower() != "application/json":
+            raise ApiError(415, "Content-Type must be application/json")
+        try:
+            request = json.loads(body)
+        except ValueError as ex:
+            raise ApiError(400, f"Invalid JSON: {ex}")
+        if (
+            not isinstance(request, dict)
+            or not isinstance(request.get("command"), str)
+            or not isinstance(request.get("args", []), list)
+            or not all(isinstance(arg, str) for arg in request.get("args", []))
+        ):
+            raise ApiError(400, 'Expected {"command": "...", "args": ["...", ...]}')
+        return await self.execute(request)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Обслуговує одне з'єднання, запит за запитом"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                keep_alive = True
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    headers = {}
+                    while True:
+                        line = await reader.readline()
+                        if line in (b"\r\n", b"\n", b""):
+                            break
+                        name, _, value = line.decode("latin-1").partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                    length = int(headers.get("content-length", 0))
+                    if length > MAX_BODY:
+                        keep_alive = False
+                        raise ApiError(413, f"Request body is limited to {MAX_BODY} bytes")
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = 200, await self.route(method, target, headers, body)
+                except ApiError as ex:
+                    status, payload = ex.status, {"error": str(ex)}
+                except ValueError:
+                    status, payload, keep_alive = 400, {"error": "Malformed request"}, False
+
+                data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+                head = (
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    "Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    + ("" if keep_alive else "Connection: close\r\n")
+                    + "\r\n"
+                )
+                writer.write(head.encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address: str, started: Callable[[str], None]):
+        """Приймає з'єднання на address до SIGINT чи SIGTERM"""
+        self.writes = asyncio.Lock()
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+        kind, host, port = parse_address(address)
+        if kind == "unix":
+            path = pathlib.Path(host)
+            # Сокет, що лишився від попереднього запуску, замінюється
+            if path.exists() and stat.S_ISSOCK(path.stat().st_mode):
+                path.unlink()
+            server = await asyncio.start_unix_server(self.handle, path, limit=MAX_LINE)
+            # Сокет доступний лише власнику, як і каталог даних
+            os.chmod(path, 0o600)
+        else:
+            if host in LOOPBACK_HOSTS:
+                self.allowed_hosts = LOOPBACK_HOSTS
+            elif self.token is None:
+                # Без автентифікації будь-який вузол мережі міг би змінювати книги
+                raise ValueError(f"Refusing to serve on non-loopback address {host} without LOTUS_API_TOKEN")
+            server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except (NotImplementedError, RuntimeError):
+                # Windows: Ctrl+C перериває asyncio.run як KeyboardInterrupt
+                pass
+
+        started(address)
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            self.writer.shutdown(wait=True)
+            if kind == "unix":
+                pathlib.Path(host).unlink(missing_ok=True)
+
+
+def serve(
+    address: str,
+    run: Callable[[Dict[str, Any], bool], Dict[str, Any]],
+    is_write: Callable[[str], bool],
+    lock,
+    usage: Dict[str, str],
+    started: Callable[[str], None],
+    token: str | None = None,
+):
+    """
+    Запускає сервер на address і повертається після SIGINT чи SIGTERM.
+    Адреса поза loopback потребує токена token
+    """
+    try:
+        asyncio.run(Server(run, is_write, lock, usage, token).serve(address, started))
+    except KeyboardInterrupt:
+        pass
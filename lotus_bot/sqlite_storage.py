@@ -0,0 +1,498 @@
+"""Module for SQLite storage engine of contacts and notes"""
+from __future__ import annotations
+
+import pathlib
+import pickle
+import sqlite3
+import sys
+from collections import OrderedDict
+from collections.abc import Iterator
+from collections.abc import MutableMapping
+from collections.abc import ValuesView
+from contextlib import contextmanager
+from contextlib import nullcontext
+from itertools import chain
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Set
+
+from lotus_bot.locking import FileLock
+from lotus_bot.locking import LOCK_NAME
+from lotus_bot.storage import FSYNC_INTERVAL
+from lotus_bot.storage import Journal
+from lotus_bot.storage import read_dict
+
+# Скільки розпакованих записів тримати в пам'яті
+CACHE_SIZE = 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    key TEXT PRIMARY KEY,
+    email TEXT,
+    birthday TEXT,
+    record BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contacts_email ON contacts (email);
+CREATE INDEX IF NOT EXISTS contacts_birthday ON contacts (birthday);
+CREATE TABLE IF NOT EXISTS contact_phones (
+    phone TEXT NOT NULL,
+    key TEXT NOT NULL REFERENCES contacts (key) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS contact_phones_phone ON contact_phones (phone);
+CREATE INDEX IF NOT EXISTS contact_phones_key ON contact_phones (key);
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    created INTEGER,
+    modified INTEGER,
+    record BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notes_created ON notes (created);
+CREATE INDEX IF NOT EXISTS notes_modified ON notes (modified);
+CREATE TABLE IF NOT EXISTS note_tags (
+    tag TEXT NOT NULL,
+    id INTEGER NOT NULL REFERENCES notes (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS note_tags_tag ON note_tags (tag);
+CREATE INDEX IF NOT EXISTS note_tags_id ON note_tags (id);
+"""
+
+
+class SqliteTable(MutableMapping):
+    """
+    Базовий клас відображення ключ -> запис поверх таблиці SQLite.
+    Записи зберігаються як pickle і розпаковуються лише при зверненні,
+    останні CACHE_SIZE розпакованих записів тримаються в кеші.
+    Кожна зміна комітиться окремою короткою транзакцією,
+    а в пакеті (autocommit = False) -- разом із рештою пакета.
+    """
+
+    table = ""
+    key_column = ""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.cache: OrderedDict = OrderedDict()
+        self.autocommit = True
+
+    def _transaction(self):
+        # В пакеті транзакцію відкриває сам sqlite3, а завершує SqliteStorage
+        return self.conn if self.autocommit else nullcontext()
+
+    def _remember(self, key, value):
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        if len(self.cache) > CACHE_SIZE:
+            self.cache.popitem(last=False)
+
+    def _write_row(self, key, value):
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        row = self.conn.execute(
+            f"SELECT record FROM {self.table} WHERE {self.key_column} = ?", (key,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        value = pickle.loads(row[0])
+        self._remember(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        with self._transaction():
+            self._write_row(key, value)
+        self._remember(key, value)
+
+    def update(self, other=(), **kwargs):
+        """Записує багато записів однією транзакцією"""
+        items = other.items() if hasattr(other, "items") else other
+        with self._transaction():
+            for key, value in chain(items, kwargs.items()):
+                self._write_row(key, value)
+                self._remember(key, value)
+
+    def __delitem__(self, key):
+        with self._transaction():
+            cur = self.conn.execute(
+                f"DELETE FROM {self.table} WHERE {self.key_column} = ?", (key,)
+            )
+        self.cache.pop(key, None)
+        if cur.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self.cache:
+            return True
+        return (
+            self.conn.execute(
+                f"SELECT 1 FROM {self.table} WHERE {self.key_column} = ?", (key,)
+            ).fetchone()
+            is not None
+        )
+
+    def __iter__(self) -> Iterator:
+        cur = self.conn.execute(
+            f"SELECT {self.key_column} FROM {self.table} ORDER BY {self.key_column}"
+        )
+        return (row[0] for row in cur.fetchall())
+
+    def __len__(self) -> int:
+        return self.conn.execute(f"SELECT count(*) FROM {self.table}").fetchone()[0]
+
+    def values(self) -> ValuesView:
+        return SqliteValues(self)
+
+
+class SqliteValues(ValuesView):
+    """
+    Записи таблиці одним запитом замість окремого SELECT на кожен ключ
+    (для пошуку проходом). Кеш не поповнюється, але записи з нього
+    повертаються як є, разом зі ще не записаними змінами.
+    """
+
+    def __iter__(self):
+        table = self._mapping
+        cur = table.conn.execute(
+            f"SELECT {table.key_column}, record FROM {table.table} ORDER BY {table.key_column}"
+        )
+        for key, blob in cur.fetchall():
+            value = table.cache.get(key)
+            yield value if value is not None else pickle.loads(blob)
+
+
+class SqliteContacts(SqliteTable):
+    """Контакти (ключ -- нормалізоване ім'я) з індексами телефонів та email"""
+
+    table = "contacts"
+    key_column = "key"
+
+    def _write_row(self, key: str, record):
+        email = record.email.value if record.email else None
+        # день народження зберігається як MM-DD для пошуку за календарем
+        birthday = record.birthday.value.strftime("%m-%d") if record.birthday else None
+        self.conn.execute(
+            "INSERT OR REPLACE INTO contacts (key, email, birthday, record) VALUES (?, ?, ?, ?)",
+            (key, email, birthday, pickle.dumps(record, pickle.HIGHEST_PROTOCOL)),
+        )
+        self.conn.execute("DELETE FROM contact_phones WHERE key = ?", (key,))
+        self.conn.executemany(
+            "INSERT INTO contact_phones (phone, key) VALUES (?, ?)",
+            [(phone, key) for phone in record.phones.data],
+        )
+
+    def __init__(self, conn: sqlite3.Connection):
+        super().__init__(conn)
+        self.contact_index = SqliteContactIndex(conn)
+        self.name_index = SqliteNameIndex(conn)
+
+
+class SqliteNameIndex:
+    """
+    Префіксний пошук імен по первинному ключу таблиці contacts.
+    Ключі вже впорядковані індексом SQLite, тож add і remove нічого не роблять.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def add(self, key):
+        pass
+
+    def remove(self, key):
+        pass
+
+    def ordered(self, reverse: bool = False) -> Iterator[str]:
+        """Повертає всі ключі за абеткою (або у зворотному порядку)"""
+        order = "DESC" if reverse else "ASC"
+        cur = self.conn.execute(f"SELECT key FROM contacts ORDER BY key {order}")
+        return (row[0] for row in cur)
+
+    def starting_with(self, prefix: str, limit: int | None = None) -> List[str]:
+        """Повертає до limit ключів, що починаються з prefix, за абеткою"""
+        # UTF-8 зберігає порядок кодових точок, тож діапазон [prefix, prefix + max)
+        # охоплює всі ключі з цим префіксом
+        cur = self.conn.execute(
+            "SELECT key FROM contacts WHERE key >= ? AND key < ? ORDER BY key LIMIT ?",
+            (prefix, prefix + chr(sys.maxunicode), -1 if limit is None else limit),
+        )
+        return [row[0] for row in cur.fetchall()]
+
+
+class SqliteContactIndex:
+    """
+    Індекси телефонів та email поверх таблиць contacts і contact_phones.
+    Таблиці оновлюються разом із записом контакту, тому методи
+    оновлення індексу нічого не роблять.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def bind(self, key, record):
+        pass
+
+    def add_record(self, key, record):
+        pass
+
+    def remove_record(self, key, record):
+        pass
+
+    def add_phone(self, key, phone):
+        pass
+
+    def remove_phone(self, key, phone):
+        pass
+
+    def add_email(self, key, email):
+        pass
+
+    def remove_email(self, key, email):
+        pass
+
+    def add_birthday(self, key, birthday):
+        pass
+
+    def remove_birthday(self, key, birthday):
+        pass
+
+    def keys_by_phone(self, phone: str) -> Set[str]:
+        """Повертає ключі контактів з телефоном phone"""
+        cur = self.conn.execute("SELECT key FROM contact_phones WHERE phone = ?", (phone,))
+        return {row[0] for row in cur.fetchall()}
+
+    def keys_by_email(self, email: str) -> Set[str]:
+        """Повертає ключі контактів з email"""
+        cur = self.conn.execute("SELECT key FROM contacts WHERE email = ?", (email,))
+        return {row[0] for row in cur.fetchall()}
+
+    def keys_by_birthday(self, month: int, day: int) -> Set[str]:
+        """Повертає ключі контактів, народжених day числа місяця month"""
+        cur = self.conn.execute(
+            "SELECT key FROM contacts WHERE birthday = ?", (f"{month:02d}-{day:02d}",)
+        )
+        return {row[0] for row in cur.fetchall()}
+
+    def birthday_version(self, month: int, day: int) -> int | None:
+        """Версії кошиків не відстежуються, тож рядки привітань не кешуються"""
+        return None
+
+
+class SqliteTagIndex:
+    """
+    Індекс тегів поверх таблиці note_tags.
+    Таблиця оновлюється разом із записом нотатки, тому методи
+    оновлення індексу нічого не роблять.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def add_record_to_index(self, record):
+        pass
+
+    def remove_record_from_index(self, note_id):
+        pass
+
+    def add_tag(self, note_id, tag):
+        pass
+
+    def remove_tag(self, note_id, tag):
+        pass
+
+    def postings(self, tag) -> Set[int]:
+        """повертає множину id заміток з тегом"""
+        cur = self.conn.execute("SELECT id FROM note_tags WHERE tag = ?", (tag,))
+        return {row[0] for row in cur.fetchall()}
+
+    def search(self, tag) -> List[int]:
+        """повертає список id заміток з тегом"""
+        return sorted(self.postings(tag))
+
+    def all(self) -> Dict[str, List[int]]:
+        """повертає весь індекс."""
+        index = {}
+        for tag, note_id in self.conn.execute("SELECT tag, id FROM note_tags"):
+            index.setdefault(tag, []).append(note_id)
+        return index
+
+
+class SqliteNotes(SqliteTable):
+    """Нотатки (ключ -- id) з індексом тегів"""
+
+    table = "notes"
+    key_column = "id"
+
+    def __init__(self, conn: sqlite3.Connection):
+        super().__init__(conn)
+        self.tag_index = SqliteTagIndex(conn)
+
+    def _write_row(self, key: int, record):
+        # дати зберігаються мікросекундами від EPOCH, як у NoteRecord, для сортування
+        self.conn.execute(
+            "INSERT OR REPLACE INTO notes (id, created, modified, record) VALUES (?, ?, ?, ?)",
+            (key, record._created, record._modified, pickle.dumps(record, pickle.HIGHEST_PROTOCOL)),
+        )
+        self.conn.execute("DELETE FROM note_tags WHERE id = ?", (key,))
+        self.conn.executemany(
+            "INSERT INTO note_tags (tag, id) VALUES (?, ?)",
+            [(tag, key) for tag in record.tags.data],
+        )
+
+    def last_key(self) -> int | None:
+        """Повертає найбільший id нотатки"""
+        return self.conn.execute("SELECT max(id) FROM notes").fetchone()[0]
+
+    def ordered_ids(self, column: str, reverse: bool = False) -> Iterator[int]:
+        """Повертає id нотаток, впорядковані за колонкою id, created чи modified, без розпакування"""
+        order = "DESC" if reverse else "ASC"
+        cur = self.conn.execute(f"SELECT id FROM notes ORDER BY {column} {order}, id {order}")
+        return (row[0] for row in cur.fetchall())
+
+
+class SqliteStorage:
+    """
+    Рушій зберігання в базі SQLite.
+    При першому запуску переносить дані з pickle-знімка, якщо він є.
+    Одночасні записи кількох процесів впорядковує сама SQLite, а замок lock
+    робить атомарним читання-зміну-запис команди, як і в PickleStorage.
+    """
+
+    def __init__(self, path: pathlib.Path, legacy_path: pathlib.Path | None = None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.lock = FileLock(path.with_name(LOCK_NAME))
+        self.conn: sqlite3.Connection | None = None
+        self.dictionary: Dict[str, Any] = {}
+        # PRAGMA data_version змінюється, коли базу змінило інше з'єднання
+        self.data_version: int | None = None
+
+    def load(self) -> Dict:
+        """Відкриває базу і повертає словник секцій contacts та notes"""
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+            # База відкривається у фоновому потоці завантаження, а далі нею
+            # користуються команди та доповнення імен в основному потоці (по черзі)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute("PRAGMA foreign_keys = ON")
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            # З WAL і synchronous = NORMAL коміт не чекає на fsync: журнал WAL
+            # скидається на диск під час checkpoint, а база лишається цілісною
+            self.conn.execute(f"PRAGMA synchronous = {'NORMAL' if FSYNC_INTERVAL else 'FULL'}")
+            self._upgrade_schema()
+            self.conn.executescript(SCHEMA)
+            self.dictionary = {
+                "contacts": SqliteContacts(self.conn),
+                "notes": SqliteNotes(self.conn),
+            }
+            if (
+                self.legacy_path is not None
+                and self.legacy_path.exists()
+                and not len(self.dictionary["contacts"])
+                and not len(self.dictionary["notes"])
+            ):
+                journal = Journal(self.legacy_path.with_suffix(".journal"))
+                self._migrate(read_dict(self.legacy_path, journal))
+            self.data_version = self._data_version()
+        return self.dictionary
+
+    def _data_version(self) -> int:
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def changes(self, blocking: bool = True) -> List | None:
+        """
+        Повертає [], якщо інші процеси не змінювали базу після load(),
+        інакше None: книги над базою дешево створити заново після load(),
+        а кеші розпакованих записів могли застаріти
+        """
+        if self.conn is None or self._data_version() != self.data_version:
+            return None
+        return []
+
+    def _upgrade_schema(self):
+        # База попередньої версії не має колонок created та modified нотаток
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(notes)")]
+        if columns and "created" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE notes ADD COLUMN created INTEGER")
+                self.conn.execute("ALTER TABLE notes ADD COLUMN modified INTEGER")
+                for key, blob in self.conn.execute("SELECT id, record FROM notes").fetchall():
+                    record = pickle.loads(blob)
+                    self.conn.execute(
+                        "UPDATE notes SET created = ?, modified = ? WHERE id = ?",
+                        (record._created, record._modified, key),
+                    )
+        # База попередньої версії не має колонки birthday
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(contacts)")]
+        if columns and "birthday" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE contacts ADD COLUMN birthday TEXT")
+                for key, blob in self.conn.execute("SELECT key, record FROM contacts").fetchall():
+                    record = pickle.loads(blob)
+                    if record.birthday:
+                        self.conn.execute(
+                            "UPDATE contacts SET birthday = ? WHERE key = ?",
+                            (record.birthday.value.strftime("%m-%d"), key),
+                        )
+
+    def _migrate(self, legacy: Dict):
+        with self.conn:
+            for section in ("contacts", "notes"):
+                table = self.dictionary[section]
+                for key, value in legacy.get(section, {}).items():
+                    table._write_row(key, value)
+
+    def commit(self, section: str, key):
+        """Зберігає поточний стан запису key в секції section"""
+        table = self.dictionary[section]
+        value = table.get(key)
+        if value is not None:
+            table[key] = value
+
+    def begin(self):
+        """Починає пакет: зміни лишаються в одній відкритій транзакції до flush"""
+        for table in self.dictionary.values():
+            table.autocommit = False
+
+    def flush(self):
+        """Комітить транзакцію пакета"""
+        if self.conn is not None:
+            self.conn.commit()
+
+    def rollback(self):
+        """Відкочує транзакцію пакета і скидає кеші розпакованих записів"""
+        self.conn.rollback()
+        for table in self.dictionary.values():
+            table.cache.clear()
+
+    @contextmanager
+    def atomic(self):
+        """
+        Виконує блок однією транзакцією, навіть поза пакетом: при помилці
+        вона відкочується, інакше лишається відкритою до flush чи persist
+        """
+        tables = [table for table in self.dictionary.values() if table.autocommit]
+        for table in tables:
+            table.autocommit = False
+        try:
+            yield
+        except BaseException:
+            self.rollback()
+            raise
+        finally:
+            for table in tables:
+                table.autocommit = True
+
+    def persist(self):
+        """Комітить усі зміни; записи вже в базі, тож окремого знімка не треба"""
+        self.flush()
+
+    def close(self):
+        """Комітить незавершений пакет і закриває базу"""
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
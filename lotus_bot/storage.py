@@ -0,0 +1,542 @@
+"""Module for persisting contacts and notes"""
+from __future__ import annotations
+
+import os
+import pathlib
+import pickle
+import time
+from collections.abc import Iterable
+from contextlib import contextmanager
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Set
+from typing import Tuple
+
+from lotus_bot.compression import Codec
+from lotus_bot.compression import Frame
+from lotus_bot.compression import get_codec
+from lotus_bot.compression import pack_frame
+from lotus_bot.compression import read_sections
+from lotus_bot.compression import write_sections
+from lotus_bot.locking import FileLock
+from lotus_bot.locking import LOCK_NAME
+
+# Розмір журналу (у байтах), після якого він згортається у новий знімок.
+# Значення 0 означає згортання після кожної зміни (старий режим).
+JOURNAL_MAX_SIZE = int(os.environ.get("LOTUS_JOURNAL_MAX_SIZE", 1024 * 1024))
+
+# Найдовший час (у секундах), протягом якого дописані в журнал зміни
+# можуть лишатися не скинутими на диск (fsync). 0 -- fsync після кожного допису.
+FSYNC_INTERVAL = float(os.environ.get("LOTUS_FSYNC_INTERVAL", 1.0))
+
+# Стиснення знімка та великих кадрів журналу: none, zlib, lzma або "кодек:рівень" (zlib:6)
+COMPRESSION = os.environ.get("LOTUS_COMPRESSION", "none")
+
+# Рушій зберігання за замовчуванням: pickle, columnar або sqlite
+STORAGE_ENGINE = os.environ.get("LOTUS_STORAGE", "pickle")
+
+# Ключ покоління у знімку та секція заголовка журналу з поколінням
+GENERATION = "generation"
+JOURNAL_HEADER = "__generation__"
+
+
+def read_dict(path: pathlib.Path, journal: Journal | None = None, frames: Dict[str, Frame] | None = None) -> Dict:
+    """Заванатажує довідник з файла
+
+    path -- шлях до довідника
+    journal -- журнал змін, що програється поверх знімка
+    frames -- сюди зберігаються стиснені секції знімка, якщо він стиснений
+    """
+    dictionary = {}
+    if path.exists():
+        try:
+            with open(path, "rb") as f:
+                dictionary = read_sections(f, frames)
+        except Exception as ex:
+            print(f"Loading Contacts error: {ex}, create new dictionary")
+            dictionary = {}
+    # Якщо довідника ще нема, то лишаємо порожній
+
+    if journal is not None:
+        journal.replay(dictionary)
+    return dictionary
+
+
+def write_dict(
+    path: pathlib.Path,
+    dictionary: Dict,
+    codec: Codec | None = None,
+    frames: Dict[str, Frame] | None = None,
+    dirty: Set[str] | None = None,
+):
+    """Записує довідник в файл
+
+    path -- шлях до довідника
+    dict -- словник довідника
+    codec -- кодек, яким кожна секція стискається окремо (None -- звичайний pickle)
+    frames, dirty -- стиснені секції попереднього запису та назви змінених з того часу секцій:
+    незмінені секції не стискаються повторно
+
+    Знімок пишеться у тимчасовий файл і підміняє старий одним os.replace,
+    тож інші процеси бачать або старий, або новий знімок цілком.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        if codec is None:
+            pickle.dump(dictionary, f)
+        else:
+            write_sections(f, dictionary, codec, frames, dirty)
+        fsync(f)
+    replace(tmp_path, path)
+
+
+def fsync(f):
+    """Скидає записане у файл f на диск"""
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def replace(tmp_path: pathlib.Path, path: pathlib.Path):
+    """
+    Атомарно підміняє path вже записаним на диск tmp_path.
+    Каталог теж синхронізується, щоб після збою не лишилось старого імені.
+    """
+    os.replace(tmp_path, path)
+    fsync_dir(path.parent)
+
+
+def fsync_dir(path: pathlib.Path):
+    """Скидає на диск записи каталогу path (нові та перейменовані файли); на Windows нічого не робить"""
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def apply_frames(dictionary: Dict, frames: Iterable[Tuple[str, Any, Any]]) -> int:
+    """Застосовує кадри журналу (section, key, value) до словника, повертає їх кількість"""
+    count = 0
+    for section, key, value in frames:
+        records = dictionary.setdefault(section, {})
+        if value is None:
+            records.pop(key, None)
+        else:
+            records[key] = value
+        count += 1
+    return count
+
+
+class Journal:
+    """
+    Журнал змін, що дописується в кінець файла.
+    Перший кадр -- заголовок (JOURNAL_HEADER, None, покоління знімка),
+    далі кожен запис -- окремий pickle-кадр (section, key, value), де value
+    це новий стан запису або None, якщо запис видалено.
+    З кодеком великі значення стискаються і розпаковуються самим pickle.load.
+    Записи ідемпотентні, тож повторне програвання вже згорнутого
+    журналу поверх свіжого знімка нічого не ламає.
+    """
+
+    def __init__(self, path: pathlib.Path, max_size: int = JOURNAL_MAX_SIZE, codec: Codec | None = None):
+        self.path = path
+        self.max_size = max_size
+        self.codec = codec
+
+    def start(self, generation: int):
+        """Починає порожній журнал змін поверх знімка покоління generation"""
+        with open(self.path, "wb") as f:
+            pickle.dump((JOURNAL_HEADER, None, generation), f, pickle.HIGHEST_PROTOCOL)
+
+    def previous(self) -> Journal:
+        """Журнал попереднього покоління, збережений при останньому згортанні"""
+        return Journal(self.path.with_name(self.path.name + ".prev"), self.max_size, self.codec)
+
+    def rotate(self, generation: int):
+        """Зберігає поточний журнал як попередній і починає новий для покоління generation"""
+        if self.path.exists():
+            os.replace(self.path, self.previous().path)
+        self.start(generation)
+
+    def append(self, section: str, key: Any, value: Any):
+        """Дописує в журнал новий стан запису key в секції section"""
+        self.append_many([(section, key, value)])
+
+    def append_many(self, frames: Iterable[Tuple[str, Any, Any]], sync: bool = False):
+        """
+        Дописує в журнал кілька кадрів (section, key, value) за одне відкриття,
+        з sync=True -- одразу скидаючи їх на диск
+        """
+        with open(self.path, "ab") as f:
+            for frame in frames:
+                f.write(pack_frame(frame, self.codec))
+            if sync:
+                fsync(f)
+
+    def sync(self):
+        """Скидає дописані кадри журналу на диск"""
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        except FileNotFoundError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def generation(self) -> int | None:
+        """Покоління знімка з заголовка; None, якщо журналу нема або він старого формату"""
+        identity = self.identity()
+        return identity[0] if identity is not None else None
+
+    def identity(self) -> Tuple[int | None, int] | None:
+        """
+        Повертає (покоління з заголовка, розмір) журналу або None, якщо журналу нема.
+        Кожне згортання починає журнал нового покоління, а кожен допис
+        збільшує розмір, тож пара змінюється з кожною зміною сховища
+        (на відміну від inode, який новий файл може отримати від видаленого).
+        """
+        try:
+            with open(self.path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                try:
+                    section, _, value = pickle.load(f)
+                except Exception:
+                    return None, size
+        except FileNotFoundError:
+            return None
+        return (value if section == JOURNAL_HEADER else None), size
+
+    def read(self, offset: int = 0) -> Tuple[List[Tuple[str, Any, Any]], int]:
+        """
+        Читає кадри журналу, починаючи з позиції offset (без заголовка).
+        Повертає кадри та позицію після останнього цілого кадру.
+        """
+        frames = []
+        if not self.path.exists():
+            return frames, offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while True:
+                try:
+                    frame = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception as ex:
+                    # Обірваний останній кадр (наприклад, після збою) відкидаємо
+                    print(f"Journal replay stopped: {ex}")
+                    break
+                if frame[0] != JOURNAL_HEADER:
+                    frames.append(frame)
+                offset = f.tell()
+        return frames, offset
+
+    def replay(self, dictionary: Dict) -> int:
+        """Програє журнал поверх словника, повертає кількість записів"""
+        return apply_frames(dictionary, self.read()[0])
+
+    def repair(self, end: int):
+        """Обрізає обірваний кадр після позиції end, щоб нові кадри не дописувались за ним"""
+        if self.size() > end:
+            os.truncate(self.path, end)
+
+    def size(self) -> int:
+        """Повертає розмір журналу в байтах"""
+        return self.path.stat().st_size if self.path.exists() else 0
+
+    def has_frames(self) -> bool:
+        """Чи є в журналі кадри після заголовка"""
+        if self.generation() is None:
+            return self.size() > 0
+        with open(self.path, "rb") as f:
+            pickle.load(f)
+            return f.read(1) != b""
+
+    def needs_compaction(self) -> bool:
+        """Чи перевищив журнал дозволений розмір"""
+        return self.size() > self.max_size
+
+
+class PickleStorage:
+    """
+    Рушій зберігання: pickle-знімок плюс журнал змін.
+
+    Кілька процесів можуть працювати з одним сховищем. Запис і згортання
+    виконуються під файловим замком lock, а кожне згортання збільшує
+    покоління (generation), що зберігається у знімку та в заголовку журналу.
+    Процес пам'ятає покоління та позицію в журналі, до якої він програв зміни,
+    тож changes() дочитує лише чужі кадри, а не весь знімок.
+    """
+
+    # Фоновий запис лише читає словник, тож команди читання можуть
+    # виконуватись з пам'яті, поки він триває
+    reads_during_flush = True
+
+    def __init__(self, path: pathlib.Path, journal_path: pathlib.Path | None = None):
+        self.path = path
+        self.codec = get_codec(COMPRESSION)
+        self.journal = Journal(journal_path or path.with_suffix(".journal"), codec=self.codec)
+        self.lock = FileLock(path.with_name(LOCK_NAME))
+        self.dictionary: Dict[str, Any] = {}
+        # Ключі (section, key), змінені в пакеті, але ще не записані;
+        # None -- пакет не розпочато і кожна зміна записується одразу
+        self.pending: Dict[Tuple[str, Any], None] | None = None
+        # Покоління знімка, на якому стоїть словник, і (покоління журналу, позиція
+        # в ньому), до якої програно зміни
+        self.generation = 0
+        self.seen: Tuple[int, int] | None = None
+        # Чи є в журналі кадри, ще не скинуті на диск, і коли журнал синхронізовано востаннє
+        self.fsync_interval = FSYNC_INTERVAL
+        self.unsynced = False
+        self.synced_at = time.monotonic()
+        # Стиснені секції останнього прочитаного чи записаного знімка
+        # та секції, змінені відтоді: незмінені не стискаються повторно
+        self.frames: Dict[str, Frame] = {}
+        self.dirty: Set[str] = set()
+        # Фоновий запис (Flusher): після допису лише сповіщається,
+        # а згортання журналу та fsync виконує background_flush() в іншому потоці
+        self.background: Callable[[], None] | None = None
+
+    def read_snapshot(self) -> Dict:
+        """Читає знімок і його покоління"""
+        self.frames = {}
+        self.dirty = set()
+        dictionary = read_dict(self.path, frames=self.frames if self.codec is not None else None)
+        self.generation = dictionary.pop(GENERATION, 0)
+        dictionary.setdefault("contacts", {})
+        dictionary.setdefault("notes", {})
+        return dictionary
+
+    def load(self) -> Dict:
+        """Завантажує знімок, програє журнал і повертає словник секцій"""
+        # Знімок підміняється атомарно, тож читається без замка, щоб довге
+        # завантаження не затримувало записи інших процесів. Якщо тим часом
+        # журнал згорнули в новіший знімок, він перечитується вже під замком.
+        dictionary = self.read_snapshot()
+        with self.lock:
+            header = self.journal.generation()
+            if header is not None and header > self.generation:
+                dictionary = self.read_snapshot()
+                header = self.journal.generation()
+            self.dictionary = dictionary
+            if header is not None and header < self.generation:
+                # Знімок записано, а новий журнал не почато (збій під час згортання):
+                # усі кадри старого журналу вже є у знімку
+                self.journal.start(self.generation)
+            elif header is None and not self.journal.has_frames():
+                self.journal.start(self.generation)
+
+            frames, end = self.journal.read()
+            self.journal.repair(end)
+            apply_frames(self.dictionary, frames)
+            self.dirty.update(section for section, _, _ in frames)
+            self._caught_up_to(end)
+            if header is None and frames:
+                # Журнал попередньої версії без заголовка згортається одразу
+                self.compact()
+        return self.dictionary
+
+    def _caught_up_to(self, offset: int):
+        self.seen = (self.journal.generation(), offset)
+
+    def caught_up(self) -> bool:
+        """Чи програно всі кадри журналу, зокрема записані іншими процесами"""
+        return self.seen is not None and self.journal.identity() == self.seen
+
+    def changes(self, blocking: bool = True) -> List[Tuple[str, Any, Any]] | None:
+        """
+        Повертає кадри (section, key, value), записані іншими процесами
+        після останньої перевірки, і вважає їх програними.
+        Кадри ще треба застосувати до книг: словник не змінюється.
+        Повертає None, якщо сховище згорнуто більше ніж на покоління вперед
+        і все треба завантажити заново через load().
+        Поки журнал не змінився, перевірка коштує лише читання його заголовка.
+        З blocking=False не чекає на зайнятий замок, а повертає [],
+        тож зміни буде прочитано при наступній перевірці.
+        """
+        if self.caught_up():
+            return []
+        if not self.lock.acquire(blocking):
+            return []
+        try:
+            if self.seen is None:
+                return None
+            seen_generation, offset = self.seen
+            header = self.journal.generation()
+            previous = self.journal.previous()
+            if header == seen_generation == self.generation:
+                frames, end = self.journal.read(offset)
+            elif header == self.generation + 1 and previous.generation() == seen_generation == self.generation:
+                # Інший процес згорнув журнал: дочитуємо попередній і весь новий
+                frames, _ = previous.read(offset)
+                more, end = self.journal.read()
+                frames += more
+                self.generation = header
+            else:
+                return None
+            self.journal.repair(end)
+            self._caught_up_to(end)
+        finally:
+            self.lock.release()
+        self.dirty.update(section for section, _, _ in frames)
+        return frames
+
+    def commit(self, section: str, key):
+        """
+        Дописує новий стан запису в журнал, а при переповненні журналу
+        згортає його у свіжий знімок.
+        В пакеті лише запам'ятовує ключ до flush.
+        """
+        if self.pending is not None:
+            self.pending[(section, key)] = None
+            return
+        self.append([(section, key, self.dictionary[section].get(key))])
+
+    def append(self, frames: Iterable[Tuple[str, Any, Any]]):
+        """
+        Дописує кадри в журнал під замком і згортає переповнений журнал.
+        З фоновим записом згортання та fsync відкладаються до background_flush().
+        """
+        frames = list(frames)
+        self.dirty.update(section for section, _, _ in frames)
+        with self.lock:
+            caught_up = self.caught_up()
+            self.journal.append_many(frames, sync=not self.fsync_interval)
+            self.unsynced = bool(self.fsync_interval)
+            # Власні кадри вже в словнику; якщо ж є непрограні чужі кадри,
+            # changes() програє їх разом з нашими, що теж нічого не ламає
+            if caught_up:
+                self._caught_up_to(self.journal.size())
+            if self.background is not None:
+                self.background()
+            elif self.journal.needs_compaction():
+                self.compact()
+            elif time.monotonic() - self.synced_at >= self.fsync_interval:
+                self.sync()
+
+    def sync(self):
+        """Скидає на диск кадри, дописані в журнал після останньої синхронізації"""
+        if self.unsynced:
+            self.journal.sync()
+            self.unsynced = False
+        self.synced_at = time.monotonic()
+
+    def background_flush(self) -> bool:
+        """
+        Фонова частина запису: згортає переповнений журнал у знімок
+        і скидає журнал на диск. Не чекає на замок: повертає False,
+        якщо його тримає інший потік чи процес і роботу треба повторити.
+        """
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            if not (self.journal.needs_compaction() and self.compact()):
+                self.sync()
+        finally:
+            self.lock.release()
+        return True
+
+    def begin(self):
+        """Починає пакет: зміни накопичуються в пам'яті до flush"""
+        self.pending = {}
+
+    def flush(self):
+        """Записує всі зміни пакета в журнал одним дописом"""
+        if self.pending:
+            self.append(
+                (section, key, self.dictionary[section].get(key))
+                for section, key in self.pending
+            )
+            self.pending.clear()
+
+    def rollback(self):
+        """
+        Відкидає незаписані зміни пакета і перечитує збережений стан.
+        Словник, отриманий раніше з load(), після цього застарілий.
+        """
+        if self.pending is not None:
+            self.pending.clear()
+        self.load()
+
+    @contextmanager
+    def atomic(self):
+        """
+        Виконує блок як одну зміну: при помилці незаписані зміни
+        відкочуються (rollback) і помилка передається далі
+        """
+        try:
+            yield
+        except BaseException:
+            self.rollback()
+            raise
+
+    def write_snapshot(self):
+        """Записує знімок усього словника, стискаючи лише змінені секції"""
+        write_dict(
+            self.path,
+            {**self.dictionary, GENERATION: self.generation},
+            self.codec,
+            self.frames,
+            self.dirty | {GENERATION},
+        )
+        self.dirty.clear()
+
+    def compact(self) -> bool:
+        """
+        Записує свіжий знімок наступного покоління і починає новий журнал.
+        Якщо інші процеси дописали кадри, яких словник ще не бачив,
+        знімок не пишеться (він би їх втратив) і повертається False.
+        """
+        with self.lock:
+            if not self.caught_up():
+                return False
+            self.generation += 1
+            self.write_snapshot()
+            self.journal.rotate(self.generation)
+            self._caught_up_to(self.journal.size())
+            # Усі кадри вже у знімку, записаному на диск
+            self.unsynced = False
+            self.synced_at = time.monotonic()
+        return True
+
+    def persist(self):
+        """
+        Записує весь поточний стан одним знімком, разом з усіма
+        незаписаними змінами пакета (наприклад, після імпорту).
+        Словник має бути синхронізований з changes() під тим самим замком.
+        """
+        with self.lock:
+            # Імпорт змінює словник без кадрів журналу, тож стискаються всі секції
+            self.frames.clear()
+            if not self.compact():
+                raise RuntimeError("Store was changed by another process, reload it before saving")
+            if self.pending:
+                self.pending.clear()
+
+    def close(self):
+        """Записує зміни пакета і згортає журнал (або скидає його на диск) перед завершенням роботи"""
+        with self.lock:
+            self.flush()
+            if not (self.journal.has_frames() and self.compact()):
+                self.sync()
+
+
+def open_storage(data_path: pathlib.Path, engine: str = STORAGE_ENGINE):
+    """Створює рушій зберігання engine (pickle, columnar або sqlite) в каталозі data_path"""
+    pickle_path = data_path.joinpath("lotus.pickle")
+    match engine:
+        case "pickle":
+            return PickleStorage(pickle_path)
+        case "sqlite":
+            from lotus_bot.sqlite_storage import SqliteStorage
+
+            return SqliteStorage(data_path.joinpath("lotus.db"), pickle_path)
+        case "columnar":
+            from lotus_bot.columnar import ColumnarStorage
+
+            return ColumnarStorage(data_path.joinpath("lotus.columns"), pickle_path)
+        case _:
+            raise ValueError(f"Unknown storage engine: {engine}")
@@ -0,0 +1,448 @@
+"""Module for bulk import and export of contacts and notes (CSV, vCard, JSON Lines)"""
+from __future__ import annotations
+
+import csv
+import json
+from collections.abc import Iterable
+from collections.abc import Iterator
+from datetime import date
+from datetime import datetime
+from itertools import islice
+from typing import Any
+from typing import Dict
+from typing import IO
+from typing import List
+from typing import Tuple
+
+from lotus_bot.contacts import Address
+from lotus_bot.contacts import AddressBook
+from lotus_bot.contacts import Birthday
+from lotus_bot.contacts import Email
+from lotus_bot.contacts import Phone
+from lotus_bot.contacts import Record
+from lotus_bot.notes import NoteRecord
+from lotus_bot.notes import NotesBook
+from lotus_bot.verification_email import is_valid_email
+from lotus_bot.verification_phone_number import is_valid_ukrainian_phone
+
+# Скільки рядків перевіряється та записується за один раз
+CHUNK_SIZE = 1000
+
+# Формати файлів за розширенням
+FORMATS = {".csv": "csv", ".vcf": "vcard", ".vcard": "vcard", ".jsonl": "jsonl"}
+
+CONTACT_FIELDS = ["name", "phones", "email", "birthday", "address"]
+NOTE_FIELDS = ["id", "title", "text", "tags", "created", "modified"]
+
+# Рядок контакту: name, phones [(phone, info)], email, birthday (DD.MM.YYYY), address
+Row = Dict[str, Any]
+
+
+class ImportReport:
+    """Підсумок імпорту: кількість імпортованих записів та відхилені рядки"""
+
+    def __init__(self):
+        self.imported = 0
+        self.rejected: List[Tuple[int, str]] = []
+
+    def reject(self, number: int, reason: str):
+        """Запам'ятовує відхилений рядок number з причиною reason"""
+        self.rejected.append((number, reason))
+
+
+def file_format(path: str, fmt: str | None = None) -> str:
+    """Повертає формат файла: явно вказаний або за розширенням"""
+    if fmt:
+        fmt = fmt.lower()
+        if fmt not in FORMATS.values():
+            raise ValueError(f"Unknown format {fmt}, use csv, vcard or jsonl")
+        return fmt
+    for suffix, name in FORMATS.items():
+        if path.lower().endswith(suffix):
+            return name
+    raise ValueError(f"Can't guess format of {path}, use .csv, .vcf or .jsonl")
+
+
+def chunks(items: Iterable, size: int = CHUNK_SIZE) -> Iterator[List]:
+    """Розбиває потік на списки не довші за size"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Розбір рядків контактів
+
+
+def _split_phones(cell: str) -> List[Tuple[str, str]]:
+    # "+380501112233:work;+380501112244"
+    phones = []
+    for item in cell.split(";"):
+        phone, _, info = item.partition(":")
+        if phone.strip():
+            phones.append((phone.strip(), info.strip()))
+    return phones
+
+
+def read_contacts_csv(f: IO[str]) -> Iterator[Tuple[int, Row]]:
+    """Читає контакти з CSV з колонками name, phones, email, birthday, address"""
+    reader = csv.DictReader(f)
+    for row in reader:
+        yield reader.line_num, {
+            "name": row.get("name") or "",
+            "phones": _split_phones(row.get("phones") or ""),
+            "email": row.get("email") or None,
+            "birthday": row.get("birthday") or None,
+            "address": row.get("address") or None,
+        }
+
+
+def read_contacts_jsonl(f: IO[str]) -> Iterator[Tuple[int, Row]]:
+    """Читає контакти з JSON Lines, по одному об'єкту в рядку"""
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            phones = [
+                (p, "") if isinstance(p, str) else (p["phone"], p.get("info") or "")
+                for p in item.get("phones") or []
+            ]
+        except (ValueError, TypeError, KeyError) as ex:
+            yield number, {"error": f"Invalid JSON: {ex}"}
+            continue
+        yield number, {
+            "name": item.get("name") or "",
+            "phones": phones,
+            "email": item.get("email") or None,
+            "birthday": item.get("birthday") or None,
+            "address": item.get("address") or None,
+        }
+
+
+def _unfold(f: IO[str]) -> Iterator[Tuple[int, str]]:
+    # Рядок vCard, що починається з пробілу, продовжує попередній
+    current = None
+    start = 0
+    for number, line in enumerate(f, 1):
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current, start = line, number
+    if current is not None:
+        yield start, current
+
+
+def _unescape(value: str) -> str:
+    result = []
+    chars = iter(value)
+    for char in chars:
+        if char == "\\":
+            char = next(chars, "")
+            result.append("\n" if char in ("n", "N") else char)
+        else:
+            result.append(char)
+    return "".join(result)
+
+
+def _split_escaped(value: str, separator: str) -> List[str]:
+    # Розбиває за separator, пропускаючи екрановані "\;" та "\,"
+    parts = []
+    current = []
+    chars = iter(value)
+    for char in chars:
+        if char == "\\":
+            current.append(char + next(chars, ""))
+        elif char == separator:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current))
+    return parts
+
+
+def _vcard_birthday(value: str) -> str:
+    # BDAY:1990-02-01 або BDAY:19900201 -> 01.02.1990
+    for pattern in ("%Y-%m-%d", "%Y%m%d"):
+        try:
+            return datetime.strptime(value[:10], pattern).strftime("%d.%m.%Y")
+        except ValueError:
+            pass
+    return value
+
+
+def read_contacts_vcard(f: IO[str]) -> Iterator[Tuple[int, Row]]:
+    """Читає контакти з vCard (2.1, 3.0, 4.0): FN, TEL, EMAIL, BDAY, ADR"""
+    row: Row | None = None
+    start = 0
+    for number, line in _unfold(f):
+        head, _, value = line.partition(":")
+        params = head.split(";")
+        prop = params[0].rsplit(".", 1)[-1].upper()
+        if prop == "BEGIN" and value.upper() == "VCARD":
+            row, start = {"name": "", "phones": [], "email": None, "birthday": None, "address": None}, number
+        elif row is None:
+            continue
+        elif prop == "END":
+            yield start, row
+            row = None
+        elif prop == "FN":
+            row["name"] = _unescape(value)
+        elif prop == "TEL":
+            types = [
+                t.lower()
+                for param in params[1:]
+                for t in param.split("=", 1)[-1].split(",")
+                if t.lower() not in ("voice", "pref", "cell")
+            ]
+            row["phones"].append((_unescape(value).replace("tel:", ""), types[0] if types else ""))
+        elif prop == "EMAIL" and row["email"] is None:
+            row["email"] = _unescape(value)
+        elif prop == "BDAY":
+            row["birthday"] = _vcard_birthday(value)
+        elif prop == "ADR" and row["address"] is None:
+            parts = [_unescape(part).strip() for part in _split_escaped(value, ";")]
+            row["address"] = ", ".join(part for part in parts if part) or None
+
+
+CONTACT_READERS = {
+    "csv": read_contacts_csv,
+    "vcard": read_contacts_vcard,
+    "jsonl": read_contacts_jsonl,
+}
+
+
+def contact_records(rows: Iterable[Tuple[int, Row]], report: ImportReport) -> Iterator[Record]:
+    """
+    Перетворює рядки на записи Record.
+    Телефони та email перевіряються пачками по CHUNK_SIZE рядків
+    (кожне значення один раз), відхилені рядки потрапляють у report.
+    """
+    for chunk in chunks(rows):
+        for _, row in chunk:
+            # "+380 50 111 2244" зберігається як +380501112244
+            if "phones" in row:
+                row["phones"] = [(phone.replace(" ", ""), info) for phone, info in row["phones"]]
+        phones = {phone for _, row in chunk for phone, _ in row.get("phones", ())}
+        emails = {row["email"].strip() for _, row in chunk if row.get("email")}
+        dates = {row["birthday"].strip() for _, row in chunk if row.get("birthday")}
+        bad_phones = {phone for phone in phones if not is_valid_ukrainian_phone(phone)}
+        bad_emails = {email for email in emails if not is_valid_email(email)}
+        birthdays = {text: _parse_birthday(text) for text in dates}
+
+        # Значення вже перевірені, тож поля створюються без повторних перевірок
+        for number, row in chunk:
+            if "error" in row:
+                report.reject(number, row["error"])
+                continue
+            if not row["name"].strip():
+                report.reject(number, "Empty name")
+                continue
+            invalid = [phone for phone, _ in row["phones"] if phone in bad_phones]
+            if invalid:
+                report.reject(number, f"Invalid phone number {invalid[0]}")
+                continue
+            email = row["email"].strip() if row["email"] else None
+            if email in bad_emails:
+                report.reject(number, f"Invalid email address {email}")
+                continue
+            birthday = birthdays[row["birthday"].strip()] if row["birthday"] else None
+            if row["birthday"] and birthday is None:
+                report.reject(number, f"Invalid birthday {row['birthday']}, use DD.MM.YYYY")
+                continue
+
+            record = Record(row["name"])
+            for phone, info in row["phones"]:
+                record.phones[phone] = Phone.from_value((phone, info))
+            if email:
+                record.email = Email.from_value(email)
+            if birthday:
+                record.birthday = Birthday.from_value(birthday)
+            if row["address"]:
+                record.address = Address(row["address"])
+            yield record
+
+
+def _parse_birthday(text: str) -> date | None:
+    # Те саме, що strptime(text, "%d.%m.%Y"), але в кілька разів швидше
+    try:
+        day, month, year = text.split(".")
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def import_contacts(book: AddressBook, f: IO[str], fmt: str) -> ImportReport:
+    """Імпортує контакти з файла f у форматі fmt, повертає підсумок"""
+    report = ImportReport()
+    records = contact_records(CONTACT_READERS[fmt](f), report)
+    report.imported = book.import_records(records, CHUNK_SIZE)
+    return report
+
+
+# Вивантаження контактів
+
+
+def contact_row(record: Record) -> Row:
+    """Перетворює запис Record на рядок для вивантаження"""
+    return {
+        "name": record.name.value,
+        "phones": [phone.value for phone in record.phones.values()],
+        "email": record.email.value if record.email else None,
+        "birthday": str(record.birthday) if record.birthday else None,
+        "address": record.address.value if record.address else None,
+    }
+
+
+def write_contacts_csv(rows: Iterable[Row], f: IO[str]):
+    writer = csv.DictWriter(f, CONTACT_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        row["phones"] = ";".join(f"{phone}:{info}" if info else phone for phone, info in row["phones"])
+        writer.writerow(row)
+
+
+def write_contacts_jsonl(rows: Iterable[Row], f: IO[str]):
+    for row in rows:
+        row["phones"] = [{"phone": phone, "info": info} for phone, info in row["phones"]]
+        f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace(";", "\\;").replace("\n", "\\n")
+
+
+def write_contacts_vcard(rows: Iterable[Row], f: IO[str]):
+    for row in rows:
+        lines = ["BEGIN:VCARD", "VERSION:3.0", f"FN:{_escape(row['name'])}", f"N:{_escape(row['name'])};;;;"]
+        for phone, info in row["phones"]:
+            lines.append(f"TEL;TYPE={_escape(info)}:{phone}" if info else f"TEL:{phone}")
+        if row["email"]:
+            lines.append(f"EMAIL:{row['email']}")
+        if row["birthday"]:
+            birthday = datetime.strptime(row["birthday"], "%d.%m.%Y")
+            lines.append(f"BDAY:{birthday.strftime('%Y-%m-%d')}")
+        if row["address"]:
+            lines.append(f"ADR:;;{_escape(row['address'])};;;;")
+        lines.append("END:VCARD")
+        f.write("\r\n".join(lines) + "\r\n")
+
+
+CONTACT_WRITERS = {
+    "csv": write_contacts_csv,
+    "vcard": write_contacts_vcard,
+    "jsonl": write_contacts_jsonl,
+}
+
+
+def export_contacts(book: AddressBook, f: IO[str], fmt: str) -> int:
+    """Вивантажує всі контакти у файл f у форматі fmt, повертає їх кількість"""
+    count = 0
+
+    def rows():
+        nonlocal count
+        for record in book.values():
+            count += 1
+            yield contact_row(record)
+
+    CONTACT_WRITERS[fmt](rows(), f)
+    return count
+
+
+# Нотатки: CSV та JSON Lines
+
+
+def _parse_time(value) -> datetime | None:
+    return datetime.fromisoformat(value) if value else None
+
+
+def read_notes_csv(f: IO[str]) -> Iterator[Tuple[int, Row]]:
+    """Читає нотатки з CSV з колонками title, text, tags, created, modified"""
+    reader = csv.DictReader(f)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_notes_jsonl(f: IO[str]) -> Iterator[Tuple[int, Row]]:
+    """Читає нотатки з JSON Lines, теги -- список рядків"""
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            if isinstance(row.get("tags"), list):
+                row["tags"] = ",".join(row["tags"])
+        except (ValueError, AttributeError) as ex:
+            row = {"error": f"Invalid JSON: {ex}"}
+        yield number, row
+
+
+NOTE_READERS = {"csv": read_notes_csv, "jsonl": read_notes_jsonl}
+
+
+def note_records(rows: Iterable[Tuple[int, Row]], report: ImportReport) -> Iterator[NoteRecord]:
+    """Перетворює рядки на записи NoteRecord, відхилені рядки потрапляють у report"""
+    for number, row in rows:
+        if "error" in row:
+            report.reject(number, row["error"])
+            continue
+        if not row.get("text"):
+            report.reject(number, "Empty note text")
+            continue
+        try:
+            record = NoteRecord(row.get("title") or None, row["text"], row.get("tags") or None)
+            created = _parse_time(row.get("created"))
+            if created is not None:
+                record.date_created = created
+                record.date_modified = _parse_time(row.get("modified")) or created
+        except (ValueError, TypeError) as ex:
+            report.reject(number, str(ex))
+            continue
+        yield record
+
+
+def import_notes(notes_book: NotesBook, f: IO[str], fmt: str) -> ImportReport:
+    """Імпортує нотатки з файла f у форматі fmt (нові id), повертає підсумок"""
+    if fmt not in NOTE_READERS:
+        raise ValueError("Notes can be imported from csv or jsonl only")
+    report = ImportReport()
+    records = note_records(NOTE_READERS[fmt](f), report)
+    report.imported = notes_book.import_notes(records, CHUNK_SIZE)
+    return report
+
+
+def note_row(record: NoteRecord) -> Row:
+    """Перетворює нотатку на рядок для вивантаження"""
+    return {
+        "id": record.id,
+        "title": record.title.value,
+        "text": record.text.value,
+        "tags": list(record.tags),
+        "created": record.date_created.isoformat(),
+        "modified": record.date_modified.isoformat(),
+    }
+
+
+def export_notes(notes_book: NotesBook, f: IO[str], fmt: str) -> int:
+    """Вивантажує всі нотатки у файл f у форматі fmt, повертає їх кількість"""
+    if fmt not in NOTE_READERS:
+        raise ValueError("Notes can be exported to csv or jsonl only")
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(f, NOTE_FIELDS)
+        writer.writeheader()
+    for record in notes_book.values():
+        row = note_row(record)
+        if fmt == "csv":
+            row["tags"] = ",".join(row["tags"])
+            writer.writerow(row)
+        else:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        count += 1
+    return count
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import pytest
+
+from lotus_bot.backup import BackupStore
+from lotus_bot.compression import get_codec
+from lotus_bot.contacts import Record
+from lotus_bot.notes import NoteRecord
+
+
+def make_sections(count: int):
+    contacts = {}
+    for i in range(count):
+        record = Record(f"Person{i}")
+        record.add_phone(f"+38050{i:07d}", "")
+        contacts[f"person{i}"] = record
+    notes = {}
+    for i in range(1, count + 1):
+        note = NoteRecord(f"title {i}", f"text {i}", "work,home")
+        note.id = i
+        notes[i] = note
+    return {"contacts": contacts, "notes": notes}
+
+
+def summary(sections):
+    return {
+        "contacts": {key: (str(record.name), list(record.phones.data)) for key, record in sections["contacts"].items()},
+        "notes": {key: (str(note.title), str(note.text), list(note.tags), note._created) for key, note in sections["notes"].items()},
+    }
+
+
+@pytest.mark.parametrize("codec", [None, "zlib"])
+def test_backup_restore_round_trip(tmp_path, codec):
+    store = BackupStore(tmp_path, get_codec(codec) if codec else None, average=8)
+    sections = make_sections(200)
+    report = store.backup(sections)
+    assert report.records == {"contacts": 200, "notes": 200}
+    assert report.new_chunks == report.chunks
+
+    name, restored = store.restore()
+    assert name == report.name
+    assert summary(restored) == summary(sections)
+
+
+def test_incremental_backup_and_older_restore(tmp_path):
+    store = BackupStore(tmp_path, average=8)
+    sections = make_sections(200)
+    first = store.backup(sections)
+    before = summary(sections)
+
+    sections["contacts"]["person7"].add_phone("+380509999999", "work")
+    del sections["notes"][3]
+    second = store.backup(sections)
+    # Записуються лише частини зі зміненими записами та індекс
+    assert 0 < second.new_chunks < second.chunks
+
+    assert summary(store.restore()[1]) == summary(sections)
+    assert summary(store.restore(first.name)[1]) == before
+    assert [name for name, _ in store.snapshots()] == [first.name, second.name]
+
+
+def test_corrupted_chunk_is_detected(tmp_path):
+    store = BackupStore(tmp_path, average=8)
+    store.backup(make_sections(20))
+    chunk = next(path for path in store.chunks_path.rglob("*") if path.is_file())
+    chunk.write_bytes(chunk.read_bytes()[:-1] + b"x")
+    with pytest.raises(ValueError):
+        store.restore()
+
+
+def test_unknown_backup(tmp_path):
+    store = BackupStore(tmp_path)
+    with pytest.raises(ValueError):
+        store.restore()
+    store.backup(make_sections(1))
+    with pytest.raises(ValueError):
+        store.restore("19000101")
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import pytest
+
+from lotus_bot import transfer
+from lotus_bot.contacts import AddressBook
+from lotus_bot.storage import open_storage
+
+ENGINES = ["pickle", "columnar", "sqlite"]
+
+
+def write_contacts(path, count: int, broken_after: int | None = None):
+    lines = [f"Person{i},+38050{i:07d},,,\n".encode() for i in range(count)]
+    if broken_after is not None:
+        # Байт, що не декодується з UTF-8, посеред файла
+        lines.insert(broken_after, b"Broken\xff,,,,\n")
+    path.write_bytes(b"name,phones,email,birthday,address\n" + b"".join(lines))
+
+
+def import_file(storage, path):
+    book = AddressBook(storage.dictionary["contacts"])
+    with open(path, encoding="utf-8", newline="") as f, storage.atomic():
+        report = transfer.import_contacts(book, f, "csv")
+        storage.persist()
+    return report
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_failed_import_leaves_nothing(tmp_path, engine):
+    path = tmp_path / "contacts.csv"
+    # Більше за CHUNK_SIZE рядків, тож частину пачок уже записано до помилки
+    write_contacts(path, transfer.CHUNK_SIZE * 3, broken_after=transfer.CHUNK_SIZE * 2)
+    storage = open_storage(tmp_path, engine)
+    storage.load()
+    with pytest.raises(UnicodeDecodeError):
+        import_file(storage, path)
+    assert len(storage.dictionary["contacts"]) == 0
+    storage.close()
+
+    reopened = open_storage(tmp_path, engine)
+    assert len(reopened.load()["contacts"]) == 0
+    reopened.close()
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_import_is_persisted(tmp_path, engine):
+    path = tmp_path / "contacts.csv"
+    write_contacts(path, 10)
+    storage = open_storage(tmp_path, engine)
+    storage.load()
+    assert import_file(storage, path).imported == 10
+    storage.close()
+
+    reopened = open_storage(tmp_path, engine)
+    contacts = reopened.load()["contacts"]
+    assert sorted(contacts) == sorted(f"person{i}" for i in range(10))
+    reopened.close()
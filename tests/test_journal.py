@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from lotus_bot.storage import Journal
+from lotus_bot.storage import PickleStorage
+
+
+def test_replay_applies_frames_in_order(tmp_path):
+    journal = Journal(tmp_path / "lotus.journal")
+    journal.start(1)
+    journal.append_many([("contacts", "ann", 1), ("contacts", "bob", 2), ("contacts", "ann", None), ("notes", 1, "n")])
+    dictionary = {"contacts": {"ann": 0}}
+    assert journal.replay(dictionary) == 4
+    assert dictionary == {"contacts": {"bob": 2}, "notes": {1: "n"}}
+    assert journal.generation() == 1
+
+
+def test_truncated_frame_is_dropped_and_repaired(tmp_path):
+    journal = Journal(tmp_path / "lotus.journal")
+    journal.start(1)
+    journal.append_many([("contacts", "ann", "a" * 100)])
+    end = journal.size()
+    journal.append_many([("contacts", "bob", "b" * 100)])
+    # Обірваний останній кадр, як після збою посеред допису
+    with open(journal.path, "r+b") as f:
+        f.truncate(journal.size() - 10)
+
+    frames, offset = journal.read()
+    assert frames == [("contacts", "ann", "a" * 100)]
+    assert offset == end
+    journal.repair(offset)
+    assert journal.size() == end
+
+    # Нові кадри дописуються одразу за останнім цілим
+    journal.append("contacts", "cid", "c")
+    assert journal.read()[0] == [("contacts", "ann", "a" * 100), ("contacts", "cid", "c")]
+
+
+def test_storage_replays_and_repairs_journal(tmp_path):
+    storage = PickleStorage(tmp_path / "lotus.pickle")
+    dictionary = storage.load()
+    for key in ("ann", "bob"):
+        dictionary["contacts"][key] = key.upper()
+        storage.commit("contacts", key)
+    del dictionary["contacts"]["ann"]
+    storage.commit("contacts", "ann")
+    dictionary["contacts"]["cid"] = "CID"
+    storage.commit("contacts", "cid")
+    storage.journal.sync()
+    with open(storage.journal.path, "r+b") as f:
+        f.truncate(storage.journal.size() - 3)
+
+    reopened = PickleStorage(tmp_path / "lotus.pickle")
+    assert reopened.load()["contacts"] == {"bob": "BOB"}
+    reopened.dictionary["notes"][1] = "note"
+    reopened.commit("notes", 1)
+    reopened.close()
+
+    assert PickleStorage(tmp_path / "lotus.pickle").load() == {"contacts": {"bob": "BOB"}, "notes": {1: "note"}}
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import threading
+
+from lotus_bot.locking import FileLock
+from lotus_bot.locking import LOCK_NAME
+
+
+def other_acquires(lock: FileLock) -> bool:
+    """Чи вдається захопити замок без очікування з іншого потоку"""
+    result = []
+
+    def attempt():
+        acquired = lock.acquire(blocking=False)
+        if acquired:
+            lock.release()
+        result.append(acquired)
+
+    thread = threading.Thread(target=attempt)
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_reentrant_in_same_thread(tmp_path):
+    lock = FileLock(tmp_path / LOCK_NAME)
+    with lock:
+        with lock:
+            assert lock.acquire(blocking=False)
+            lock.release()
+        # Внутрішній release не відпускає файл
+        assert not other_acquires(lock)
+        assert not FileLock(tmp_path / LOCK_NAME).acquire(blocking=False)
+    assert other_acquires(lock)
+
+
+def test_released_for_other_lock_on_same_file(tmp_path):
+    first = FileLock(tmp_path / LOCK_NAME)
+    second = FileLock(tmp_path / LOCK_NAME)
+    assert first.acquire()
+    assert not second.acquire(blocking=False)
+    first.release()
+    assert second.acquire(blocking=False)
+    assert not first.acquire(blocking=False)
+    second.release()
+
+
+def test_waiting_thread_gets_lock_after_release(tmp_path):
+    lock = FileLock(tmp_path / LOCK_NAME)
+    acquired = threading.Event()
+
+    def wait():
+        with lock:
+            acquired.set()
+
+    lock.acquire()
+    thread = threading.Thread(target=wait)
+    thread.start()
+    assert not acquired.wait(0.1)
+    lock.release()
+    thread.join(5)
+    assert acquired.is_set()
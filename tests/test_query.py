@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import pytest
+
+from lotus_bot.contacts import Address
+from lotus_bot.contacts import AddressBook
+from lotus_bot.contacts import Record
+from lotus_bot.query import describe
+from lotus_bot.query import parse_query
+from lotus_bot.query import plan_query
+
+
+@pytest.fixture
+def book() -> AddressBook:
+    book = AddressBook({})
+    for name, phone, address in [
+        ("Straße", "+380501112233", "Berlin"),
+        ("Ivan Petrenko", "+380501112234", "Kyiv"),
+        ("Ivanna", "+380501112235", None),
+        ("Petro", "+380501112236", "Lviv"),
+    ]:
+        record = Record(name)
+        record.add_phone(phone, "")
+        if address:
+            record.address = Address(address)
+        book.add_record(name, record)
+    return book
+
+
+def names(book: AddressBook, query: str) -> list:
+    return [record.name.value for record in plan_query(query, book).records()]
+
+
+def test_parse_precedence():
+    assert describe(parse_query("name^iv address~kyiv | has:email")) == "(name^iv AND address~kyiv) OR has:email"
+    assert describe(parse_query("!(name^iv | name^petr) has:phone")) == "NOT (name^iv OR name^petr) AND has:phone"
+    assert describe(parse_query("name:'Ivan Petrenko'")) == 'name="Ivan Petrenko"'
+    assert parse_query("   ") is None
+
+
+@pytest.mark.parametrize("query", ["name^", "(name^iv", "name^iv)", "nickname=x", "birthday~may", "has:fax", "iv"])
+def test_parse_errors(query):
+    with pytest.raises(ValueError):
+        parse_query(query)
+
+
+def test_index_and_scan_agree(book):
+    # name^ через індекс імен і той самий префікс у переборі (через "|" з умовою без індексу)
+    for prefix in ["strass", "straß", "STRA", "iv", "IVAN "]:
+        indexed = names(book, f"name^'{prefix}'")
+        scanned = names(book, f"name^'{prefix}' | address~nowhere")
+        assert indexed == scanned, prefix
+    assert names(book, "name=STRAßE") == names(book, "name=STRAßE | address~nowhere") == ["Straße"]
+
+
+def test_plan_uses_index(book):
+    plan = plan_query("name^iv address~kyiv", book)
+    assert plan.driver is not None
+    assert [record.name.value for record in plan.records()] == ["Ivan Petrenko"]
+    assert plan.checked == 2
+    assert names(book, "phone=+380501112236") == ["Petro"]
+    assert names(book, "!has:address") == ["Ivanna"]
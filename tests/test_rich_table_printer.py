@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import random
+from datetime import date
+
+import pytest
+
+from lotus_bot.ordering import sort_key
+from lotus_bot.rich_table_printer import select_rows
+
+COLUMNS = [{"name": "Id"}, {"name": "Name"}, {"name": "Birthday"}]
+
+
+def make_rows(count: int):
+    rng = random.Random(count)
+    names = ["anna", "Bob", "", "zoe", "Ірина", "ada"]
+    return [
+        [i, rng.choice(names), date(1990, rng.randint(1, 12), rng.randint(1, 28)) if i % 3 else None]
+        for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize("sort_by, index", [("Id", 0), ("name", 1), ("BIRTHDAY", 2)])
+@pytest.mark.parametrize("reverse", [False, True])
+@pytest.mark.parametrize("offset, limit", [(0, 5), (7, 10), (95, 10), (200, 5), (3, 0), (4, None)])
+def test_select_rows_top_k_with_offset(sort_by, index, reverse, offset, limit):
+    rows = make_rows(100)
+    expected = sorted(rows, key=lambda row: sort_key(row[index]), reverse=reverse)
+    end = None if limit is None else offset + limit
+    result = list(select_rows(COLUMNS, iter(rows), sort_by, reverse, limit, offset))
+    assert result == expected[offset:end]
+
+
+def test_select_rows_without_sort_is_lazy():
+    consumed = []
+
+    def rows():
+        for i in range(1000):
+            consumed.append(i)
+            yield [i, f"name {i}", None]
+
+    result = list(select_rows(COLUMNS, rows(), limit=3, offset=5))
+    assert [row[0] for row in result] == [5, 6, 7]
+    assert len(consumed) == 8
+
+
+def test_select_rows_unknown_column():
+    with pytest.raises(ValueError):
+        select_rows(COLUMNS, iter(make_rows(3)), "phone", limit=1)
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import pytest
+
+from lotus_bot.notes import NoteRecord
+from lotus_bot.notes import NotesBook
+from lotus_bot.notes import parse_tag_query
+
+
+@pytest.fixture
+def notes_book() -> NotesBook:
+    book = NotesBook({})
+    for tags in ["work,home", "work,draft", "home", "r&d", "a|b", "o'brien,work", "rock'n'roll", '5" disk']:
+        book.add_note(NoteRecord("title", "text", tags))
+    return book
+
+
+def ids(notes) -> list:
+    return [note.id for note in notes]
+
+
+def test_parse_precedence():
+    assert parse_tag_query("a,b|c") == ("or", [("and", [("tag", "a"), ("tag", "b")]), ("tag", "c")])
+    assert parse_tag_query("!a & (b | c)") == ("and", [("not", ("tag", "a")), ("or", [("tag", "b"), ("tag", "c")])])
+    assert parse_tag_query("  ") is None
+
+
+def test_parse_quoted_tags():
+    assert parse_tag_query('"r&d" | work') == ("or", [("tag", "r&d"), ("tag", "work")])
+    assert parse_tag_query("'a|b'") == ("tag", "a|b")
+
+
+def test_parse_quotes_inside_tags():
+    assert parse_tag_query("o'brien") == ("tag", "o'brien")
+    assert parse_tag_query("work|o'brien") == ("or", [("tag", "work"), ("tag", "o'brien")])
+    assert parse_tag_query('5" disk') == ("tag", '5" disk')
+    assert parse_tag_query("'unbalanced") == ("tag", "'unbalanced")
+    assert parse_tag_query("'a'b") == ("tag", "'a'b")
+
+
+@pytest.mark.parametrize("query", ["(a", "a)", "a,,b", "!", "a |"])
+def test_parse_errors(query):
+    with pytest.raises(ValueError):
+        parse_tag_query(query)
+
+
+def test_search_expressions(notes_book):
+    assert ids(notes_book.search_by_tags("work,home")) == [1]
+    assert ids(notes_book.search_by_tags("work,!draft")) == [1, 6]
+    assert ids(notes_book.search_by_tags("(home|draft),work")) == [1, 2]
+
+
+def test_search_tags_with_operators(notes_book):
+    assert ids(notes_book.search_by_tags("r&d")) == [4]
+    assert ids(notes_book.search_by_tags("a|b")) == [5]
+    assert ids(notes_book.search_by_tags('"r&d" | home')) == [1, 3, 4]
+
+
+def test_search_tags_with_quotes(notes_book):
+    assert ids(notes_book.search_by_tags("o'brien")) == [6]
+    assert ids(notes_book.search_by_tags("o'brien,work")) == [6]
+    assert ids(notes_book.search_by_tags("work|o'brien")) == [1, 2, 6]
+    assert ids(notes_book.search_by_tags("rock'n'roll")) == [7]
+    assert ids(notes_book.search_by_tags('5" disk')) == [8]